@@ -0,0 +1,63 @@
+# app/adaptive.py
+# Tự chỉnh stride (bỏ bớt frame giữa 2 lần nhận diện) và downscale theo độ trễ đo được,
+# thay cho các hằng số cố định chỉ đúng với 1 máy.
+import threading, time
+
+class AdaptiveController:
+    """
+    Mục tiêu: nhận diện ~`target_hz` lần/giây nhưng không dùng quá `cpu_budget` (tỉ lệ thời gian
+    của 1 core dành cho detect+encode, 0..1).
+      - latency vượt ngân sách (cpu_budget / target_hz): giảm downscale (ảnh nhỏ hơn -> nhanh hơn)
+      - latency dưới 1/2 ngân sách: tăng downscale (nhận mặt ở xa tốt hơn)
+      - stride = số frame camera giữa 2 lần nhận diện, tính từ FPS camera và tần suất cho phép
+    Đọc cấu hình hiện tại qua .downscale / .stride; record() gọi mỗi khi có 1 kết quả nhận diện.
+    """
+    def __init__(self, target_hz=5.0, cpu_budget=0.5, downscale=0.40,
+                 min_scale=0.25, max_scale=0.60, step=0.05, max_stride=15, adjust_every=10):
+        self.target_hz = target_hz
+        self.cpu_budget = cpu_budget
+        self.downscale = downscale
+        self.min_scale = min_scale
+        self.max_scale = max_scale
+        self.step = step
+        self.max_stride = max_stride
+        self.adjust_every = adjust_every
+        self.stride = 1
+        self.latency_ms = 0.0     # EMA
+        self.rec_hz = 0.0
+        self.cam_fps = 0.0
+        self._lock = threading.Lock()
+        self._n = 0
+        self._t_window = time.perf_counter()
+
+    def record(self, latency_s, cam_fps=0.0):
+        with self._lock:
+            ms = latency_s * 1000.0
+            self.latency_ms = ms if self.latency_ms == 0 else 0.8 * self.latency_ms + 0.2 * ms
+            if cam_fps:
+                self.cam_fps = cam_fps
+            self._n += 1
+            if self._n < self.adjust_every:
+                return
+            now = time.perf_counter()
+            self.rec_hz = self._n / max(now - self._t_window, 1e-6)
+            self._n, self._t_window = 0, now
+            self._adjust()
+
+    def _adjust(self):
+        budget_ms = 1000.0 * self.cpu_budget / self.target_hz
+        old = (self.downscale, self.stride)
+        if self.latency_ms > budget_ms and self.downscale > self.min_scale:
+            self.downscale = round(max(self.min_scale, self.downscale - self.step), 2)
+        elif self.latency_ms < 0.5 * budget_ms and self.downscale < self.max_scale:
+            self.downscale = round(min(self.max_scale, self.downscale + self.step), 2)
+        # tần suất tối đa mà vẫn trong ngân sách CPU, không vượt target
+        allowed_hz = min(self.target_hz, 1000.0 * self.cpu_budget / max(self.latency_ms, 1e-3))
+        if self.cam_fps > 0:
+            self.stride = int(min(self.max_stride, max(1, round(self.cam_fps / allowed_hz))))
+        if (self.downscale, self.stride) != old:
+            print(f"[adaptive] {self.status()}")
+
+    def status(self) -> str:
+        return (f"cam {self.cam_fps:.0f}fps | rec {self.rec_hz:.1f}Hz {self.latency_ms:.0f}ms | "
+                f"scale {self.downscale:.2f} | stride {self.stride}")
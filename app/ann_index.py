@@ -0,0 +1,182 @@
+# app/ann_index.py
+# Index tìm láng giềng gần đúng (ANN) thuần NumPy cho gallery lớn (hàng chục nghìn mặt).
+#   - BruteForceIndex: so toàn bộ (chuẩn để đo recall)
+#   - IVFIndex: k-means chia gallery thành nlist cụm, mỗi truy vấn chỉ quét nprobe cụm gần nhất
+import os, time
+from pathlib import Path
+import numpy as np
+
+from app.config import ANN_INDEX_NPZ
+
+def sq_l2(q, x, x_sq):
+    """Bình phương khoảng cách L2 (M,N) giữa q (M,D) và x (N,D), x_sq = ||x||^2 tính sẵn."""
+    q_sq = np.einsum("ij,ij->i", q, q)
+    d2 = q @ x.T
+    d2 *= -2.0
+    d2 += q_sq[:, None]
+    d2 += x_sq[None, :]
+    np.maximum(d2, 0.0, out=d2)
+    return d2
+
+def _topk(d2_row, k):
+    k = min(k, len(d2_row))
+    if k == 0:
+        return np.empty((0,), dtype=np.int64)
+    part = np.argpartition(d2_row, k - 1)[:k]
+    return part[np.argsort(d2_row[part])]
+
+def fingerprint(embs) -> float:
+    """Dấu vân tay rẻ của gallery để phát hiện index cũ lệch với kho embeddings."""
+    return float(np.asarray(embs, dtype=np.float64).sum()) if len(embs) else 0.0
+
+class BruteForceIndex:
+    kind = "brute"
+
+    def __init__(self):
+        self.data = np.empty((0, 128), dtype=np.float32)
+        self.sq = np.empty((0,), dtype=np.float32)
+
+    def add(self, embs):
+        self.data = np.ascontiguousarray(np.asarray(embs, dtype=np.float32).reshape(-1, 128))
+        self.sq = np.einsum("ij,ij->i", self.data, self.data)
+        return self
+
+    def __len__(self):
+        return len(self.data)
+
+    def search(self, q, k=1):
+        """Trả về (idx (M,k), d2 (M,k)) — idx là chỉ số dòng trong gallery gốc."""
+        q = np.asarray(q, dtype=np.float32).reshape(-1, 128)
+        d2 = sq_l2(q, self.data, self.sq)
+        idx = np.stack([_topk(r, k) for r in d2]) if len(q) else np.empty((0, k), dtype=np.int64)
+        return idx, np.take_along_axis(d2, idx, axis=1)
+
+class IVFIndex:
+    """
+    Inverted-file index: nlist tâm cụm (k-means), các dòng gallery được xếp liền nhau theo cụm.
+    nprobe càng lớn thì recall càng cao nhưng chậm hơn; nprobe = nlist tương đương brute force.
+    """
+    kind = "ivf"
+
+    def __init__(self, nlist=64, nprobe=8):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.centroids = np.empty((0, 128), dtype=np.float32)
+        self.perm = np.empty((0,), dtype=np.int64)      # vị trí trong index -> dòng gốc
+        self.offsets = np.zeros((1,), dtype=np.int64)   # cụm j nằm ở [offsets[j], offsets[j+1])
+        self.data = np.empty((0, 128), dtype=np.float32)
+        self.sq = np.empty((0,), dtype=np.float32)
+
+    def __len__(self):
+        return len(self.data)
+
+    def _kmeans(self, x, iters, seed):
+        rng = np.random.default_rng(seed)
+        k = min(self.nlist, len(x))
+        cents = x[rng.choice(len(x), k, replace=False)].copy()
+        for _ in range(iters):
+            assign = np.argmin(sq_l2(x, cents, np.einsum("ij,ij->i", cents, cents)), axis=1)
+            counts = np.bincount(assign, minlength=k)
+            sums = np.zeros_like(cents)
+            np.add.at(sums, assign, x)
+            empty = counts == 0
+            cents[~empty] = sums[~empty] / counts[~empty, None]
+            if empty.any():   # cụm rỗng -> gieo lại bằng điểm ngẫu nhiên
+                cents[empty] = x[rng.choice(len(x), int(empty.sum()), replace=False)]
+        return cents
+
+    def train_add(self, embs, iters=15, seed=0, sample=20000):
+        x = np.ascontiguousarray(np.asarray(embs, dtype=np.float32).reshape(-1, 128))
+        if len(x) == 0:
+            return self
+        rng = np.random.default_rng(seed)
+        train = x if len(x) <= sample else x[rng.choice(len(x), sample, replace=False)]
+        self.centroids = self._kmeans(train, iters, seed)
+        c_sq = np.einsum("ij,ij->i", self.centroids, self.centroids)
+        assign = np.empty(len(x), dtype=np.int64)
+        for s in range(0, len(x), 4096):   # gán theo lô để không tạo ma trận N×nlist quá lớn
+            assign[s:s + 4096] = np.argmin(sq_l2(x[s:s + 4096], self.centroids, c_sq), axis=1)
+        self.perm = np.argsort(assign, kind="stable")
+        self.offsets = np.searchsorted(assign[self.perm], np.arange(len(self.centroids) + 1))
+        self.data = np.ascontiguousarray(x[self.perm])
+        self.sq = np.einsum("ij,ij->i", self.data, self.data)
+        return self
+
+    def search(self, q, k=1):
+        q = np.asarray(q, dtype=np.float32).reshape(-1, 128)
+        out_idx = np.full((len(q), k), -1, dtype=np.int64)
+        out_d2 = np.full((len(q), k), np.inf, dtype=np.float32)
+        if len(self.data) == 0:
+            return out_idx, out_d2
+        nprobe = min(self.nprobe, len(self.centroids))
+        cd = sq_l2(q, self.centroids, np.einsum("ij,ij->i", self.centroids, self.centroids))
+        probes = np.argpartition(cd, nprobe - 1, axis=1)[:, :nprobe]
+        for i in range(len(q)):
+            rows = np.concatenate([np.arange(self.offsets[c], self.offsets[c + 1]) for c in probes[i]])
+            if len(rows) == 0:
+                continue
+            d2 = sq_l2(q[i:i + 1], self.data[rows], self.sq[rows])[0]
+            top = _topk(d2, k)
+            out_idx[i, :len(top)] = self.perm[rows[top]]
+            out_d2[i, :len(top)] = d2[top]
+        return out_idx, out_d2
+
+def save_index(index, embs, path: Path = ANN_INDEX_NPZ, nlist_req=None):
+    """
+    Lưu IVF (brute force không cần lưu). Kèm số dòng + fingerprint của gallery.
+    nlist_req: nlist người dùng yêu cầu (0 = tự chọn ~sqrt(N)) -> lần encode sau dựng lại đúng kiểu.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        np.savez(f, kind=index.kind, nlist=index.nlist, nprobe=index.nprobe,
+                 nlist_req=index.nlist if nlist_req is None else nlist_req,
+                 centroids=index.centroids, perm=index.perm, offsets=index.offsets,
+                 count=len(embs), fp=fingerprint(embs))
+    os.replace(tmp, path)
+
+def index_settings(path: Path = ANN_INDEX_NPZ):
+    """(nlist yêu cầu, nprobe) của index đã lưu, hoặc None nếu chưa có."""
+    if not path.exists():
+        return None
+    with np.load(path) as z:
+        nlist_req = int(z["nlist_req"]) if "nlist_req" in z.files else int(z["nlist"])
+        return nlist_req, int(z["nprobe"])
+
+def load_index(embs, path: Path = ANN_INDEX_NPZ, nprobe=None):
+    """Nạp IVF cho gallery `embs` (dữ liệu lấy lại từ embs). Lệch/không có -> None."""
+    if not path.exists():
+        return None
+    with np.load(path) as z:
+        if int(z["count"]) != len(embs) or not np.isclose(float(z["fp"]), fingerprint(embs)):
+            return None
+        idx = IVFIndex(int(z["nlist"]), int(nprobe or z["nprobe"]))
+        idx.centroids = z["centroids"].astype(np.float32)
+        idx.perm = z["perm"].astype(np.int64)
+        idx.offsets = z["offsets"].astype(np.int64)
+    x = np.asarray(embs, dtype=np.float32)
+    idx.data = np.ascontiguousarray(x[idx.perm])
+    idx.sq = np.einsum("ij,ij->i", idx.data, idx.data)
+    return idx
+
+def benchmark(index, embs, n_queries=500, noise=0.02, seed=0):
+    """
+    So `index` với brute force: recall@1 (cùng dòng gần nhất) và độ trễ trung bình / truy vấn.
+    Truy vấn = dòng gallery ngẫu nhiên + nhiễu nhỏ (mô phỏng ảnh mới của người đã đăng ký).
+    """
+    embs = np.asarray(embs, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    n = min(n_queries, len(embs))
+    if n == 0:
+        return {"recall@1": 0.0, "ms_index": 0.0, "ms_brute": 0.0, "queries": 0}
+    q = embs[rng.choice(len(embs), n, replace=False)] + rng.normal(0, noise, (n, 128)).astype(np.float32)
+    brute = BruteForceIndex().add(embs)
+
+    def _timed(ix):
+        t0 = time.perf_counter()
+        res = [ix.search(q[i:i + 1], 1)[0][0, 0] for i in range(n)]
+        return np.array(res), (time.perf_counter() - t0) * 1000.0 / n
+
+    gt, ms_b = _timed(brute)
+    got, ms_i = _timed(index)
+    return {"recall@1": float(np.mean(gt == got)), "ms_index": ms_i, "ms_brute": ms_b, "queries": n}
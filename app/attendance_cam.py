@@ -2,24 +2,34 @@
 # Quét tự động + hiện thông tin nhân viên (tên, mã, phòng ban, chức vụ)
 # Hiển thị "Done" 4s khi chấm thành công, vẽ khung xanh. Có callback on_success để UI cập nhật.
 
-import time
-from datetime import datetime, date, time as dtime
+import time, queue
+from datetime import datetime, time as dtime
 import cv2
-import numpy as np
-import face_recognition
 
-from app.db import DB
-from app.encoding_loaded import load_all_encodings
+from app.gallery import GalleryHolder
+from app.pipeline import FrameGrabber, RecognitionWorker
+from app.event_journal import JournalWriter
+from app.tracker import IoUTracker
+from app.adaptive import AdaptiveController
+from app.motion import MotionGate
+from app.detectors import face_locations, face_encodings
+from app.recog_client import RecognitionClient, get_client
 from app.config import WORK_START_HOUR
 
 # Cấu hình nhẹ
 CAP_WIDTH    = 320
 CAP_HEIGHT   = 240
-FRAME_STRIDE = 4
-DOWNSCALE    = 0.40
+RECOG_WORKERS = 1          # số luồng nhận diện (camera + hiển thị chạy ở luồng riêng)
+DOWNSCALE    = 0.40        # giá trị khởi đầu; AdaptiveController tự chỉnh trong lúc chạy
+TARGET_REC_HZ = 5.0        # tần suất nhận diện mong muốn (lần/giây)
+CPU_BUDGET   = 0.5         # tỉ lệ 1 core dành cho detect+encode
 TOLERANCE    = 0.50
+MARGIN       = 0.04        # người gần nhất phải hơn người thứ 2 ít nhất chừng này
 COOLDOWN_S   = 5.0         # chống spam 1 người liên tiếp
 STATUS_MS    = 4000        # "Done" hiển thị 4 giây
+STATS_EVERY_S = 30.0       # in thống kê ghi DB mỗi 30 giây
+KEEPALIVE_S  = 5.0         # không có chuyển động: vẫn detect 1 lần mỗi 5 giây
+REVERIFY_S   = 3.0         # mặt đang được track: encode lại để xác minh sau mỗi 3 giây
 
 def _extract_id_from_label(label: str) -> str:
     parts = label.split("_")
@@ -43,56 +53,91 @@ def _compute_checkin_note(now_hms: str) -> str:
         return f"Muộn {h}h{p}p" if p else f"Muộn {h}h"
     return f"Muộn {late_min}p"
 
-def _fetch_emp_info(ma_nv: str):
-    if not ma_nv:
-        return None
+def _make_event(label: str, ma_nv: str, now: datetime = None):
+    """
+    Sự kiện chấm công ghi vào journal (app.event_journal) ngay lúc nhận ra người:
+      (ma_nv, ten_nv, ngay, giờ 'HH:MM:SS', ghi chú check-in)
+    IN/OUT được quyết định khi flusher đẩy lên MySQL (DB.record_attendance_batch) — giờ vẫn là giờ thật lúc quét.
+    `now`: thời điểm của frame (phát lại video); mặc định là giờ máy.
+    """
+    now = now or datetime.now()
+    hms = now.strftime("%H:%M:%S")
+    person_name = label.rsplit("_", 1)[0] if label else "Unknown"
+    return ma_nv, person_name, now.strftime("%Y-%m-%d"), hms, _compute_checkin_note(hms)
+
+def _open_camera(camera_index):
+    cap = cv2.VideoCapture(camera_index, cv2.CAP_DSHOW)
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH,  CAP_WIDTH)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, CAP_HEIGHT)
+    cap.set(cv2.CAP_PROP_FPS, 30)
+    try: cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    except: pass
     try:
-        return DB().get_employee(ma_nv)
+        fourcc = cv2.VideoWriter_fourcc(*"MJPG")
+        cap.set(cv2.CAP_PROP_FOURCC, fourcc)
     except Exception:
-        return None
+        pass
+    return cap
 
-def _auto_update_attendance(recogn_name: str, recogn_id: str):
+def _prepare_frame(frame):
+    if frame.shape[1] != CAP_WIDTH or frame.shape[0] != CAP_HEIGHT:
+        frame = cv2.resize(frame, (CAP_WIDTH, CAP_HEIGHT), interpolation=cv2.INTER_LINEAR)
+    return frame
+
+def _recognize(frame, matcher, tracker=None, downscale=DOWNSCALE, gate=None):
     """
-    Tự quyết định IN/OUT cho hôm nay. Trả về:
-      (action, record_dict)  với action in {"checkin","checkout","done","error"}
-    record_dict gồm: {ma_nv, ten_nv, ngay, check_in, check_out, total_seconds, note}
+    Chạy trong RecognitionWorker: detect + encode + so khớp TẤT CẢ khuôn mặt trong frame
+    (1 lần face_encodings cho cả lô + 1 lần tính khoảng cách cho cả lô).
+    Có `tracker`: mặt đã được track và còn hạn xác minh thì dùng lại danh tính, không encode.
+    Có `gate` (MotionGate): khung hình không đổi thì bỏ qua, trả về None (không tính latency).
+    `matcher` là RecognitionClient: detect + encode + identify trong 1 request /batch_identify
+    (service tự gom lô giữa các camera), không dùng tracker.
+    Trả về list (label, ma_nv, (l, t, r, b)) theo toạ độ frame gốc — chỉ các mặt khớp.
     """
-    db = DB()
-    today = date.today().strftime("%Y-%m-%d")
-    now   = datetime.now().strftime("%H:%M:%S")
-    try:
-        rows = db.q("SELECT * FROM chamcong WHERE ma_nv=%s AND ngay=%s LIMIT 1",
-                    (recogn_id, today))
-        if not rows:
-            note = _compute_checkin_note(now)
-            db.q("INSERT INTO chamcong (ma_nv, ten_nv, ngay, check_in, check_out, total_seconds, note) "
-                 "VALUES (%s,%s,%s,%s,%s,NULL,%s)",
-                 (recogn_id, recogn_name, today, now, None, note))
-            rec = db.q("SELECT ma_nv,ten_nv,ngay,check_in,check_out,total_seconds,note "
-                       "FROM chamcong WHERE ma_nv=%s AND ngay=%s LIMIT 1", (recogn_id, today))[0]
-            return "checkin", rec
-
-        row = rows[0]
-        if not row["check_in"]:
-            note = _compute_checkin_note(now)
-            db.q("UPDATE chamcong SET check_in=%s, note=%s WHERE id=%s", (now, note, row["id"]))
-        elif not row["check_out"]:
-            t1 = datetime.strptime(row["check_in"], "%H:%M:%S")
-            t2 = datetime.strptime(now, "%H:%M:%S")
-            total_seconds = max(0, int((t2 - t1).total_seconds()))
-            db.q("UPDATE chamcong SET check_out=%s, total_seconds=%s WHERE id=%s",
-                 (now, total_seconds, row["id"]))
-        # lấy record cập nhật
-        rec = db.q("SELECT ma_nv,ten_nv,ngay,check_in,check_out,total_seconds,note "
-                   "FROM chamcong WHERE id=%s", (row["id"],))[0]
-        action = "checkin" if rec["check_out"] is None and rec["check_in"] else ("checkout" if rec["check_out"] else "done")
-        return action, rec
-    except Exception:
-        return "error", None
+    if gate is not None and not gate.should_detect(frame):
+        return None
+    small = cv2.resize(frame, (0,0), fx=downscale, fy=downscale)
+    rgb_small = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+    if isinstance(matcher, RecognitionClient):
+        out = []
+        for box, label, _ in matcher.recognize(rgb_small, TOLERANCE, MARGIN):
+            if label:
+                t, r, b, l = (int(v / downscale) for v in box)
+                out.append((label, _extract_id_from_label(label), (l, t, r, b)))
+        return out
+    locations = face_locations(rgb_small, upsample=0)
+    if not locations:
+        return []
+    # box theo toạ độ frame gốc (t, r, b, l) — không đổi khi downscale thay đổi
+    full = [tuple(int(v / downscale) for v in loc) for loc in locations]
+
+    if tracker is not None:
+        tracks, need = tracker.update(full)
+    else:
+        tracks, need = None, list(range(len(locations)))
+
+    idents = {}
+    if need:
+        encs = face_encodings(rgb_small, [locations[i] for i in need])
+        for i, (label, _, _) in zip(need, matcher.identify(encs, TOLERANCE, MARGIN) if encs else []):
+            idents[i] = label
+            if tracks is not None:
+                tracker.set_identity(tracks[i], label, _extract_id_from_label(label) if label else "")
+
+    out = []
+    for i, (t, r, b, l) in enumerate(full):
+        label = idents[i] if i in idents else (tracks[i].label if tracks is not None else None)
+        if not label:
+            continue
+        out.append((label, _extract_id_from_label(label), (l, t, r, b)))
+    return out
 
 def run_manual_attendance(camera_index=0, on_success=None):
     """
     on_success: callable(record_dict) – gọi sau mỗi lần chấm thành công để UI refresh.
+    Camera đọc ở luồng riêng (chỉ giữ frame mới nhất), nhận diện ở RECOG_WORKERS luồng,
+    luồng chính chỉ vẽ + hiển thị nên preview luôn chạy theo FPS camera.
+    Mọi khuôn mặt trong frame đều được nhận diện; mỗi người có cooldown riêng (COOLDOWN_S).
     """
     try:
         cv2.setUseOptimized(True)
@@ -100,126 +145,151 @@ def run_manual_attendance(camera_index=0, on_success=None):
     except Exception:
         pass
 
-    known_encs, labels = load_all_encodings()
-    if known_encs is None or len(known_encs) == 0:
-        print("❌ Không có dữ liệu encodings.")
-        known_encs = np.zeros((0, 128), dtype=np.float32); labels = []
-
-    cap = cv2.VideoCapture(camera_index, cv2.CAP_DSHOW)
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH,  CAP_WIDTH)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, CAP_HEIGHT)
-    cap.set(cv2.CAP_PROP_FPS, 30)
-    try: cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
-    except: pass
-    try:
-        fourcc = cv2.VideoWriter_fourcc(*"MJPG")
-        cap.set(cv2.CAP_PROP_FOURCC, fourcc)
-    except Exception:
-        pass
+    # gallery tự nạp lại khi encode_sync ghi kho mới (thêm NV không cần tắt camera);
+    # dùng recog_service thì service giữ gallery, client có cùng hàm identify như FaceMatcher
+    client = get_client()
+    gallery = None if client else GalleryHolder().start_watch()
+    get_matcher = (lambda: client) if client else (lambda: gallery.matcher)
+    if gallery is not None and len(gallery) == 0:
+        print("❌ Không có dữ liệu encodings (sẽ tự nạp khi có).")
 
+    cap = _open_camera(camera_index)
     if not cap.isOpened():
         print("❌ Không mở được camera.")
         return
 
+    grabber = FrameGrabber(cap, prepare=_prepare_frame)
+    results = queue.Queue(maxsize=8)
+    tracker = None if client else IoUTracker(reverify_s=REVERIFY_S)   # service: 1 request / frame, không track
+    ctrl = AdaptiveController(target_hz=TARGET_REC_HZ, cpu_budget=CPU_BUDGET * max(1, RECOG_WORKERS),
+                              downscale=DOWNSCALE)
+    gate = MotionGate(keepalive_s=KEEPALIVE_S)
+    workers = [RecognitionWorker(grabber, lambda f: _recognize(f, get_matcher(), tracker, ctrl.downscale, gate),
+                                 results, controller=ctrl)
+               for _ in range(max(1, RECOG_WORKERS))]
+    writer = JournalWriter(_make_event)   # ghi journal ngay, flusher đẩy MySQL theo lô
+    grabber.start()
+    for w in workers:
+        w.start()
+    writer.start()
+
     print("➡ Auto Attendance — ESC để thoát. Lần 1 trong ngày = Check-in, lần 2 = Check-out.")
     frame_id = 0
     status_until = 0.0
-    last_box = None
+    last_boxes = {}   # {ma_nv: (box, thời điểm thấy)}
     cooldown = {}   # {ma_nv: last_time}
     last_emp_info = None
     last_label = None
+    next_stats = time.time() + STATS_EVERY_S
 
-    while True:
-        ret, frame = cap.read()
-        if not ret or frame is None:
-            continue
+    try:
+        while True:
+            frame_id, frame = grabber.wait_newer(frame_id, timeout=0.5)
+            if frame is None:
+                if (cv2.waitKey(1) & 0xFF) == 27:
+                    break
+                continue
+            frame = frame.copy()   # frame gốc có thể đang được worker đọc
 
-        frame_id += 1
-        if frame.shape[1] != CAP_WIDTH or frame.shape[0] != CAP_HEIGHT:
-            frame = cv2.resize(frame, (CAP_WIDTH, CAP_HEIGHT), interpolation=cv2.INTER_LINEAR)
-
-        found_label = None
-        found_id    = ""
-        found_loc   = None
-
-        if frame_id % FRAME_STRIDE == 0 and len(known_encs) > 0:
-            small = cv2.resize(frame, (0,0), fx=DOWNSCALE, fy=DOWNSCALE)
-            rgb_small = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
-            locations = face_recognition.face_locations(rgb_small, model="hog", number_of_times_to_upsample=0)
-            if locations:
-                encs = face_recognition.face_encodings(rgb_small, [locations[0]], num_jitters=1)
-                if encs:
-                    enc = encs[0]
-                    dists = np.linalg.norm(known_encs - enc, axis=1)
-                    idx = int(np.argmin(dists))
-                    if dists[idx] <= TOLERANCE:
-                        found_label = labels[idx]
-                        found_id = _extract_id_from_label(found_label)
-                        t, r, b, l = locations[0]
-                        t = int(t / DOWNSCALE); r = int(r / DOWNSCALE)
-                        b = int(b / DOWNSCALE); l = int(l / DOWNSCALE)
-                        found_loc = (l, t, r, b)
-                        last_box = found_loc
-
-        now_ts = time.time()
-        if found_id:
-            allow = (now_ts - cooldown.get(found_id, 0.0) >= COOLDOWN_S)
-            if allow:
-                person_name = found_label.rsplit("_", 1)[0] if found_label else "Unknown"
-                action, rec = _auto_update_attendance(person_name, found_id)
-                cooldown[found_id] = now_ts
+            # kết quả nhận diện mới (nếu có)
+            found = []
+            while True:
+                try:
+                    _, res, latency = results.get_nowait()
+                except queue.Empty:
+                    break
+                if res is None:
+                    continue   # bị MotionGate bỏ qua
+                ctrl.record(latency, grabber.fps)
+                found.extend(res)
 
-                # hiển thị Done + khung xanh 4s
-                status_until = now_ts + (STATUS_MS / 1000.0)
+            now_ts = time.time()
+            for found_label, found_id, found_loc in found:
+                last_boxes[found_id] = (found_loc, now_ts)
+                if not found_id:
+                    continue
+                allow = (now_ts - cooldown.get(found_id, 0.0) >= COOLDOWN_S)
+                if allow:
+                    cooldown[found_id] = now_ts
+                    writer.submit(found_label, found_id)   # không chặn camera khi DB chậm / mất kết nối
 
-                # load info nhân viên để overlay
-                last_emp_info = _fetch_emp_info(found_id)
-                last_label = found_label
+            # kết quả ghi DB từ luồng nền
+            for label, _, action, rec, emp in writer.poll():
+                if action == "error" or not rec:
+                    continue
+                # hiển thị Done + khung xanh 4s
+                status_until = time.time() + (STATUS_MS / 1000.0)
+                last_emp_info = emp
+                last_label = label
 
                 # callback -> UI cập nhật bảng hôm nay
-                if on_success and rec:
+                if on_success:
                     try:
                         on_success(rec)
                     except Exception:
                         pass
 
-        # ===== VẼ UI =====
-        if last_box:
-            l, t, r, b = last_box
-            color = (0, 255, 0) if (time.time() < status_until) else (255, 255, 255)
-            cv2.rectangle(frame, (l, t), (r, b), color, 2)
-
-        # header
-        cv2.rectangle(frame, (6, 6), (CAP_WIDTH - 6, 26), (0, 0, 0), -1)
-        cv2.putText(frame, "Auto Attendance — ESC to quit", (10, 21),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255,255,255), 1, cv2.LINE_AA)
-
-        # info nhân viên
-        if last_emp_info and last_label:
-            name = last_label.rsplit("_", 1)[0]
-            ma   = _extract_id_from_label(last_label)
-            dept = last_emp_info.get("phongban") or ""
-            role = last_emp_info.get("chucvu") or ""
-            info_lines = [f"Ten: {name}", f"Ma:  {ma}"]
-            if dept: info_lines.append(f"PB:  {dept}")
-            if role: info_lines.append(f"CV:  {role}")
-            y0 = CAP_HEIGHT - 72
-            cv2.rectangle(frame, (6, y0-2), (CAP_WIDTH-6, CAP_HEIGHT-40), (0,0,0), -1)
-            y = y0
-            for line in info_lines:
-                cv2.putText(frame, line, (12, y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255,255,255), 1, cv2.LINE_AA)
-                y += 16
-
-        # status "Done"
-        if time.time() < status_until:
-            cv2.rectangle(frame, (6, CAP_HEIGHT - 36), (CAP_WIDTH - 6, CAP_HEIGHT - 6), (0, 96, 0), -1)
-            cv2.putText(frame, "Done", (12, CAP_HEIGHT - 14),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.65, (255, 255, 255), 1, cv2.LINE_AA)
-
-        cv2.imshow("Manual Attendance (Auto)", frame)
-        key = cv2.waitKey(1) & 0xFF
-        if key == 27:  # ESC
-            break
-
-    cap.release()
-    cv2.destroyAllWindows()
+            if now_ts >= next_stats:
+                print(writer.format_stats())
+                if tracker is not None:
+                    tst = tracker.stats()
+                    print(f"[tracker] tracks={tst['tracks']} encoded={tst['encoded']} skipped={tst['skipped']}")
+                print(f"[adaptive] {ctrl.status()}")
+                gst = gate.stats()
+                print(f"[motion] detect={gst['passed']} skip={gst['skipped']}")
+                next_stats = now_ts + STATS_EVERY_S
+
+            # ===== VẼ UI =====
+            for ma, ((l, t, r, b), seen) in list(last_boxes.items()):
+                if now_ts - seen > STATUS_MS / 1000.0:
+                    del last_boxes[ma]   # người đã rời khung
+                    continue
+                color = (0, 255, 0) if (time.time() < status_until) else (255, 255, 255)
+                cv2.rectangle(frame, (l, t), (r, b), color, 2)
+
+            # header
+            cv2.rectangle(frame, (6, 6), (CAP_WIDTH - 6, 26), (0, 0, 0), -1)
+            cv2.putText(frame, "Auto Attendance — ESC to quit", (10, 21),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255,255,255), 1, cv2.LINE_AA)
+            cv2.putText(frame, ctrl.status(), (10, 40),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.35, (0,255,255), 1, cv2.LINE_AA)
+
+            # info nhân viên
+            if last_emp_info and last_label:
+                name = last_label.rsplit("_", 1)[0]
+                ma   = _extract_id_from_label(last_label)
+                dept = last_emp_info.get("phongban") or ""
+                role = last_emp_info.get("chucvu") or ""
+                info_lines = [f"Ten: {name}", f"Ma:  {ma}"]
+                if dept: info_lines.append(f"PB:  {dept}")
+                if role: info_lines.append(f"CV:  {role}")
+                y0 = CAP_HEIGHT - 72
+                cv2.rectangle(frame, (6, y0-2), (CAP_WIDTH-6, CAP_HEIGHT-40), (0,0,0), -1)
+                y = y0
+                for line in info_lines:
+                    cv2.putText(frame, line, (12, y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255,255,255), 1, cv2.LINE_AA)
+                    y += 16
+
+            # status "Done"
+            if time.time() < status_until:
+                cv2.rectangle(frame, (6, CAP_HEIGHT - 36), (CAP_WIDTH - 6, CAP_HEIGHT - 6), (0, 96, 0), -1)
+                cv2.putText(frame, "Done", (12, CAP_HEIGHT - 14),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.65, (255, 255, 255), 1, cv2.LINE_AA)
+
+            cv2.imshow("Manual Attendance (Auto)", frame)
+            key = cv2.waitKey(1) & 0xFF
+            if key == 27:  # ESC
+                break
+    finally:
+        if gallery is not None:
+            gallery.stop()
+        for w in workers:
+            w.stop()
+        grabber.stop()
+        grabber.join(timeout=1.0)
+        for w in workers:
+            w.join(timeout=2.0)
+        writer.stop()
+        print(writer.format_stats())
+        cap.release()
+        cv2.destroyAllWindows()
@@ -0,0 +1,83 @@
+# app/attendance_writer.py
+# Ghi chấm công ở luồng nền: camera chỉ đẩy sự kiện vào hàng đợi rồi chạy tiếp,
+# kết quả được trả lại qua poll() để luồng camera/UI gọi on_success (đúng luồng).
+import threading, queue, time
+
+_STOP = object()
+
+class AttendanceWriter(threading.Thread):
+    """
+    handler(*args) -> kết quả (chạy trong luồng nền, được phép chậm / chạm DB).
+    - submit(*args): không bao giờ chặn; hàng đợi đầy thì bỏ sự kiện và đếm `dropped`
+    - poll(): lấy các kết quả đã xong (gọi từ luồng chính)
+    - stats(): độ sâu hàng đợi, số lần ghi, thời gian ghi trung bình / lớn nhất
+    """
+    def __init__(self, handler, maxsize=256):
+        super().__init__(daemon=True)
+        self.handler = handler
+        self.q = queue.Queue(maxsize=maxsize)
+        self.done = queue.Queue()
+        self._lock = threading.Lock()
+        self.writes = 0
+        self.errors = 0
+        self.dropped = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.max_depth = 0
+
+    def submit(self, *args) -> bool:
+        try:
+            self.q.put_nowait(args)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+        with self._lock:
+            self.max_depth = max(self.max_depth, self.q.qsize())
+        return True
+
+    def run(self):
+        while True:
+            args = self.q.get()
+            if args is _STOP:
+                break
+            t0 = time.perf_counter()
+            try:
+                result = self.handler(*args)
+                ok = True
+            except Exception as e:
+                print(f"⚠️ Lỗi ghi chấm công: {e}")
+                result, ok = None, False
+            ms = (time.perf_counter() - t0) * 1000.0
+            with self._lock:
+                self.writes += 1
+                self.errors += 0 if ok else 1
+                self.total_ms += ms
+                self.max_ms = max(self.max_ms, ms)
+            if ok:
+                self.done.put(result)
+
+    def poll(self):
+        out = []
+        while True:
+            try:
+                out.append(self.done.get_nowait())
+            except queue.Empty:
+                return out
+
+    def stats(self) -> dict:
+        with self._lock:
+            avg = self.total_ms / self.writes if self.writes else 0.0
+            return {"queue": self.q.qsize(), "max_queue": self.max_depth, "writes": self.writes,
+                    "errors": self.errors, "dropped": self.dropped,
+                    "avg_ms": avg, "max_ms": self.max_ms}
+
+    def format_stats(self) -> str:
+        st = self.stats()
+        return (f"[writer] queue={st['queue']} (max {st['max_queue']}) writes={st['writes']} "
+                f"err={st['errors']} drop={st['dropped']} avg={st['avg_ms']:.1f}ms max={st['max_ms']:.1f}ms")
+
+    def stop(self, timeout=5.0):
+        """Ghi nốt các sự kiện còn trong hàng đợi rồi dừng."""
+        self.q.put(_STOP)
+        self.join(timeout=timeout)
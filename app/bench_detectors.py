@@ -0,0 +1,59 @@
+# app/bench_detectors.py
+# So sánh các detector trên ảnh trong dataset/ (mỗi ảnh được chụp khi có ĐÚNG 1 khuôn mặt):
+#   - recall: tỉ lệ ảnh tìm được >= 1 mặt
+#   - exact1: tỉ lệ ảnh tìm được đúng 1 mặt
+#   - IoU trung bình với HOG (mức khớp vị trí box)
+#   - độ trễ trung bình (ms/ảnh) ở kích thước `--scale`
+# Chạy: python -m app.bench_detectors [--scale 0.4] [--limit 200] [--detectors hog,haar,ssd,yunet]
+import argparse, time
+import cv2
+import face_recognition
+
+from app.config import DATASET_DIR
+from app.detectors import DETECTORS, make_detector
+from app.tracker import iou
+
+def _images(limit):
+    files = sorted(DATASET_DIR.glob("*/**/*.jpg"))
+    return files[:limit] if limit else files
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark detector khuôn mặt trên dataset/")
+    ap.add_argument("--detectors", default=",".join(DETECTORS), help="danh sách, cách nhau bởi dấu phẩy")
+    ap.add_argument("--scale", type=float, default=0.4, help="thu nhỏ ảnh như màn chấm công")
+    ap.add_argument("--limit", type=int, default=0, help="số ảnh tối đa (0 = tất cả)")
+    args = ap.parse_args()
+
+    imgs = []
+    for f in _images(args.limit):
+        rgb = face_recognition.load_image_file(f)
+        if args.scale != 1.0:
+            rgb = cv2.resize(rgb, (0, 0), fx=args.scale, fy=args.scale)
+        imgs.append(rgb)
+    if not imgs:
+        print("❌ dataset/ không có ảnh.")
+        return
+    print(f"{len(imgs)} ảnh, scale={args.scale}")
+
+    ref = [make_detector("hog").detect(rgb) for rgb in imgs]
+    print(f"{'detector':8} {'recall':>7} {'exact1':>7} {'IoU/hog':>8} {'ms/img':>8}")
+    for name in [n.strip() for n in args.detectors.split(",") if n.strip()]:
+        det = make_detector(name)
+        if det.name != name:
+            continue   # không khởi tạo được (thiếu model) -> đã cảnh báo
+        det.detect(imgs[0])   # warm-up
+        found = exact = 0
+        ious = []
+        t0 = time.perf_counter()
+        boxes_all = [det.detect(rgb) for rgb in imgs]
+        ms = (time.perf_counter() - t0) * 1000.0 / len(imgs)
+        for boxes, rb in zip(boxes_all, ref):
+            found += bool(boxes)
+            exact += len(boxes) == 1
+            if boxes and rb:
+                ious.append(max(iou(b, rb[0]) for b in boxes))
+        mean_iou = sum(ious) / len(ious) if ious else 0.0
+        print(f"{name:8} {found / len(imgs):7.3f} {exact / len(imgs):7.3f} {mean_iou:8.3f} {ms:8.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -2,9 +2,9 @@
 import cv2
 import os
 from pathlib import Path
-import face_recognition
 
 from app.config import ROOT
+from app.detectors import face_locations
 
 DATASET_DIR = ROOT / "dataset"
 DATASET_DIR.mkdir(parents=True, exist_ok=True)
@@ -45,7 +45,7 @@ class FaceCollector:
             if not ret:
                 break
             rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            boxes = face_recognition.face_locations(rgb, model="hog", number_of_times_to_upsample=0)
+            boxes = face_locations(rgb, upsample=0)
 
             # Vẽ hộp nếu có 1 mặt
             disp = frame.copy()
@@ -98,7 +98,7 @@ class FaceCollector:
                 break
 
             rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            boxes = face_recognition.face_locations(rgb, model="hog", number_of_times_to_upsample=0)
+            boxes = face_locations(rgb, upsample=0)
             disp = frame.copy()
             if len(boxes) == 1:
                 t, r, b, l = boxes[0]
@@ -3,8 +3,21 @@ from pathlib import Path
 ROOT = Path(__file__).resolve().parent.parent
 
 DATASET_DIR   = ROOT / "dataset"
-ENCODINGS_PKL = ROOT / "encodings" / "encodings_dlib20.pkl"
+ENCODINGS_DIR = ROOT / "encodings"
+ENCODINGS_PKL = ENCODINGS_DIR / "encodings_dlib20.pkl"   # định dạng cũ (chỉ để migrate)
+EMBEDDINGS_NPY = ENCODINGS_DIR / "embeddings.npy"        # float32 (N,128), load bằng mmap
+LABELS_JSON    = ENCODINGS_DIR / "labels.json"           # {"classes": [...], "ids": [...]}
+PROTOTYPES_NPZ = ENCODINGS_DIR / "prototypes.npz"        # vài tâm cụm / người (tuỳ chọn)
+ANN_INDEX_NPZ  = ENCODINGS_DIR / "ann_ivf.npz"           # IVF index cho gallery lớn (tuỳ chọn)
 MODELS_DIR    = ROOT / "models"
+MIGRATIONS_DIR = ROOT / "migrations"                      # NNNN_ten.sql / .py (python -m app.migrate)
+
+# Bộ phát hiện khuôn mặt dùng chung: "hog" | "haar" | "ssd" | "yunet" (xem app/detectors.py)
+FACE_DETECTOR = "hog"
+
+# Dịch vụ nhận diện dùng chung (python -m app.recog_service). Đặt URL, ví dụ
+# "http://127.0.0.1:8765", để UI / kiosk gọi service thay vì tự nạp model dlib.
+RECOG_SERVICE_URL = None
 
 MYSQL = {
     "host": "127.0.0.1",   # (ưu tiên 127.0.0.1 thay vì localhost)
@@ -14,5 +27,16 @@ MYSQL = {
     "database": "dulieu_app",
 }
 
+# Pool kết nối dùng chung cho cả process (app.db.DB)
+MYSQL_POOL = {
+    "size": 5,            # tối đa số kết nối mở cùng lúc
+    "timeout": 10.0,      # chờ tối đa (giây) khi pool đã dùng hết
+    "ping_after": 30.0,   # kết nối rảnh lâu hơn chừng này thì ping/reconnect trước khi dùng
+}
+
+EMP_CACHE_TTL = 300.0   # giây; danh bạ nhân viên trong RAM tự nạp lại sau khoảng này
+
+# Journal sự kiện chấm công (SQLite WAL) — camera ghi vào đây ngay, luồng flusher đẩy lên MySQL theo lô
+JOURNAL_DB = ROOT / "journal" / "chamcong_events.sqlite3"
 
 WORK_START_HOUR = 8  # giờ bắt đầu làm việc
@@ -1,25 +1,155 @@
 import mysql.connector
+import threading, queue, time
 from contextlib import contextmanager
-from app.config import MYSQL  # {host, port, user, password, database}
+from app.config import MYSQL, MYSQL_POOL, EMP_CACHE_TTL  # {host, port, user, password, database}
 
-class DB:
-    def __init__(self):
-        self.cn = mysql.connector.connect(**MYSQL)
-        self.cn.autocommit = True
+class ConnectionPool:
+    """
+    Pool kết nối MySQL dùng chung cho cả process.
+    - acquire(): lấy kết nối rảnh; hết thì mở mới (tối đa `size`), quá thì chờ `timeout` giây
+    - kết nối rảnh lâu được ping(reconnect=True) trước khi giao; hỏng thì bỏ và mở lại
+    - release(): trả về pool (kết nối hỏng bị đóng, nhường chỗ cho kết nối mới)
+    """
+    def __init__(self, size=5, timeout=10.0, ping_after=30.0, **conn_args):
+        self.size = size
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self.conn_args = conn_args
+        self._idle = queue.LifoQueue()   # (cn, thời điểm trả về)
+        self._lock = threading.Lock()
+        self._created = 0
 
-    def close(self):
+    def _connect(self):
+        cn = mysql.connector.connect(**self.conn_args)
+        cn.autocommit = True
+        return cn
+
+    def _healthy(self, cn, idle_since):
+        try:
+            if time.monotonic() - idle_since >= self.ping_after:
+                cn.ping(reconnect=True, attempts=1, delay=0)
+                cn.autocommit = True
+            return cn.is_connected()
+        except Exception:
+            return False
+
+    def _discard(self, cn):
         try:
-            self.cn.close()
-        except:
+            cn.close()
+        except Exception:
             pass
+        with self._lock:
+            self._created -= 1
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                cn, since = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    can_open = self._created < self.size
+                    if can_open:
+                        self._created += 1
+                if can_open:
+                    try:
+                        return self._connect()
+                    except Exception:
+                        with self._lock:
+                            self._created -= 1
+                        raise
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"Hết kết nối DB trong pool (size={self.size})")
+                try:
+                    cn, since = self._idle.get(timeout=remaining)
+                except queue.Empty:
+                    continue
+            if self._healthy(cn, since):
+                return cn
+            self._discard(cn)
+
+    def release(self, cn):
+        try:
+            if cn.in_transaction:
+                cn.rollback()
+            ok = cn.is_connected()
+        except Exception:
+            ok = False
+        if ok:
+            self._idle.put((cn, time.monotonic()))
+        else:
+            self._discard(cn)
 
     @contextmanager
-    def cur(self):
-        c = self.cn.cursor(dictionary=True)
+    def connection(self):
+        cn = self.acquire()
         try:
-            yield c
+            yield cn
         finally:
-            c.close()
+            self.release(cn)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": self.size, "open": self._created, "idle": self._idle.qsize()}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(**MYSQL_POOL, **MYSQL)
+    return _pool
+
+class DB:
+    """
+    Mỗi câu lệnh mượn 1 kết nối từ pool chung rồi trả lại ngay, nên `DB().q(...)` rẻ
+    và không còn rò kết nối. Trong `transaction()` mọi lệnh dùng chung 1 kết nối.
+    """
+    def __init__(self):
+        self.pool = get_pool()
+        self._local = threading.local()   # kết nối đang gắn với transaction (theo luồng)
+
+    def close(self):
+        # Kết nối được trả về pool sau mỗi lệnh; giữ lại hàm để tương thích.
+        pass
+
+    @contextmanager
+    def connection(self):
+        """Mượn 1 kết nối (dùng lại kết nối của transaction hiện tại nếu có)."""
+        cn = getattr(self._local, "cn", None)
+        if cn is not None:
+            yield cn
+            return
+        with self.pool.connection() as cn:
+            yield cn
+
+    @contextmanager
+    def cur(self):
+        with self.connection() as cn:
+            c = cn.cursor(dictionary=True)
+            try:
+                yield c
+            finally:
+                c.close()
+
+    @contextmanager
+    def transaction(self):
+        """Gom nhiều câu lệnh thành 1 transaction (commit khi xong, rollback khi lỗi)."""
+        with self.pool.connection() as cn:
+            self._local.cn = cn
+            cn.start_transaction()
+            try:
+                yield self
+                cn.commit()
+            except Exception:
+                cn.rollback()
+                raise
+            finally:
+                self._local.cn = None
 
     # ---------- Helpers ----------
     def q(self, sql, params=None):
@@ -29,6 +159,28 @@ class DB:
                 return c.fetchall()
             return []
 
+    def stream(self, sql, params=None, chunk=2000):
+        """
+        Đọc kết quả lớn theo lô: cursor không buffer (server đẩy dần từng dòng) + fetchmany,
+        yield list[dict] mỗi lô -> bộ nhớ không phụ thuộc số dòng. Giữ 1 kết nối đến khi đọc xong.
+        """
+        with self.connection() as cn:
+            c = cn.cursor(dictionary=True, buffered=False)
+            try:
+                c.execute(sql, params or ())
+                while True:
+                    rows = c.fetchmany(chunk)
+                    if not rows:
+                        break
+                    yield rows
+            finally:
+                try:
+                    if cn.unread_result:      # dừng giữa chừng -> đọc bỏ phần còn lại rồi mới trả kết nối
+                        cn.consume_results()
+                    c.close()
+                except Exception:
+                    pass
+
     def exec(self, sql, params=None):
         with self.cur() as c:
             c.execute(sql, params or ())
@@ -59,7 +211,9 @@ class DB:
     def add_employee(self, ma_nv, ten, ngaysinh, phongban, chucvu):
         sql = ("INSERT INTO nhanvien(ma_nv, ten, ngaysinh, phongban, chucvu) "
                "VALUES (%s,%s,%s,%s,%s)")
-        return self.exec(sql, (ma_nv, ten, ngaysinh, phongban, chucvu))
+        n = self.exec(sql, (ma_nv, ten, ngaysinh, phongban, chucvu))
+        employees.invalidate()
+        return n
 
     # ---- Auto-ID NV: NV001, NV002, ...
     def get_next_ma_nv(self) -> str:
@@ -84,7 +238,7 @@ class DB:
     def add_employee_auto(self, ten, ngaysinh, phongban, chucvu) -> str:
         """Tạo nhân viên với mã tự sinh, trả về ma_nv."""
         ma_nv = self.get_next_ma_nv()
-        self.add_employee(ma_nv, ten, ngaysinh, phongban, chucvu)
+        self.add_employee(ma_nv, ten, ngaysinh, phongban, chucvu)   # add_employee tự invalidate cache
         return ma_nv
 
     def delete_employee(self, ma_nv: str, ten: str):
@@ -94,4 +248,148 @@ class DB:
             "  AND LOWER(TRIM(ten)) = LOWER(TRIM(%s)) "
             "LIMIT 1"
         )
-        return self.exec(sql, (ma_nv, ten))
+        n = self.exec(sql, (ma_nv, ten))
+        employees.invalidate()
+        return n
+
+    # ---------- Attendance ----------
+    # Máy trạng thái IN/OUT trong 1 câu lệnh, dựa trên UNIQUE (ma_nv, ngay) (migrations/0001):
+    #   chưa có dòng      -> INSERT (check-in)
+    #   có dòng, chưa IN  -> điền check_in + note
+    #   đã IN, chưa OUT   -> điền check_out + total_seconds (chỉ khi giờ mới > check_in)
+    #   đã IN và OUT      -> giữ nguyên
+    # "giờ mới > check_in" làm câu lệnh lặp lại được: phát lại cùng 1 sự kiện từ journal không đổi gì.
+    # Thứ tự gán trong UPDATE có ý nghĩa: MySQL dùng giá trị MỚI của cột đã gán ở trước,
+    # nên total_seconds/check_out/note được tính trước khi check_in đổi.
+    # Nhiều dòng VALUES cho cùng (ma_nv, ngay) được áp dụng lần lượt theo thứ tự -> batch vẫn đúng.
+    # id = LAST_INSERT_ID(id) -> lastrowid là id của dòng bị cập nhật (dùng khi ghi 1 sự kiện).
+    _ATT_COLS = "ma_nv, ten_nv, ngay, check_in, check_out, total_seconds, note"
+    _ATT_ROW = "(%s, %s, %s, %s, NULL, NULL, %s)"
+    _ATT_ON_DUP = (
+        " ON DUPLICATE KEY UPDATE "
+        "  id = LAST_INSERT_ID(id), "
+        "  total_seconds = IF(check_in IS NOT NULL AND check_out IS NULL AND VALUES(check_in) > check_in, "
+        "                     TIME_TO_SEC(VALUES(check_in)) - TIME_TO_SEC(check_in), total_seconds), "
+        "  check_out = IF(check_in IS NOT NULL AND check_out IS NULL AND VALUES(check_in) > check_in, "
+        "                 VALUES(check_in), check_out), "
+        "  note = IF(check_in IS NULL, VALUES(note), note), "
+        "  check_in = IF(check_in IS NULL, VALUES(check_in), check_in), "
+        "  ten_nv = COALESCE(ten_nv, VALUES(ten_nv))"
+    )
+
+    def record_attendance(self, ma_nv, ten_nv, ngay, now_hms, checkin_note):
+        """
+        Quyết định IN/OUT cho (ma_nv, ngay) bằng 1 câu INSERT ... ON DUPLICATE KEY UPDATE (nguyên tử,
+        nhiều kiosk cùng thấy 1 người vẫn đúng), rồi đọc lại dòng theo id. Trả về (action, record_dict).
+        """
+        with self.cur() as c:
+            c.execute(f"INSERT INTO chamcong ({self._ATT_COLS}) VALUES {self._ATT_ROW}{self._ATT_ON_DUP}",
+                      (ma_nv, ten_nv, ngay, now_hms, checkin_note))
+            c.execute(f"SELECT {self._ATT_COLS} FROM chamcong WHERE id=%s", (c.lastrowid,))
+            row = c.fetchone()
+        if not row:
+            return "error", None
+        rec = _att_record(row)
+        return _att_action(rec, now_hms), rec
+
+    def record_attendance_batch(self, events):
+        """
+        events: [(ma_nv, ten_nv, ngay 'YYYY-MM-DD', 'HH:MM:SS', note), ...] theo thứ tự thời gian.
+        1 câu INSERT nhiều dòng (1 transaction ngầm) + 1 câu đọc lại các (ma_nv, ngay) liên quan.
+        Trả về [(action, record_dict)] cùng thứ tự `events`.
+        """
+        if not events:
+            return []
+        rows_sql = ", ".join([self._ATT_ROW] * len(events))
+        params = [v for ev in events for v in ev]
+        keys = sorted({(ev[0], str(ev[2])) for ev in events})
+        with self.cur() as c:
+            c.execute(f"INSERT INTO chamcong ({self._ATT_COLS}) VALUES {rows_sql}{self._ATT_ON_DUP}", params)
+            c.execute(f"SELECT {self._ATT_COLS} FROM chamcong WHERE (ma_nv, ngay) IN "
+                      f"({', '.join(['(%s, %s)'] * len(keys))})", [v for k in keys for v in k])
+            recs = {(r["ma_nv"].upper(), str(r["ngay"])): _att_record(r) for r in c.fetchall()}
+        out = []
+        for ma_nv, _, ngay, hms, _ in events:
+            rec = recs.get((ma_nv.upper(), str(ngay)))
+            out.append((_att_action(rec, hms), rec) if rec else ("error", None))
+        return out
+
+def _att_record(row) -> dict:
+    rec = dict(row)
+    rec["check_in"], rec["check_out"] = _hms(rec["check_in"]), _hms(rec["check_out"])
+    return rec
+
+def _att_action(rec, hms) -> str:
+    # affected rows không phân biệt được (mysql.connector bật FOUND_ROWS) -> suy ra từ giá trị đã ghi
+    if rec["check_out"] == hms:
+        return "checkout"
+    if rec["check_in"] == hms:
+        return "checkin"
+    return "done"
+
+def _hms(v):
+    """TIME của MySQL về Python là timedelta -> 'HH:MM:SS' (None giữ nguyên)."""
+    if v is None or isinstance(v, str):
+        return v
+    secs = int(v.total_seconds())
+    return f"{secs // 3600:02d}:{secs % 3600 // 60:02d}:{secs % 60:02d}"
+
+class EmployeeDirectory:
+    """
+    Danh bạ nhân viên trong RAM (nạp 1 lần bằng list_employees()).
+    - tự nạp lại sau `ttl` giây hoặc khi invalidate() (add/delete employee gọi tự động)
+    - mã không có trong cache: nạp lại tối đa 1 lần / `miss_reload_s` giây (NV mới thêm ở nơi khác)
+    - stats(): số hit / miss / lần nạp
+    """
+    def __init__(self, ttl=EMP_CACHE_TTL, miss_reload_s=5.0):
+        self.ttl = ttl
+        self.miss_reload_s = miss_reload_s
+        self._lock = threading.Lock()
+        self._rows = {}
+        self._loaded_at = None
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+
+    def _load(self):
+        rows = DB().list_employees()
+        with self._lock:
+            self._rows = {r["ma_nv"].upper(): r for r in rows}
+            self._loaded_at = time.monotonic()
+            self.loads += 1
+
+    def _stale(self):
+        return self._loaded_at is None or time.monotonic() - self._loaded_at >= self.ttl
+
+    def get(self, ma_nv: str):
+        if not ma_nv:
+            return None
+        key = ma_nv.strip().upper()
+        if self._stale():
+            self._load()
+        row = self._rows.get(key)
+        loaded_at = self._loaded_at   # có thể bị invalidate() ở luồng khác -> None
+        if row is None and (loaded_at is None or time.monotonic() - loaded_at >= self.miss_reload_s):
+            self._load()
+            row = self._rows.get(key)
+        with self._lock:
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return row
+
+    def all(self):
+        if self._stale():
+            self._load()
+        return list(self._rows.values())
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "loads": self.loads, "size": len(self._rows)}
+
+employees = EmployeeDirectory()
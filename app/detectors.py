@@ -0,0 +1,133 @@
+# app/detectors.py
+# Bộ phát hiện khuôn mặt dùng chung cho mọi nơi (chấm công, thu ảnh, encode, kiểm tra trùng).
+# Chọn bằng FACE_DETECTOR trong config: "hog" (dlib, mặc định), "haar", "ssd" (OpenCV DNN res10), "yunet".
+# Mọi detector nhận ảnh RGB và trả về box dạng face_recognition: (top, right, bottom, left).
+# face_encodings(rgb, boxes): encode 128-d cho các box đó (qua recog_service nếu có cấu hình).
+import threading
+import cv2
+
+from app.config import FACE_DETECTOR, MODELS_DIR, RECOG_SERVICE_URL
+
+SSD_PROTOTXT = MODELS_DIR / "deploy.prototxt"
+SSD_MODEL    = MODELS_DIR / "res10_300x300_ssd_iter_140000.caffemodel"
+YUNET_MODEL  = MODELS_DIR / "face_detection_yunet_2023mar.onnx"
+
+def _clip(box, w, h):
+    t, r, b, l = box
+    return (max(0, int(t)), min(w, int(r)), min(h, int(b)), max(0, int(l)))
+
+class HogDetector:
+    name = "hog"
+
+    def __init__(self):
+        import face_recognition   # nạp model dlib chỉ khi thật sự dùng HOG tại chỗ
+        self._fr = face_recognition
+
+    def detect(self, rgb, upsample=0):
+        return self._fr.face_locations(rgb, model="hog", number_of_times_to_upsample=upsample)
+
+class HaarDetector:
+    name = "haar"
+
+    def __init__(self, min_size=24):
+        self.min_size = min_size
+        self.cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+        if self.cascade.empty():
+            raise RuntimeError("Không nạp được haarcascade_frontalface_default.xml")
+
+    def detect(self, rgb, upsample=0):
+        gray = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+        faces = self.cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5,
+                                              minSize=(self.min_size, self.min_size))
+        h, w = gray.shape[:2]
+        return [_clip((y, x + fw, y + fh, x), w, h) for (x, y, fw, fh) in faces]
+
+class SsdDetector:
+    """OpenCV DNN res10 SSD (Caffe). Cần deploy.prototxt + res10_300x300_ssd_iter_140000.caffemodel trong models/."""
+    name = "ssd"
+
+    def __init__(self, conf=0.6):
+        if not SSD_PROTOTXT.exists() or not SSD_MODEL.exists():
+            raise FileNotFoundError(f"Thiếu model SSD: {SSD_PROTOTXT.name}, {SSD_MODEL.name}")
+        self.net = cv2.dnn.readNetFromCaffe(str(SSD_PROTOTXT), str(SSD_MODEL))
+        self.conf = conf
+        self._lock = threading.Lock()   # cv2.dnn.Net không an toàn khi nhiều luồng cùng forward
+
+    def detect(self, rgb, upsample=0):
+        h, w = rgb.shape[:2]
+        bgr = cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+        blob = cv2.dnn.blobFromImage(cv2.resize(bgr, (300, 300)), 1.0, (300, 300), (104.0, 177.0, 123.0))
+        with self._lock:
+            self.net.setInput(blob)
+            det = self.net.forward()
+        out = []
+        for i in range(det.shape[2]):
+            if float(det[0, 0, i, 2]) < self.conf:
+                continue
+            x1, y1, x2, y2 = det[0, 0, i, 3:7] * [w, h, w, h]
+            out.append(_clip((y1, x2, y2, x1), w, h))
+        return out
+
+class YuNetDetector:
+    """OpenCV FaceDetectorYN (YuNet, ONNX). Cần face_detection_yunet_2023mar.onnx trong models/."""
+    name = "yunet"
+
+    def __init__(self, conf=0.7):
+        if not YUNET_MODEL.exists():
+            raise FileNotFoundError(f"Thiếu model YuNet: {YUNET_MODEL.name}")
+        self.net = cv2.FaceDetectorYN.create(str(YUNET_MODEL), "", (320, 320), conf)
+        self._lock = threading.Lock()
+
+    def detect(self, rgb, upsample=0):
+        h, w = rgb.shape[:2]
+        bgr = cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+        with self._lock:
+            self.net.setInputSize((w, h))
+            _, faces = self.net.detect(bgr)
+        if faces is None:
+            return []
+        return [_clip((y, x + fw, y + fh, x), w, h) for x, y, fw, fh in faces[:, :4]]
+
+DETECTORS = {"hog": HogDetector, "haar": HaarDetector, "ssd": SsdDetector, "yunet": YuNetDetector}
+
+_detector = None
+_detector_lock = threading.Lock()
+
+def make_detector(name: str):
+    """Tạo detector theo tên; lỗi (thiếu model...) -> in cảnh báo và dùng HOG."""
+    cls = DETECTORS.get((name or "hog").lower())
+    if cls is None:
+        print(f"⚠️ Detector không hợp lệ: {name} — dùng hog")
+        return HogDetector()
+    try:
+        return cls()
+    except Exception as e:
+        print(f"⚠️ Không khởi tạo được detector '{name}': {e} — dùng hog")
+        return HogDetector()
+
+def get_detector():
+    """
+    Detector dùng chung cả process (theo FACE_DETECTOR).
+    Có RECOG_SERVICE_URL -> gọi app.recog_service (không nạp model tại chỗ).
+    """
+    global _detector
+    if _detector is None:
+        with _detector_lock:
+            if _detector is None:
+                if RECOG_SERVICE_URL:
+                    from app.recog_client import RemoteDetector, get_client
+                    _detector = RemoteDetector(get_client())
+                else:
+                    _detector = make_detector(FACE_DETECTOR)
+    return _detector
+
+def face_locations(rgb, upsample=0):
+    return get_detector().detect(rgb, upsample)
+
+def face_encodings(rgb, boxes):
+    """Encode 128-d: qua recog_service nếu có cấu hình, ngược lại dlib tại chỗ."""
+    if RECOG_SERVICE_URL:
+        from app.recog_client import get_client
+        return get_client().encode(rgb, boxes)
+    import face_recognition
+    return face_recognition.face_encodings(rgb, boxes, num_jitters=1)
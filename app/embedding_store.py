@@ -0,0 +1,111 @@
+# app/embedding_store.py
+# Kho embeddings dạng nhị phân: ma trận float32 (N,128) trong .npy (đọc bằng mmap)
+# + bảng nhãn gọn trong labels.json (danh sách tên lớp + id lớp cho từng dòng).
+import json, os, pickle, argparse
+from pathlib import Path
+import numpy as np
+
+from app.config import EMBEDDINGS_NPY, LABELS_JSON, ENCODINGS_PKL, PROTOTYPES_NPZ
+
+DIM = 128
+STORE_VERSION = 1
+
+def encode_labels(names):
+    """['A','A','B'] -> (ids int32 [0,0,1], classes ['A','B']) — giữ thứ tự xuất hiện."""
+    classes, index, ids = [], {}, []
+    for n in names:
+        if n not in index:
+            index[n] = len(classes)
+            classes.append(n)
+        ids.append(index[n])
+    return np.asarray(ids, dtype=np.int32), classes
+
+def save_store(embeddings, names, npy_path: Path = EMBEDDINGS_NPY, labels_path: Path = LABELS_JSON):
+    """
+    Ghi kho mới (ghi file tạm rồi os.replace). labels.json được ghi SAU cùng và chứa
+    số dòng -> người đọc phát hiện được cặp file lệch nhau khi đang ghi dở.
+    Các dòng được ghi theo thứ tự id nhãn (ổn định) -> FaceMatcher dùng thẳng mmap, không phải sắp lại.
+    """
+    embs = np.asarray(embeddings, dtype=np.float32).reshape(-1, DIM)
+    ids, classes = encode_labels(list(names))
+    if len(ids) != len(embs):
+        raise ValueError(f"Số nhãn ({len(ids)}) khác số embeddings ({len(embs)})")
+    if len(ids) > 1 and np.any(ids[1:] < ids[:-1]):
+        order = np.argsort(ids, kind="stable")
+        embs, ids = embs[order], ids[order]
+
+    npy_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_npy = npy_path.with_name(npy_path.name + ".tmp")
+    with open(tmp_npy, "wb") as f:
+        np.save(f, np.ascontiguousarray(embs))
+    os.replace(tmp_npy, npy_path)
+
+    tmp_lbl = labels_path.with_name(labels_path.name + ".tmp")
+    with open(tmp_lbl, "w", encoding="utf-8") as f:
+        json.dump({"version": STORE_VERSION, "count": int(len(embs)),
+                   "classes": classes, "ids": ids.tolist()}, f, ensure_ascii=False)
+    os.replace(tmp_lbl, labels_path)
+
+def load_store(npy_path: Path = EMBEDDINGS_NPY, labels_path: Path = LABELS_JSON, mmap=True):
+    """
+    Trả về (embs float32 (N,128) — mmap read-only, ids int32 (N,), classes list).
+    Không tồn tại -> None.
+    """
+    if not npy_path.exists() or not labels_path.exists():
+        return None
+    with open(labels_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    embs = np.load(npy_path, mmap_mode="r" if mmap else None)
+    if embs.ndim != 2 or (len(embs) and embs.shape[1] != DIM):
+        raise ValueError(f"Sai kích thước embeddings: {embs.shape}")
+    if embs.dtype != np.float32:
+        embs = embs.astype(np.float32)
+    ids = np.asarray(meta.get("ids", []), dtype=np.int32)
+    if meta.get("count", len(ids)) != len(embs) or len(ids) != len(embs):
+        raise ValueError("embeddings.npy và labels.json không khớp số dòng")
+    return embs, ids, list(meta.get("classes", []))
+
+def save_prototypes(centroids, ids, classes, path: Path = PROTOTYPES_NPZ):
+    """Lưu tâm cụm theo người: centroids (P,128) float32, ids (P,) int32 theo `classes`."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        np.savez(f, centroids=np.asarray(centroids, dtype=np.float32).reshape(-1, DIM),
+                 ids=np.asarray(ids, dtype=np.int32), classes=np.asarray(classes, dtype=str))
+    os.replace(tmp, path)
+
+def load_prototypes(classes, path: Path = PROTOTYPES_NPZ):
+    """Trả về (centroids, ids) hoặc None nếu chưa có / lệch bảng nhãn với kho hiện tại."""
+    if not path.exists():
+        return None
+    with np.load(path) as z:
+        if list(z["classes"]) != list(classes):
+            return None
+        return z["centroids"].astype(np.float32), z["ids"].astype(np.int32)
+
+def load_legacy_pickle(pkl_path: Path = ENCODINGS_PKL):
+    """Đọc file pickle cũ {"embeddings": [...], "names": [...]} -> (embs float32, names)."""
+    with open(pkl_path, "rb") as f:
+        data = pickle.load(f)
+    embs = np.asarray(data["embeddings"], dtype=np.float32).reshape(-1, DIM)
+    return embs, list(data["names"])
+
+def migrate_from_pickle(pkl_path: Path = ENCODINGS_PKL):
+    embs, names = load_legacy_pickle(pkl_path)
+    save_store(embs, names)
+    print(f"✅ Đã chuyển {len(embs)} embeddings: {pkl_path} -> {EMBEDDINGS_NPY}, {LABELS_JSON}")
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Kho embeddings nhị phân")
+    ap.add_argument("--migrate", action="store_true", help="chuyển encodings_dlib20.pkl sang .npy + labels.json")
+    ap.add_argument("--pkl", type=Path, default=ENCODINGS_PKL)
+    args = ap.parse_args()
+    if args.migrate:
+        migrate_from_pickle(args.pkl)
+    else:
+        st = load_store()
+        if st is None:
+            print("❌ Chưa có kho embeddings. Chạy --migrate hoặc app.encode_sync.")
+        else:
+            embs, ids, classes = st
+            print(f"{len(embs)} embeddings, {len(classes)} nhãn, dtype={embs.dtype}")
@@ -1,23 +1,235 @@
-import pickle, os
+import pickle, os, hashlib, argparse, time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 import face_recognition
 
-ROOT = Path(__file__).resolve().parent.parent
-DATASET = ROOT / "dataset"
-OUT_PKL = ROOT / "encodings" / "encodings_dlib20.pkl"
+from app.config import DATASET_DIR as DATASET, FACE_DETECTOR, ENCODINGS_DIR, EMBEDDINGS_NPY, PROTOTYPES_NPZ, ANN_INDEX_NPZ
+from app.detectors import make_detector
+from app.embedding_store import save_store, save_prototypes, encode_labels
 
-def build():
-    encs, names = [], []
-    for person in os.listdir(DATASET):
+# Chạy: python -m app.encode_sync [--full] [--workers N]
+MANIFEST = ENCODINGS_DIR / "manifest.pkl"   # cache encode theo từng ảnh
+MANIFEST_VERSION = 1
+DETECT_UPSAMPLE = 1
+NUM_JITTERS = 1
+
+def _sha1(path: Path) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _encoder_signature() -> dict:
+    """Cấu hình sinh ra encoding (detector thật sự dùng + tham số encode) — đổi là phải encode lại."""
+    return {"detector": _get_detector().name, "upsample": DETECT_UPSAMPLE, "jitters": NUM_JITTERS}
+
+def _load_manifest() -> dict:
+    """Manifest: {rel_path: {mtime, size, sha1, label, enc}}. Lỗi/khác version/khác encoder -> rỗng."""
+    if not MANIFEST.exists():
+        return {}
+    try:
+        with open(MANIFEST, "rb") as f:
+            data = pickle.load(f)
+        if data.get("version") != MANIFEST_VERSION:
+            return {}
+        sig = _encoder_signature()
+        if data.get("encoder") != sig:
+            print(f"ℹ️ Cấu hình encode đổi ({data.get('encoder')} -> {sig}) — encode lại toàn bộ.")
+            return {}
+        return data.get("items", {})
+    except Exception:
+        return {}
+
+def _dump_atomic(obj, path: Path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "wb") as f:
+        pickle.dump(obj, f)
+    os.replace(tmp, path)
+
+_detector = None
+
+def _get_detector():
+    # encode luôn chạy tại chỗ (kể cả khi UI dùng recog_service) — mỗi process 1 detector
+    global _detector
+    if _detector is None:
+        _detector = make_detector(FACE_DETECTOR)
+    return _detector
+
+def _encode_image(imgfile: Path):
+    img = face_recognition.load_image_file(imgfile)
+    boxes = _get_detector().detect(img, upsample=DETECT_UPSAMPLE)
+    enc = face_recognition.face_encodings(img, boxes, num_jitters=NUM_JITTERS)
+    return enc[0] if enc else None
+
+def _encode_chunk(paths):
+    """Chạy trong process con: encode 1 nhóm ảnh, trả về list enc theo đúng thứ tự."""
+    return [_encode_image(Path(p)) for p in paths]
+
+def _progress(done, total, t0):
+    dt = max(time.perf_counter() - t0, 1e-9)
+    print(f"  ... {done}/{total} ảnh — {done / dt:.1f} ảnh/s", flush=True)
+
+def _encode_many(files, workers=1, chunk=8):
+    """
+    Encode danh sách ảnh. workers>1: chia thành các chunk và gửi vào ProcessPoolExecutor.
+    Kết quả trả về theo đúng thứ tự `files` (merge ổn định, không phụ thuộc process nào xong trước).
+    """
+    total = len(files)
+    results = [None] * total
+    if total == 0:
+        return results
+    t0 = time.perf_counter()
+    if workers <= 1:
+        for i, f in enumerate(files):
+            results[i] = _encode_image(f)
+            if (i + 1) % 20 == 0 or i + 1 == total:
+                _progress(i + 1, total, t0)
+    else:
+        chunk = max(1, chunk)
+        starts = list(range(0, total, chunk))
+        done = 0
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            futs = {ex.submit(_encode_chunk, [str(f) for f in files[s:s + chunk]]): s for s in starts}
+            for fut in as_completed(futs):
+                s = futs[fut]
+                part = fut.result()
+                results[s:s + len(part)] = part
+                done += len(part)
+                _progress(done, total, t0)
+    dt = max(time.perf_counter() - t0, 1e-9)
+    print(f"⏱ Encode {total} ảnh trong {dt:.1f}s — {total / dt:.1f} ảnh/s (workers={workers})")
+    return results
+
+def _scan_dataset():
+    """Danh sách (person, imgfile) theo thứ tự cố định (sort) để kết quả ổn định."""
+    items = []
+    if not DATASET.exists():
+        return items
+    for person in sorted(os.listdir(DATASET)):
         pdir = DATASET / person
         if not pdir.is_dir(): continue
-        for imgfile in pdir.glob("**/*.jpg"):
-            img = face_recognition.load_image_file(imgfile)
-            boxes = face_recognition.face_locations(img, model='hog')
-            enc = face_recognition.face_encodings(img, boxes)
-            if enc: encs.append(enc[0]); names.append(person)
-    pickle.dump({"embeddings":encs, "names":names}, open(OUT_PKL, "wb"))
-    print("✅ Encodings saved:", OUT_PKL)
+        for imgfile in sorted(pdir.glob("**/*.jpg")):
+            items.append((person, imgfile))
+    return items
+
+def build_prototype_index(encs, names, per_label=3):
+    """Tâm cụm theo người cho FaceMatcher (so thô trước, chỉ so kỹ khi gần ngưỡng)."""
+    from app.matcher import build_prototypes
+    ids, classes = encode_labels(names)
+    cents, cids = build_prototypes(encs, ids, per_label=per_label)
+    save_prototypes(cents, cids, classes)
+    print(f"✅ Prototype index: {len(cents)} tâm cụm cho {len(classes)} người")
+
+def build_ann_index(encs, nlist=0, nprobe=8):
+    """
+    Dựng IVF index (app.ann_index) và in recall@1 + độ trễ so với brute force để chọn nlist/nprobe.
+    nlist=0 -> tự chọn ~sqrt(N).
+    """
+    import numpy as np
+    from app.ann_index import IVFIndex, save_index, benchmark
+    embs = np.asarray(encs, dtype=np.float32).reshape(-1, 128)
+    if len(embs) == 0:
+        return
+    nlist_req = nlist
+    nlist = nlist or max(1, int(np.sqrt(len(embs))))
+    t0 = time.perf_counter()
+    index = IVFIndex(nlist=nlist, nprobe=nprobe).train_add(embs)
+    t_build = time.perf_counter() - t0
+    for p in sorted({1, max(1, nprobe // 2), nprobe, min(nlist, nprobe * 2)}):
+        index.nprobe = p
+        r = benchmark(index, embs)
+        print(f"  IVF nlist={nlist} nprobe={p}: recall@1={r['recall@1']:.3f} "
+              f"{r['ms_index']:.3f} ms/q (brute {r['ms_brute']:.3f} ms/q, {r['queries']} q)")
+    index.nprobe = nprobe
+    save_index(index, embs, nlist_req=nlist_req)
+    print(f"✅ ANN index: {ANN_INDEX_NPZ} (dựng trong {t_build:.1f}s, nprobe={nprobe})")
+
+def build(incremental=True, workers=1, chunk=8, prototypes=3, ann=None, nlist=0, nprobe=8):
+    """
+    incremental=True: chỉ encode ảnh mới/đã đổi (so mtime+size, rồi sha1),
+    ảnh/thư mục đã xóa tự bị loại khỏi kết quả. incremental=False: encode lại toàn bộ.
+    workers>1: encode song song bằng nhiều process (chunk ảnh mỗi lần gửi).
+    prototypes>0: dựng thêm prototype index (số tâm cụm tối đa / người); 0 = bỏ qua và xóa index cũ.
+    ann=True: dựng IVF index (nlist, nprobe) + in recall/latency so với brute force.
+    ann=None (mặc định, UI gọi kiểu này): đã có IVF index thì dựng lại theo nlist/nprobe đã lưu.
+    ann=False: xóa IVF index (về brute force).
+    """
+    old = _load_manifest() if incremental else {}
+    new_items = {}
+    order = []       # rel theo thứ tự dataset
+    todo = []        # (rel, imgfile) cần encode
+
+    for person, imgfile in _scan_dataset():
+        rel = imgfile.relative_to(DATASET).as_posix()
+        st = imgfile.stat()
+        prev = old.get(rel)
+        entry = None
+        if prev and prev["label"] == person:
+            if prev["mtime"] == st.st_mtime and prev["size"] == st.st_size:
+                entry = prev
+            else:
+                digest = _sha1(imgfile)
+                if prev["sha1"] == digest:
+                    entry = dict(prev, mtime=st.st_mtime, size=st.st_size)
+        if entry is None:
+            entry = {"mtime": st.st_mtime, "size": st.st_size, "sha1": _sha1(imgfile),
+                     "label": person, "enc": None}
+            todo.append((rel, imgfile))
+        new_items[rel] = entry
+        order.append(rel)
+
+    fresh = _encode_many([f for _, f in todo], workers=workers, chunk=chunk)
+    for (rel, _), enc in zip(todo, fresh):
+        new_items[rel]["enc"] = enc
+
+    # theo thứ tự dataset (sort theo người) -> các dòng đã nhóm theo nhãn như kho lưu,
+    # nên ANN index dựng trên `encs` khớp đúng thứ tự dòng của embeddings.npy
+    encs, names = [], []
+    for rel in order:
+        entry = new_items[rel]
+        if entry["enc"] is not None:
+            encs.append(entry["enc"]); names.append(entry["label"])
+
+    n_new = len(todo)
+    n_reused = len(order) - n_new
+    n_removed = len(set(old) - set(new_items))
+    save_store(encs, names)
+    _dump_atomic({"version": MANIFEST_VERSION, "encoder": _encoder_signature(), "items": new_items}, MANIFEST)
+    print(f"✅ Encodings saved: {EMBEDDINGS_NPY} "
+          f"(encode mới: {n_new}, dùng lại: {n_reused}, đã xóa: {n_removed}, tổng: {len(encs)})")
+    if prototypes > 0:
+        build_prototype_index(encs, names, per_label=prototypes)
+    elif PROTOTYPES_NPZ.exists():
+        PROTOTYPES_NPZ.unlink()   # tránh dùng index cũ lệch với kho mới
+    if ann is None:
+        from app.ann_index import index_settings
+        saved = index_settings()
+        if saved is not None:
+            nlist, nprobe = saved
+            print(f"↻ Dựng lại IVF index theo cấu hình đã lưu (nlist={nlist or 'auto'}, nprobe={nprobe})")
+            ann = True
+    if ann:
+        build_ann_index(encs, nlist=nlist, nprobe=nprobe)
+    elif ann is False and ANN_INDEX_NPZ.exists():
+        ANN_INDEX_NPZ.unlink()
+        print(f"🗑 Đã xóa IVF index: {ANN_INDEX_NPZ}")
 
 if __name__ == "__main__":
-    build()
+    ap = argparse.ArgumentParser(description="Đồng bộ encodings từ dataset/")
+    ap.add_argument("--full", action="store_true", help="bỏ qua cache, encode lại toàn bộ")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="số process encode song song (0 = số CPU)")
+    ap.add_argument("--chunk", type=int, default=8, help="số ảnh mỗi lần gửi cho 1 worker")
+    ap.add_argument("--prototypes", type=int, default=3,
+                    help="số tâm cụm tối đa mỗi người cho prototype index (0 = tắt)")
+    ap.add_argument("--ann", action="store_true", default=None, help="dựng IVF index cho gallery lớn")
+    ap.add_argument("--no-ann", dest="ann", action="store_false", help="xóa IVF index (về brute force)")
+    ap.add_argument("--nlist", type=int, default=0, help="số cụm IVF (0 = ~sqrt(N))")
+    ap.add_argument("--nprobe", type=int, default=8, help="số cụm quét mỗi truy vấn")
+    args = ap.parse_args()
+    build(incremental=not args.full,
+          workers=args.workers if args.workers > 0 else (os.cpu_count() or 1),
+          chunk=args.chunk, prototypes=args.prototypes,
+          ann=args.ann, nlist=args.nlist, nprobe=args.nprobe)
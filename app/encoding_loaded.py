@@ -1,10 +1,23 @@
 from pathlib import Path
-import pickle, numpy as np
-from .config import ENCODINGS_PKL
+import numpy as np
+from .config import ENCODINGS_PKL, EMBEDDINGS_NPY
+from .embedding_store import load_store, load_legacy_pickle, encode_labels
+
+def load_gallery():
+    """
+    Trả về (embs float32 (N,128), ids int32 (N,), classes).
+    Ưu tiên kho .npy (mmap, gần như không copy); nếu chưa có thì đọc pickle cũ.
+    """
+    st = load_store()
+    if st is not None:
+        return st
+    if ENCODINGS_PKL.exists():
+        embs, names = load_legacy_pickle(ENCODINGS_PKL)
+        ids, classes = encode_labels(names)
+        return embs, ids, classes
+    print(f"❌ Không tìm thấy: {EMBEDDINGS_NPY} (hoặc {ENCODINGS_PKL})")
+    return np.empty((0,128), dtype=np.float32), np.empty((0,), dtype=np.int32), []
 
 def load_all_encodings():
-    if not ENCODINGS_PKL.exists():
-        print(f"❌ Không tìm thấy: {ENCODINGS_PKL}")
-        return np.empty((0,128), dtype=np.float32), []
-    data = pickle.load(open(ENCODINGS_PKL, 'rb'))
-    return np.array(data['embeddings']), data['names']
+    embs, ids, classes = load_gallery()
+    return embs, [classes[i] for i in ids]
@@ -0,0 +1,323 @@
+# app/event_journal.py
+# Journal sự kiện chấm công bền vững trên máy (SQLite, chế độ WAL) + luồng flusher đẩy lên MySQL.
+# Camera chỉ ghi 1 dòng vào journal (vài ms, không phụ thuộc mạng/DB); flusher gom các sự kiện
+# thành 1 câu INSERT nhiều dòng (DB.record_attendance_batch). MySQL mất kết nối thì sự kiện nằm lại
+# trong journal và được phát lại theo đúng thứ tự khi DB quay lại — không mất lượt chấm.
+# Chỉ 1 flusher (1 process) đẩy journal tại 1 thời điểm: khóa file <journal>.flush.lock.
+#
+#   python -m app.event_journal            # xem backlog
+#   python -m app.event_journal --flush    # đẩy hết backlog lên MySQL rồi thoát
+#   python -m app.event_journal --requeue-dead --flush   # đưa sự kiện bị từ chối về hàng đợi rồi đẩy lại
+import argparse, os, queue, sqlite3, threading, time
+
+from mysql.connector import errors as mysql_errors
+
+from app.config import JOURNAL_DB
+from app.db import DB, employees
+
+BATCH_MAX   = 200     # số sự kiện tối đa / câu INSERT
+LINGER_S    = 0.05    # chờ thêm chút để gom các sự kiện đến sát nhau
+IDLE_POLL_S = 5.0     # không có sự kiện mới vẫn kiểm tra backlog (do lần chạy trước / process khác để lại)
+RETRY_MAX_S = 30.0    # backoff tối đa khi MySQL không truy cập được
+
+# lỗi tạm thời -> giữ nguyên lô và thử lại sau; lỗi khác (dữ liệu hỏng...) -> tách từng sự kiện
+_CONN_ERRORS = (mysql_errors.InterfaceError, mysql_errors.OperationalError, TimeoutError, OSError)
+_RETRY_ERRNOS = {1205, 1213}   # lock wait timeout, deadlock (nhiều kiosk cùng cập nhật chamcong_tonghop)
+
+def _transient(e) -> bool:
+    return isinstance(e, _CONN_ERRORS) or getattr(e, "errno", None) in _RETRY_ERRNOS
+
+class EventJournal:
+    """Bảng events trong SQLite: append() khi camera nhận ra người, ack() khi đã ghi vào MySQL."""
+    def __init__(self, path=JOURNAL_DB):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._cn = sqlite3.connect(str(path), timeout=10.0, check_same_thread=False, isolation_level=None)
+        self._cn.execute("PRAGMA journal_mode=WAL")
+        self._cn.execute("PRAGMA synchronous=FULL")    # commit xong là đã nằm trên đĩa
+        self._cn.execute(
+            "CREATE TABLE IF NOT EXISTS events ("
+            "  id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            "  label TEXT, ma_nv TEXT NOT NULL, ten_nv TEXT, ngay TEXT NOT NULL, hms TEXT NOT NULL, note TEXT,"
+            "  created REAL NOT NULL, dead INTEGER NOT NULL DEFAULT 0, error TEXT)")
+
+    def append(self, label, ma_nv, ten_nv, ngay, hms, note) -> int:
+        with self._lock:
+            cur = self._cn.execute(
+                "INSERT INTO events (label, ma_nv, ten_nv, ngay, hms, note, created) VALUES (?,?,?,?,?,?,?)",
+                (label, ma_nv, ten_nv, ngay, hms, note, time.time()))
+            return cur.lastrowid
+
+    def pending(self, limit=BATCH_MAX):
+        """[(id, label, ma_nv, ten_nv, ngay, hms, note)] theo thứ tự ghi."""
+        with self._lock:
+            return self._cn.execute(
+                "SELECT id, label, ma_nv, ten_nv, ngay, hms, note FROM events WHERE dead = 0 "
+                "ORDER BY id LIMIT ?", (limit,)).fetchall()
+
+    def ack(self, ids):
+        if not ids:
+            return
+        with self._lock:
+            self._cn.execute(f"DELETE FROM events WHERE id IN ({','.join('?' * len(ids))})", list(ids))
+
+    def quarantine(self, eid, error):
+        """Sự kiện MySQL từ chối (không phải lỗi kết nối) -> giữ lại để xem, không chặn các sự kiện sau."""
+        with self._lock:
+            self._cn.execute("UPDATE events SET dead = 1, error = ? WHERE id = ?", (str(error)[:500], eid))
+
+    def requeue_dead(self) -> int:
+        """Đưa mọi sự kiện bị cách ly về hàng đợi (sau khi đã sửa dữ liệu / schema). Trả về số sự kiện."""
+        with self._lock:
+            return self._cn.execute("UPDATE events SET dead = 0, error = NULL WHERE dead = 1").rowcount
+
+    def backlog(self) -> dict:
+        with self._lock:
+            n, oldest = self._cn.execute("SELECT COUNT(*), MIN(created) FROM events WHERE dead = 0").fetchone()
+            dead = self._cn.execute("SELECT COUNT(*) FROM events WHERE dead = 1").fetchone()[0]
+        return {"pending": n, "oldest_s": (time.time() - oldest) if oldest else 0.0, "dead": dead}
+
+    def close(self):
+        with self._lock:
+            self._cn.close()
+
+class _FlushLock:
+    """Khóa file giữa các process (kiosk đang chạy + `--flush` tay): chỉ 1 bên được đẩy journal."""
+    def __init__(self, path):
+        self.path = path
+        self._f = None
+
+    def acquire(self) -> bool:
+        if self._f is not None:
+            return True
+        f = open(self.path, "a+b")
+        try:
+            if os.name == "nt":
+                import msvcrt
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self._f = f
+        return True
+
+    def release(self):
+        if self._f is not None:
+            self._f.close()     # đóng file là nhả khóa (cả fcntl lẫn msvcrt)
+            self._f = None
+
+class JournalWriter(threading.Thread):
+    """
+    Thay AttendanceWriter (cùng submit/poll/stats/format_stats/stop):
+    - submit(label, ma_nv, event=None): make_event(label, ma_nv) (hoặc `event` có sẵn)
+      -> (ma_nv, ten_nv, ngay, hms, note) được ghi vào journal ngay trên luồng gọi, rồi đánh thức
+      flusher. Chỉ False khi không ghi được đĩa.
+    - luồng nền: đẩy journal lên MySQL theo lô; lỗi kết nối / deadlock / lock timeout
+      -> backoff 1s..30s và phát lại sau. Chỉ lỗi dữ liệu thật mới bị cách ly (dead=1).
+    - poll(): (label, ma_nv, action, rec, emp) cho các sự kiện do process này submit (đã lên MySQL).
+    """
+    def __init__(self, make_event, journal=None, batch_max=BATCH_MAX, linger_s=LINGER_S):
+        super().__init__(daemon=True)
+        self.make_event = make_event
+        self.journal = journal or EventJournal()
+        self.batch_max = batch_max
+        self.linger_s = linger_s
+        self.done = queue.Queue()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._mine = set()
+        self.appended = 0
+        self.dropped = 0
+        self.flushed = 0
+        self.batches = 0
+        self.failures = 0
+        self.quarantined = 0
+        self.last_ms = 0.0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.down_since = None
+        self.last_error = ""
+        self.lock_busy = False    # process khác đang giữ khóa flush
+        self._flush_lock = _FlushLock(self.journal.path.with_name(self.journal.path.name + ".flush.lock"))
+
+    def submit(self, label, ma_nv, event=None) -> bool:
+        try:
+            eid = self.journal.append(label, *(event or self.make_event(label, ma_nv)))
+        except Exception as e:
+            print(f"⚠️ Không ghi được journal chấm công: {e}")
+            with self._lock:
+                self.dropped += 1
+            return False
+        with self._lock:
+            self._mine.add(eid)
+            self.appended += 1
+        self._wake.set()
+        return True
+
+    def run(self):
+        backoff = 0.0
+        while not self._stopping.is_set():
+            if backoff:                  # MySQL đang lỗi: sự kiện mới chỉ vào journal, chờ hết backoff
+                self._stopping.wait(backoff)
+            else:
+                self._wake.wait(timeout=IDLE_POLL_S)
+                time.sleep(self.linger_s)
+            self._wake.clear()
+            if self._stopping.is_set():
+                break
+            backoff = 0.0 if self._drain_safe() else min(RETRY_MAX_S, max(1.0, backoff * 2))
+        # đẩy nốt khi dừng — trừ khi MySQL đang lỗi (connect có thể treo lâu hơn stop() chờ);
+        # phần còn lại nằm trong journal cho lần chạy sau
+        if self.down_since is None:
+            self._drain_safe()
+        self._flush_lock.release()
+
+    def _drain_safe(self) -> bool:
+        """_drain() nhưng không để lỗi bất ngờ (SQLite bị khóa...) giết luồng flusher: ghi log rồi backoff."""
+        try:
+            return self._drain()
+        except Exception as e:
+            self._mark_down(e, f"⚠️ Lỗi flusher journal (sẽ thử lại): {e}")
+            return False
+
+    def _mark_down(self, e, msg):
+        with self._lock:
+            self.failures += 1
+            self.last_error = str(e)
+            first = self.down_since is None
+            if first:
+                self.down_since = time.time()
+        if first:
+            print(msg)
+
+    def _drain(self) -> bool:
+        """Đẩy hết backlog. False nếu gặp lỗi tạm thời (giữ nguyên journal để thử lại)."""
+        if not self._flush_lock.acquire():
+            if not self.lock_busy:
+                print("ℹ️ Process khác đang đẩy journal — chờ tới khi khóa được nhả.")
+            self.lock_busy = True
+            return True
+        self.lock_busy = False
+        while True:
+            batch = self.journal.pending(self.batch_max)
+            if not batch:
+                return True
+            t0 = time.perf_counter()
+            try:
+                results = self._apply(batch)
+            except Exception as e:
+                if not _transient(e):
+                    raise
+                self._mark_down(e, f"⚠️ Chưa ghi được lên MySQL (sẽ thử lại), giữ sự kiện trong journal: {e}")
+                return False
+            ms = (time.perf_counter() - t0) * 1000.0
+            ok_ids = [ev[0] for ev, (action, _) in zip(batch, results) if action is not None]
+            self.journal.ack(ok_ids)     # sự kiện bị cách ly vẫn nằm trong journal (dead=1)
+            with self._lock:
+                self.flushed += len(ok_ids)
+                self.batches += 1
+                self.last_ms = ms
+                self.total_ms += ms
+                self.max_ms = max(self.max_ms, ms)
+                was_down, self.down_since = self.down_since, None
+            if was_down:
+                print(f"✅ MySQL ghi được trở lại sau {time.time() - was_down:.0f}s, đang phát lại backlog")
+            for ev, (action, rec) in zip(batch, results):
+                with self._lock:
+                    mine = ev[0] in self._mine
+                    self._mine.discard(ev[0])
+                if mine and action is not None:
+                    self.done.put((ev[1], ev[2], action, rec, _emp(ev[2]) if rec else None))
+            if len(batch) < self.batch_max:
+                return True
+
+    def _apply(self, batch):
+        """1 câu INSERT nhiều dòng; lỗi không tạm thời -> thử từng sự kiện, sự kiện hỏng bị cách ly."""
+        events = [ev[2:7] for ev in batch]
+        try:
+            return DB().record_attendance_batch(events)
+        except Exception as e:
+            if _transient(e):
+                raise
+            if len(batch) == 1:
+                self.journal.quarantine(batch[0][0], e)
+                with self._lock:
+                    self.quarantined += 1
+                print(f"⚠️ Sự kiện chấm công bị MySQL từ chối ({batch[0][2]} {batch[0][4]} {batch[0][5]}): {e}")
+                return [(None, None)]
+        out = []
+        for ev in batch:
+            out.extend(self._apply([ev]))
+        return out
+
+    def poll(self):
+        out = []
+        while True:
+            try:
+                out.append(self.done.get_nowait())
+            except queue.Empty:
+                return out
+
+    def stats(self) -> dict:
+        bl = self.journal.backlog()
+        with self._lock:
+            avg = self.total_ms / self.batches if self.batches else 0.0
+            return {"backlog": bl["pending"], "oldest_s": bl["oldest_s"], "dead": bl["dead"],
+                    "appended": self.appended, "dropped": self.dropped, "flushed": self.flushed,
+                    "batches": self.batches, "failures": self.failures, "quarantined": self.quarantined,
+                    "last_ms": self.last_ms, "avg_ms": avg, "max_ms": self.max_ms,
+                    "db_down_s": (time.time() - self.down_since) if self.down_since else 0.0,
+                    "last_error": self.last_error}
+
+    def format_stats(self) -> str:
+        st = self.stats()
+        s = (f"[journal] backlog={st['backlog']} (cũ nhất {st['oldest_s']:.0f}s) nhận={st['appended']} "
+             f"đã đẩy={st['flushed']} / {st['batches']} lô, flush last={st['last_ms']:.1f}ms "
+             f"avg={st['avg_ms']:.1f}ms max={st['max_ms']:.1f}ms")
+        if st["db_down_s"]:
+            s += f" | MySQL mất kết nối {st['db_down_s']:.0f}s"
+        if st["dead"]:
+            s += f" | bị từ chối={st['dead']}"
+        if self.lock_busy:
+            s += " | process khác đang đẩy"
+        return s
+
+    def stop(self, timeout=5.0):
+        """Dừng luồng; sự kiện chưa đẩy được vẫn nằm trong journal."""
+        self._stopping.set()
+        self._wake.set()
+        self.join(timeout=timeout)
+        if self.is_alive():
+            print(f"⚠️ Flusher chưa xong sau {timeout:.0f}s — sự kiện chưa đẩy vẫn nằm trong journal.")
+
+def _emp(ma_nv):
+    try:
+        return employees.get(ma_nv)
+    except Exception:
+        return None
+
+def main():
+    ap = argparse.ArgumentParser(description="Journal sự kiện chấm công (SQLite) -> MySQL")
+    ap.add_argument("--flush", action="store_true", help="đẩy hết backlog lên MySQL rồi thoát")
+    ap.add_argument("--requeue-dead", action="store_true", help="đưa sự kiện bị từ chối (dead=1) về hàng đợi")
+    args = ap.parse_args()
+    w = JournalWriter(make_event=None)
+    if args.requeue_dead:
+        print(f"↺ Đưa {w.journal.requeue_dead()} sự kiện bị từ chối về hàng đợi.")
+    if args.flush:
+        if not w._flush_lock.acquire():
+            print("❌ Đang có flusher khác (kiosk / multi_cam đang chạy) giữ journal — không flush.")
+        else:
+            ok = w._drain_safe()
+            w._flush_lock.release()
+            print("✅ Đã đẩy hết backlog." if ok else f"❌ Chưa đẩy được ({w.last_error}), backlog giữ nguyên.")
+    print(w.format_stats())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+# app/export_stream.py
+# Xuất bảng chấm công theo khoảng ngày ra .xlsx / .csv theo kiểu "dòng chảy": đọc DB theo lô
+# (DB.stream) và ghi từng dòng ngay (openpyxl write-only hoặc csv) -> bộ nhớ phẳng với mọi khoảng ngày.
+#
+#   python -m app.export_stream 2025-01-01 2025-12-31 chamcong_2025.xlsx
+#   python -m app.export_stream 2025-01-01 2025-01-31 baocao_01.xlsx --report   # báo cáo tổng hợp
+import argparse, csv, os
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+from app.db import DB
+from app.reports import daily_summary, department_summary, employee_summary, sql_hhmm
+
+CHUNK = 2000
+XLSX_MAX_ROWS = 1_048_576 - 1      # giới hạn 1 sheet Excel (trừ dòng tiêu đề)
+
+HEADERS = ["ma_nv", "ten_nv", "ngay", "check_in", "check_out", "total_seconds", "note", "total_hhmm"]
+
+SQL_COUNT = "SELECT COUNT(*) AS c FROM chamcong WHERE ngay BETWEEN %s AND %s"
+SQL_ROWS = ("SELECT ma_nv, ten_nv, ngay, check_in, check_out, total_seconds, note, "
+            f"{sql_hhmm('total_seconds')} AS total_hhmm "
+            "FROM chamcong WHERE ngay BETWEEN %s AND %s ORDER BY ngay, ma_nv")
+
+# báo cáo tổng hợp: (tên sheet, hàm lấy dữ liệu đã GROUP BY trong MySQL, [(cột, tiêu đề)])
+REPORT_SHEETS = [
+    ("Theo nhân viên", employee_summary,
+     [("ma_nv", "Mã NV"), ("ten_nv", "Họ tên"), ("phongban", "Phòng ban"), ("so_ngay", "Số ngày công"),
+      ("so_muon", "Số ngày đi muộn"), ("thieu_checkout", "Thiếu check-out"), ("tong_giay", "Tổng giây"),
+      ("tong_gio", "Tổng giờ")]),
+    ("Theo ngày", daily_summary,
+     [("ngay", "Ngày"), ("so_check_in", "Số NV chấm công"), ("so_muon", "Đi muộn"),
+      ("so_check_out", "Đã check-out"), ("tong_giay", "Tổng giây"), ("tong_gio", "Tổng giờ")]),
+    ("Theo phòng ban", department_summary,
+     [("phongban", "Phòng ban"), ("so_check_in", "Lượt chấm công"), ("so_muon", "Đi muộn"),
+      ("so_check_out", "Đã check-out"), ("tong_giay", "Tổng giây"), ("tong_gio", "Tổng giờ"),
+      ("tb_gio", "TB giờ / lượt")]),
+]
+
+def _fmt_time(v):
+    # cột TIME của MySQL về Python là timedelta
+    if isinstance(v, timedelta):
+        s = int(v.total_seconds())
+        return f"{s // 3600:02d}:{s % 3600 // 60:02d}:{s % 60:02d}"
+    return v if v is not None else ""
+
+def _fmt_row(r) -> list:
+    ngay = r["ngay"]
+    if isinstance(ngay, (date, datetime)):
+        ngay = ngay.strftime("%d/%m/%Y")
+    return [r["ma_nv"], r["ten_nv"], ngay, _fmt_time(r["check_in"]), _fmt_time(r["check_out"]),
+            r.get("total_seconds"), r.get("note") or "", r["total_hhmm"]]
+
+def _cell(v):
+    if isinstance(v, (date, datetime)):
+        return v.strftime("%d/%m/%Y")
+    if v is None:
+        return ""
+    return int(v) if isinstance(v, Decimal) else v     # SUM() của MySQL trả về Decimal
+
+def count_rows(d1, d2) -> int:
+    return int(DB().q(SQL_COUNT, (d1, d2))[0]["c"])
+
+class _CsvSink:
+    def __init__(self, f):
+        self.w = csv.writer(f)
+        self.w.writerow(HEADERS)
+
+    def write(self, row):
+        self.w.writerow(row)
+
+class _XlsxSink:
+    """openpyxl write-only: mỗi dòng được ghi thẳng ra file tạm, hết 1 sheet thì sang sheet mới."""
+    def __init__(self):
+        from openpyxl import Workbook
+        self.wb = Workbook(write_only=True)
+        self.sheets = 0
+        self._new_sheet()     # luôn có ít nhất 1 sheet (kể cả khi 0 dòng) để save() không lỗi
+
+    def _new_sheet(self):
+        self.sheets += 1
+        self.ws = self.wb.create_sheet("chamcong" if self.sheets == 1 else f"chamcong_{self.sheets}")
+        self.ws.append(HEADERS)
+        self.rows = 0
+
+    def write(self, row):
+        if self.rows >= XLSX_MAX_ROWS:
+            self._new_sheet()
+        self.ws.append(row)
+        self.rows += 1
+
+def export_attendance(path, d1, d2, progress=None, chunk=CHUNK) -> int:
+    """
+    Ghi chamcong trong [d1, d2] ra `path` (.csv -> CSV UTF-8 BOM, còn lại -> .xlsx).
+    progress(text) được gọi sau mỗi lô. Ghi ra file tạm rồi đổi tên -> không để lại file dở.
+    Trả về số dòng đã ghi.
+    """
+    path = Path(path)
+    total = count_rows(d1, d2)
+    tmp = path.with_name(path.name + ".tmp")
+    done = 0
+    try:
+        if path.suffix.lower() == ".csv":
+            f = open(tmp, "w", newline="", encoding="utf-8-sig")   # BOM để Excel đọc đúng tiếng Việt
+            sink = _CsvSink(f)
+        else:
+            f, sink = None, _XlsxSink()
+        try:
+            for rows in DB().stream(SQL_ROWS, (d1, d2), chunk=chunk):
+                for r in rows:
+                    sink.write(_fmt_row(r))
+                done += len(rows)
+                if progress is not None:
+                    pct = 100.0 * done / total if total else 100.0
+                    progress(f"{done}/{total} dòng ({pct:.0f}%)")
+        finally:
+            if f is not None:
+                f.close()
+        if f is None:
+            sink.wb.save(tmp)
+        os.replace(tmp, path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+    return done
+
+def export_report(path, d1, d2, progress=None) -> int:
+    """
+    Báo cáo tổng hợp [d1, d2]: mỗi sheet là 1 bảng trong REPORT_SHEETS (dữ liệu đã tổng hợp sẵn
+    trong MySQL — vài trăm dòng thay vì toàn bộ chamcong). .csv chỉ có sheet đầu (theo nhân viên).
+    Trả về số dòng đã ghi.
+    """
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    sheets = REPORT_SHEETS[:1] if path.suffix.lower() == ".csv" else REPORT_SHEETS
+    done = 0
+    try:
+        if path.suffix.lower() == ".csv":
+            f = open(tmp, "w", newline="", encoding="utf-8-sig")
+            emit, wb = csv.writer(f).writerow, None
+        else:
+            from openpyxl import Workbook
+            f, wb = None, Workbook(write_only=True)
+        try:
+            for title, fetch, cols in sheets:
+                if progress is not None:
+                    progress(f"Tổng hợp {title.lower()}...")
+                rows = fetch(d1, d2)
+                if wb is not None:
+                    emit = wb.create_sheet(title).append
+                emit([h for _, h in cols])
+                for r in rows:
+                    emit([_cell(r[k]) for k, _ in cols])
+                done += len(rows)
+        finally:
+            if f is not None:
+                f.close()
+        if wb is not None:
+            wb.save(tmp)
+        os.replace(tmp, path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+    return done
+
+def main():
+    ap = argparse.ArgumentParser(description="Xuất chấm công theo khoảng ngày (.xlsx / .csv)")
+    ap.add_argument("d1", help="từ ngày YYYY-MM-DD")
+    ap.add_argument("d2", help="đến ngày YYYY-MM-DD")
+    ap.add_argument("out", help="file .xlsx hoặc .csv")
+    ap.add_argument("--chunk", type=int, default=CHUNK)
+    ap.add_argument("--report", action="store_true", help="xuất báo cáo tổng hợp thay vì từng dòng chấm công")
+    args = ap.parse_args()
+    if args.report:
+        n = export_report(args.out, args.d1, args.d2, progress=lambda t: print("  ...", t))
+        print(f"✅ Đã xuất báo cáo ({n} dòng tổng hợp): {args.out}")
+        return
+    n = export_attendance(args.out, args.d1, args.d2, progress=lambda t: print("  ...", t), chunk=args.chunk)
+    print(f"✅ Đã xuất {n} dòng: {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# app/gallery.py
+# Giữ FaceMatcher hiện hành cho process đang chạy và nạp lại khi kho embeddings đổi
+# (sau khi encode_sync chạy cho nhân viên mới) — không cần khởi động lại kiosk.
+import os, signal, threading
+import numpy as np
+
+from app.config import EMBEDDINGS_NPY, LABELS_JSON, PROTOTYPES_NPZ, ANN_INDEX_NPZ
+from app.matcher import FaceMatcher
+
+WATCH_FILES = (EMBEDDINGS_NPY, LABELS_JSON, PROTOTYPES_NPZ, ANN_INDEX_NPZ)
+
+def _signature():
+    sig = []
+    for p in WATCH_FILES:
+        try:
+            st = os.stat(p)
+            sig.append((st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            sig.append(None)
+    return tuple(sig)
+
+def _label_digests(m: FaceMatcher) -> dict:
+    """{label: (số dòng, tổng)} — so 2 gallery để biết người nào thêm/xóa/đổi ảnh."""
+    out = {}
+    for gid, s, e in zip(m.group_ids, m.starts, m.ends):
+        out[m.classes[gid]] = (int(e - s), float(np.asarray(m.embs[s:e], dtype=np.float64).sum()))
+    return out
+
+class GalleryHolder:
+    """
+    - .matcher: FaceMatcher hiện tại; worker đọc thuộc tính này mỗi lần nhận diện.
+      Đổi gallery = gán tham chiếu mới (nguyên tử) -> frame đang xử lý vẫn dùng bản cũ, không rớt frame.
+    - start_watch(): luồng nền kiểm tra mtime các file kho mỗi `interval` giây; file đứng yên
+      1 nhịp (ghi xong) mới nạp, nạp lỗi (đang ghi dở) thì giữ bản cũ và thử lại.
+    - reload(): nạp lại ngay (gọi tay / từ UI sau encode_sync / SIGHUP nếu install_signal()).
+    - on_reload(added, removed, changed): callback tuỳ chọn, chỉ nhận các nhãn thay đổi.
+    """
+    def __init__(self, interval=2.0, on_reload=None):
+        self.interval = interval
+        self.on_reload = on_reload
+        self._sig = _signature()
+        self.matcher = FaceMatcher.from_store()
+        self._digests = _label_digests(self.matcher)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.reloads = 0
+
+    def __len__(self):
+        return len(self.matcher)
+
+    def reload(self) -> bool:
+        with self._lock:
+            sig = _signature()
+            try:
+                new = FaceMatcher.from_store()
+            except Exception as e:
+                print(f"⚠️ Chưa nạp lại được encodings: {e}")
+                return False
+            digests = _label_digests(new)
+            old = self._digests
+            added = sorted(set(digests) - set(old))
+            removed = sorted(set(old) - set(digests))
+            changed = sorted(k for k in set(digests) & set(old) if digests[k] != old[k])
+            self.matcher = new
+            self._digests = digests
+            self._sig = sig
+            self.reloads += 1
+        print(f"🔄 Đã nạp lại encodings: {len(new)} mặt / {len(digests)} người "
+              f"(+{len(added)} -{len(removed)} ~{len(changed)})")
+        if self.on_reload and (added or removed or changed):
+            try:
+                self.on_reload(added, removed, changed)
+            except Exception:
+                pass
+        return True
+
+    def _watch(self):
+        pending = None
+        while not self._stop.wait(self.interval):
+            sig = _signature()
+            if sig == self._sig:
+                pending = None
+                continue
+            if sig != pending:      # vừa đổi -> chờ thêm 1 nhịp cho ghi xong
+                pending = sig
+                continue
+            if self.reload():
+                pending = None
+
+    def start_watch(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._watch, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def install_signal(self):
+        """POSIX: `kill -HUP <pid>` để nạp lại. Windows không có SIGHUP -> bỏ qua."""
+        if hasattr(signal, "SIGHUP") and threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGHUP, lambda *_: threading.Thread(target=self.reload, daemon=True).start())
+        return self
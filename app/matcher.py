@@ -0,0 +1,193 @@
+# app/matcher.py
+# So khớp khuôn mặt với gallery: dựng 1 lần, mỗi truy vấn chỉ 1 phép nhân ma trận (BLAS).
+#   ||q - g||^2 = ||q||^2 + ||g||^2 - 2 q·g   (||g||^2 tính sẵn lúc dựng)
+import numpy as np
+
+from app.encoding_loaded import load_gallery
+from app.embedding_store import load_prototypes
+from app.ann_index import sq_l2, load_index
+
+def _kmeans(x, k, iters=10):
+    """k-means nhỏ cho 1 người (khởi tạo farthest-point để ổn định, không random)."""
+    centers = [x.mean(axis=0)]
+    for _ in range(1, k):
+        d = np.min([np.sum((x - c) ** 2, axis=1) for c in centers], axis=0)
+        centers.append(x[int(np.argmax(d))])
+    centers = np.array(centers, dtype=np.float32)
+    for _ in range(iters):
+        assign = np.argmin(((x[:, None, :] - centers[None, :, :]) ** 2).sum(-1), axis=1)
+        for j in range(k):
+            pts = x[assign == j]
+            if len(pts):
+                centers[j] = pts.mean(axis=0)
+    return centers
+
+def build_prototypes(embeddings, ids, per_label=3):
+    """Mỗi nhãn -> tối đa `per_label` tâm cụm. Trả về (centroids (P,128), ids (P,))."""
+    embs = np.asarray(embeddings, dtype=np.float32).reshape(-1, 128)
+    ids = np.asarray(ids, dtype=np.int32)
+    cents, cids = [], []
+    for lid in np.unique(ids):
+        x = embs[ids == lid]
+        k = max(1, min(per_label, len(x)))
+        c = _kmeans(x, k) if k > 1 else x.mean(axis=0, keepdims=True)
+        cents.append(c); cids.extend([int(lid)] * len(c))
+    if not cents:
+        return np.empty((0, 128), dtype=np.float32), np.empty((0,), dtype=np.int32)
+    return np.vstack(cents).astype(np.float32), np.asarray(cids, dtype=np.int32)
+
+class FaceMatcher:
+    """
+    Gallery (N,128) float32 đã sắp theo nhãn để tính khoảng cách nhỏ nhất theo từng người
+    bằng np.minimum.reduceat.
+    - search(encs, k): top-k NGƯỜI gần nhất cho từng mặt truy vấn -> [[(label, dist), ...], ...]
+    - identify(encs, tolerance, margin): nhãn (hoặc None) + khoảng cách + khoảng cách người thứ 2
+    Nếu có `prototypes` (vài tâm cụm/người): identify so tâm cụm trước để chọn ứng viên
+    (trong khoảng `refine_band` quanh người gần nhất), rồi so toàn bộ ảnh của ứng viên.
+    Người thắng (và người thứ 2 khi có `margin`) luôn được tính lại chính xác trước khi chấp nhận.
+    Nếu có `index` (app.ann_index, dựng trên gallery theo thứ tự kho): identify chỉ xét
+    `index_k` dòng gần nhất do index trả về (gần đúng, dành cho gallery rất lớn).
+    """
+    def __init__(self, embeddings, ids, classes, prototypes=None, refine_band=0.08,
+                 index=None, index_k=32):
+        embs = np.asarray(embeddings, dtype=np.float32).reshape(-1, 128)
+        ids = np.asarray(ids, dtype=np.int32)
+        self.row_ids = ids            # nhãn theo thứ tự kho (để đọc kết quả của index)
+        self.index = index
+        self.index_k = index_k
+        if len(ids) > 1 and np.any(ids[1:] < ids[:-1]):
+            order = np.argsort(ids, kind="stable")   # kho cũ / pickle: sắp lại (có copy)
+            self.embs = np.ascontiguousarray(embs[order])
+            self.ids = ids[order]
+        else:
+            self.embs = np.ascontiguousarray(embs)    # kho .npy đã sắp theo nhãn: giữ nguyên mmap
+            self.ids = ids
+        self.classes = list(classes)
+        self.sq_norms = np.einsum("ij,ij->i", self.embs, self.embs)
+        # mỗi nhóm nhãn là 1 đoạn liên tiếp: group_ids[j] bắt đầu tại starts[j]
+        self.group_ids, self.starts = np.unique(self.ids, return_index=True)
+        self.ends = np.append(self.starts[1:], len(self.ids))
+        self.refine_band = refine_band
+        self.protos = None
+        if prototypes is not None and len(prototypes[0]):
+            p_embs, p_ids = prototypes
+            p_order = np.argsort(p_ids, kind="stable")
+            p_embs = np.ascontiguousarray(np.asarray(p_embs, dtype=np.float32)[p_order])
+            p_ids = np.asarray(p_ids, dtype=np.int32)[p_order]
+            p_groups, p_starts = np.unique(p_ids, return_index=True)
+            if np.array_equal(p_groups, self.group_ids):
+                self.protos = (p_embs, np.einsum("ij,ij->i", p_embs, p_embs), p_starts)
+
+    @classmethod
+    def from_store(cls, use_prototypes=True, use_index=True):
+        embs, ids, classes = load_gallery()
+        protos = load_prototypes(classes) if use_prototypes else None
+        index = load_index(embs) if use_index else None
+        return cls(embs, ids, classes, prototypes=protos, index=index)
+
+    def __len__(self):
+        return len(self.embs)
+
+    def sq_distances(self, encs) -> np.ndarray:
+        """Bình phương khoảng cách L2 (M,N) cho M mặt truy vấn — 1 lần gọi GEMM/GEMV."""
+        q = np.asarray(encs, dtype=np.float32).reshape(-1, 128)
+        return sq_l2(q, self.embs, self.sq_norms)
+
+    def _per_label(self, d2):
+        """(M,N) -> (M,L): khoảng cách bình phương nhỏ nhất theo từng người."""
+        return np.minimum.reduceat(d2, self.starts, axis=1)
+
+    def search(self, encs, k=2):
+        if len(self.embs) == 0:
+            return [[] for _ in range(len(np.atleast_2d(encs)))]
+        lab = self._per_label(self.sq_distances(encs))
+        k = min(k, lab.shape[1])
+        top = np.argpartition(lab, k - 1, axis=1)[:, :k]
+        out = []
+        for i in range(lab.shape[0]):
+            cols = top[i][np.argsort(lab[i, top[i]])]
+            out.append([(self.classes[self.group_ids[c]], float(np.sqrt(lab[i, c]))) for c in cols])
+        return out
+
+    def _coarse(self, q):
+        """Khoảng cách thô theo người (M,L): tới tâm cụm gần nhất của người đó."""
+        p_embs, p_sq, p_starts = self.protos
+        return np.sqrt(np.minimum.reduceat(sq_l2(q, p_embs, p_sq), p_starts, axis=1))
+
+    @staticmethod
+    def _top2(row):
+        """(cột gần nhất, cột gần thứ 2 | None) của 1 hàng khoảng cách theo người."""
+        if row.shape[0] == 1:
+            return 0, None
+        two = np.argpartition(row, 1)[:2]
+        two = two[np.argsort(row[two])]
+        return int(two[0]), int(two[1])
+
+    def _refine(self, qi_vec, lab_row, cols):
+        """Tính lại khoảng cách chính xác cho 1 truy vấn với các người `cols`."""
+        q = qi_vec[None, :]
+        for c in cols:
+            s, e = self.starts[c], self.ends[c]
+            lab_row[c] = np.sqrt(sq_l2(q, self.embs[s:e], self.sq_norms[s:e]).min())
+
+    def _identify_ann(self, q, tolerance, margin):
+        """Dùng ANN index: lấy index_k dòng gần nhất rồi chọn 2 người khác nhau gần nhất."""
+        idx, d2 = self.index.search(q, self.index_k)
+        res = []
+        for i in range(len(q)):
+            best = []   # [(label_id, dist)] tối đa 2 người khác nhau
+            for r, dd in zip(idx[i], d2[i]):
+                if r < 0:
+                    break
+                lid = int(self.row_ids[r])
+                if not best or (len(best) == 1 and best[0][0] != lid):
+                    best.append((lid, float(np.sqrt(dd))))
+                if len(best) == 2:
+                    break
+            if not best:
+                res.append((None, float("inf"), float("inf")))
+                continue
+            lid, dist = best[0]
+            second = best[1][1] if len(best) > 1 else float("inf")
+            ok = dist <= tolerance and (second - dist) >= margin
+            res.append((self.classes[lid] if ok else None, dist, second))
+        return res
+
+    def identify(self, encs, tolerance, margin=0.0):
+        """
+        Trả về list (label|None, dist, second_dist) cho từng mặt.
+        Chấp nhận khi dist <= tolerance và người gần thứ 2 cách xa hơn ít nhất `margin`.
+        """
+        q = np.asarray(encs, dtype=np.float32).reshape(-1, 128)
+        if len(self.embs) == 0:
+            return [(None, float("inf"), float("inf")) for _ in range(len(q))]
+        if self.index is not None:
+            return self._identify_ann(q, tolerance, margin)
+
+        if self.protos is not None:
+            # tâm cụm chỉ để chọn ứng viên: tâm có thể gần truy vấn hơn mọi ảnh thật của người đó
+            lab = self._coarse(q)
+            for i in range(len(q)):
+                exact = np.zeros(lab.shape[1], dtype=bool)
+                cols = np.flatnonzero(lab[i] <= lab[i].min() + self.refine_band + margin)
+                self._refine(q[i], lab[i], cols)
+                exact[cols] = True
+                while True:   # người thắng / thứ 2 mới nổi lên sau khi tính lại -> tính chính xác nốt
+                    c1, c2 = self._top2(lab[i])
+                    need = [c for c in ((c1, c2) if margin > 0 else (c1,)) if c is not None and not exact[c]]
+                    if not need:
+                        break
+                    self._refine(q[i], lab[i], need)
+                    exact[need] = True
+        else:
+            lab = np.sqrt(self._per_label(self.sq_distances(q)))
+
+        res = []
+        for i in range(len(q)):
+            row = lab[i]
+            c1, c2 = self._top2(row)
+            second = float(row[c2]) if c2 is not None else float("inf")
+            dist = float(row[c1])
+            ok = dist <= tolerance and (second - dist) >= margin
+            res.append((self.classes[self.group_ids[c1]] if ok else None, dist, second))
+        return res
@@ -0,0 +1,181 @@
+# app/migrate.py
+# Migration schema MySQL có đánh số phiên bản. Mỗi file trong migrations/ là 1 bước:
+#   NNNN_ten.sql : các câu lệnh SQL, ngăn bởi ';' cuối dòng (dòng bắt đầu bằng -- là chú thích)
+#   NNNN_ten.py  : có hàm up(cur) — cho bước cần kiểm tra schema hiện tại (nâng cấp DB cũ...)
+# Bước đã chạy được ghi vào bảng schema_migrations (kèm checksum); chạy lại chỉ áp dụng bước mới.
+#
+#   python -m app.migrate              # áp dụng mọi bước chưa chạy
+#   python -m app.migrate status       # xem bước nào đã / chưa chạy
+#   python -m app.migrate up --to 0002 --dry-run
+import argparse, hashlib, importlib.util, re, time
+
+from app.config import MIGRATIONS_DIR
+from app.db import DB
+
+LOCK_NAME = "faceid_schema_migrate"
+_FILE_RE = re.compile(r"^(\d{4})_([\w\-]+)\.(sql|py)$")
+
+class Migration:
+    def __init__(self, path):
+        m = _FILE_RE.match(path.name)
+        self.path = path
+        self.version, self.name, self.kind = m.group(1), m.group(2), m.group(3)
+        self.checksum = hashlib.sha1(path.read_bytes()).hexdigest()
+
+    def __repr__(self):
+        return f"{self.version}_{self.name}.{self.kind}"
+
+    def statements(self):
+        return split_sql(self.path.read_text(encoding="utf-8"))
+
+    def run(self, cur):
+        if self.kind == "sql":
+            for stmt in self.statements():
+                cur.execute(stmt)
+        else:
+            spec = importlib.util.spec_from_file_location(f"migration_{self.version}", self.path)
+            mod = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(mod)
+            mod.up(cur)
+
+def split_sql(text: str):
+    """Tách script thành từng câu lệnh (bỏ dòng chú thích --, ';' cuối dòng kết thúc câu)."""
+    out, buf = [], []
+    for line in text.splitlines():
+        if line.strip().startswith("--"):
+            continue
+        buf.append(line)
+        if line.rstrip().endswith(";"):
+            stmt = "\n".join(buf).strip().rstrip(";").strip()
+            if stmt:
+                out.append(stmt)
+            buf = []
+    rest = "\n".join(buf).strip()
+    if rest:
+        out.append(rest)
+    return out
+
+def discover(directory=MIGRATIONS_DIR):
+    found = [Migration(p) for p in sorted(directory.iterdir()) if _FILE_RE.match(p.name)]
+    versions = [m.version for m in found]
+    dup = {v for v in versions if versions.count(v) > 1}
+    if dup:
+        raise RuntimeError(f"Trùng số phiên bản migration: {sorted(dup)}")
+    return found
+
+# ---- tiện ích cho migration .py ----
+def _fetch_one(cur, sql, params=()):
+    cur.execute(sql, params)
+    return cur.fetchone()
+
+def has_table(cur, table) -> bool:
+    return bool(_fetch_one(cur, "SELECT COUNT(*) FROM information_schema.TABLES "
+                                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s", (table,))[0])
+
+def has_column(cur, table, column) -> bool:
+    return bool(_fetch_one(cur, "SELECT COUNT(*) FROM information_schema.COLUMNS "
+                                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s",
+                           (table, column))[0])
+
+def has_index(cur, table, index) -> bool:
+    return bool(_fetch_one(cur, "SELECT COUNT(*) FROM information_schema.STATISTICS "
+                                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s",
+                           (table, index))[0])
+
+def add_column(cur, table, column, definition):
+    if not has_column(cur, table, column):
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+def add_index(cur, table, index, definition):
+    if not has_index(cur, table, index):
+        cur.execute(f"ALTER TABLE {table} ADD {definition}")
+
+# ---- trạng thái ----
+def _ensure_table(cur):
+    cur.execute(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "  version VARCHAR(16) NOT NULL PRIMARY KEY,"
+        "  name VARCHAR(200) NOT NULL,"
+        "  checksum CHAR(40) NOT NULL,"
+        "  applied_at DATETIME NOT NULL,"
+        "  duration_ms INT NOT NULL"
+        ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4")
+
+def _applied(cur) -> dict:
+    cur.execute("SELECT version, checksum FROM schema_migrations")
+    return {v: c for v, c in cur.fetchall()}
+
+def status():
+    with DB().connection() as cn:
+        cur = cn.cursor()
+        try:
+            _ensure_table(cur)
+            applied = _applied(cur)
+        finally:
+            cur.close()
+    rows = []
+    for m in discover():
+        if m.version not in applied:
+            state = "chưa chạy"
+        elif applied[m.version] != m.checksum:
+            state = "ĐÃ CHẠY (file đã sửa sau đó!)"
+        else:
+            state = "đã chạy"
+        rows.append((m, state))
+    return rows
+
+def migrate(target=None, dry_run=False) -> int:
+    """Áp dụng các bước chưa chạy (tới `target` nếu có). Trả về số bước đã áp dụng."""
+    n = 0
+    with DB().connection() as cn:
+        cur = cn.cursor()
+        try:
+            # khóa mức server: 2 máy cùng chạy migrate thì máy sau chờ
+            if not _fetch_one(cur, "SELECT GET_LOCK(%s, 30)", (LOCK_NAME,))[0]:
+                raise TimeoutError("Đang có tiến trình migrate khác chạy")
+            try:
+                _ensure_table(cur)
+                applied = _applied(cur)
+                for m in discover():
+                    if target and m.version > target:
+                        break
+                    if m.version in applied:
+                        if applied[m.version] != m.checksum:
+                            print(f"⚠️ {m}: file đã sửa sau khi chạy — không chạy lại, hãy tạo bước mới.")
+                        continue
+                    if dry_run:
+                        print(f"• sẽ chạy {m}")
+                        if m.kind == "sql":
+                            for stmt in m.statements():
+                                print("    " + stmt.splitlines()[0][:100])
+                        n += 1
+                        continue
+                    print(f"➡ {m} ...", flush=True)
+                    t0 = time.perf_counter()
+                    m.run(cur)      # DDL của MySQL tự commit -> mỗi bước phải chạy lại được an toàn
+                    ms = int((time.perf_counter() - t0) * 1000)
+                    cur.execute("INSERT INTO schema_migrations (version, name, checksum, applied_at, duration_ms) "
+                                "VALUES (%s, %s, %s, NOW(), %s)", (m.version, m.name, m.checksum, ms))
+                    print(f"✅ {m} ({ms} ms)")
+                    n += 1
+            finally:
+                _fetch_one(cur, "SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+        finally:
+            cur.close()
+    return n
+
+def main():
+    ap = argparse.ArgumentParser(description="Migration schema MySQL (migrations/NNNN_*.sql|.py)")
+    ap.add_argument("cmd", nargs="?", default="up", choices=["up", "status"])
+    ap.add_argument("--to", default=None, help="chỉ chạy tới phiên bản này (vd 0002)")
+    ap.add_argument("--dry-run", action="store_true", help="chỉ in các bước sẽ chạy")
+    args = ap.parse_args()
+    if args.cmd == "status":
+        for m, state in status():
+            print(f"  {m}: {state}")
+        return
+    n = migrate(target=args.to, dry_run=args.dry_run)
+    print("Schema đã mới nhất." if n == 0 else f"{'Sẽ chạy' if args.dry_run else 'Đã chạy'} {n} bước.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# app/motion.py
+# Cổng chuyển động rẻ tiền: so sánh ảnh xám rất nhỏ giữa các frame, chỉ cho chạy
+# detect khuôn mặt khi khung hình thay đổi (hoặc định kỳ keep-alive) -> hành lang trống gần như không tốn CPU.
+import threading, time
+import cv2
+import numpy as np
+
+class MotionGate:
+    """
+    should_detect(frame) -> bool
+      - thumbnail xám `size`, làm mờ, so với ảnh nền (cập nhật chậm theo `alpha`)
+      - tỉ lệ điểm ảnh đổi > `min_area` (ngưỡng độ sáng `pixel_thr`) => có chuyển động
+      - sau khi có chuyển động vẫn cho detect thêm `hold_s` giây (người đứng yên trước camera)
+      - không có gì vẫn detect 1 lần mỗi `keepalive_s` giây
+    """
+    def __init__(self, size=(64, 48), pixel_thr=18, min_area=0.01, alpha=0.05,
+                 hold_s=2.0, keepalive_s=5.0):
+        self.size = size
+        self.pixel_thr = pixel_thr
+        self.min_area = min_area
+        self.alpha = alpha
+        self.hold_s = hold_s
+        self.keepalive_s = keepalive_s
+        self._bg = None
+        self._active_until = 0.0
+        self._last_detect = 0.0
+        self._lock = threading.Lock()
+        self.passed = 0
+        self.skipped = 0
+
+    def _thumb(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        small = cv2.resize(gray, self.size, interpolation=cv2.INTER_AREA)
+        return cv2.GaussianBlur(small, (5, 5), 0).astype(np.float32)
+
+    def should_detect(self, frame, now=None) -> bool:
+        now = time.monotonic() if now is None else now
+        thumb = self._thumb(frame)
+        with self._lock:
+            if self._bg is None:
+                self._bg = thumb
+                moved = True
+            else:
+                changed = np.abs(thumb - self._bg) > self.pixel_thr
+                moved = float(changed.mean()) > self.min_area
+                cv2.accumulateWeighted(thumb, self._bg, self.alpha)
+            if moved:
+                self._active_until = now + self.hold_s
+            ok = now < self._active_until or now - self._last_detect >= self.keepalive_s
+            if ok:
+                self._last_detect = now
+                self.passed += 1
+            else:
+                self.skipped += 1
+            return ok
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"passed": self.passed, "skipped": self.skipped}
@@ -0,0 +1,178 @@
+# app/multi_cam.py
+# Dịch vụ chấm công nhiều camera trong 1 process: dùng chung 1 gallery/FaceMatcher,
+# 1 JournalWriter (journal + flusher MySQL) và 1 nhóm worker nhận diện; mỗi camera có tracker/motion gate riêng.
+#
+#   python -m app.multi_cam 0 1 rtsp://10.0.0.5/stream door2.mp4 --workers 4
+import argparse, itertools, os, threading, time
+
+from app.gallery import GalleryHolder
+from app.tracker import IoUTracker
+from app.motion import MotionGate
+from app.pipeline import FrameGrabber
+from app.attendance_writer import AttendanceWriter
+from app.event_journal import JournalWriter
+from app.attendance_cam import (_recognize, _make_event, _open_camera, _prepare_frame,
+                                DOWNSCALE, COOLDOWN_S, REVERIFY_S, KEEPALIVE_S)
+from app.offline_attendance import FrameSource, _dry_run_event
+
+STATS_EVERY_S = 10.0
+
+class CameraChannel:
+    """1 nguồn camera: grabber + tracker + motion gate + bộ đếm riêng."""
+    def __init__(self, name, cap):
+        self.name = name
+        self.cap = cap
+        self.grabber = FrameGrabber(cap, prepare=_prepare_frame)
+        self.tracker = IoUTracker(reverify_s=REVERIFY_S)
+        self.gate = MotionGate(keepalive_s=KEEPALIVE_S)
+        self._lock = threading.Lock()
+        self.inflight = threading.Lock()   # tối đa 1 frame / camera đang xử lý -> tracker nhận frame đúng thứ tự
+        self.processed = 0
+        self.gated = 0
+        self.events = 0
+        self.lat_total_ms = 0.0
+        self.lat_max_ms = 0.0
+        self._t_window = time.perf_counter()
+        self._n_window = 0
+
+    def record(self, latency_ms, gated):
+        with self._lock:
+            if gated:
+                self.gated += 1
+                return
+            self.processed += 1
+            self._n_window += 1
+            self.lat_total_ms += latency_ms
+            self.lat_max_ms = max(self.lat_max_ms, latency_ms)
+
+    def add_event(self):
+        with self._lock:
+            self.events += 1
+
+    def format_stats(self) -> str:
+        with self._lock:
+            now = time.perf_counter()
+            rec_hz = self._n_window / max(now - self._t_window, 1e-6)
+            self._t_window, self._n_window = now, 0
+            avg = self.lat_total_ms / self.processed if self.processed else 0.0
+            return (f"[{self.name}] cam {self.grabber.fps:.1f}fps | rec {rec_hz:.1f}/s | "
+                    f"lat avg {avg:.0f}ms max {self.lat_max_ms:.0f}ms | gated {self.gated} | events {self.events}")
+
+class MultiCamServer:
+    """
+    Worker dùng chung quét vòng các camera, mỗi lần nhận 1 frame MỚI NHẤT chưa ai xử lý
+    (FrameGrabber.wait_newer(claim=True)) -> camera chậm/nhanh không giành hết worker.
+    Mỗi camera chỉ có 1 frame đang xử lý (CameraChannel.inflight): camera đang bận thì worker
+    sang camera khác, tracker của camera không bị cập nhật lệch thứ tự.
+    Cooldown theo mã NV dùng chung giữa các cổng (1 người không bị chấm 2 lần ở 2 camera).
+    """
+    def __init__(self, sources, workers=None, dry_run=False):
+        self.gallery = GalleryHolder()   # dùng chung, tự nạp lại khi kho encodings đổi
+        self.channels = []
+        for src in sources:
+            cap = _open_camera(int(src)) if str(src).isdigit() else FrameSource(src, realtime=True)
+            if not cap.isOpened():
+                print(f"❌ Không mở được nguồn: {src}")
+                continue
+            self.channels.append(CameraChannel(f"cam{len(self.channels)}:{src}", cap))
+        self.n_workers = workers or max(1, (os.cpu_count() or 2) // 2)
+        self.writer = AttendanceWriter(_dry_run_event) if dry_run else JournalWriter(_make_event)
+        self._cooldown = {}
+        self._cd_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._rr = itertools.count()
+        self._threads = []
+
+    def _allow(self, ma_nv):
+        now = time.time()
+        with self._cd_lock:
+            if now - self._cooldown.get(ma_nv, 0.0) < COOLDOWN_S:
+                return False
+            self._cooldown[ma_nv] = now
+            return True
+
+    def _work(self):
+        n = len(self.channels)
+        while not self._stop.is_set():
+            start = next(self._rr) % n
+            busy = False
+            for k in range(n):
+                ch = self.channels[(start + k) % n]
+                if not ch.inflight.acquire(blocking=False):
+                    continue
+                try:
+                    _, frame = ch.grabber.wait_newer(0, timeout=0, claim=True)
+                    if frame is None:
+                        continue
+                    busy = True
+                    t0 = time.perf_counter()
+                    try:
+                        res = _recognize(frame, self.gallery.matcher, ch.tracker, DOWNSCALE, ch.gate)
+                    except Exception as e:
+                        print(f"⚠️ [{ch.name}] Lỗi nhận diện: {e}")
+                        continue
+                    ch.record((time.perf_counter() - t0) * 1000.0, res is None)
+                finally:
+                    ch.inflight.release()
+                for label, ma_nv, _ in res or []:
+                    if ma_nv and self._allow(ma_nv) and self.writer.submit(label, ma_nv):
+                        ch.add_event()
+                break
+            if not busy:
+                time.sleep(0.005)
+
+    def run(self, duration=0.0):
+        if not self.channels:
+            print("❌ Không có camera.")
+            return
+        print(f"➡ {len(self.channels)} camera, {self.n_workers} worker, gallery {len(self.gallery)} mặt. "
+              f"Ctrl+C để dừng, SIGHUP để nạp lại encodings.")
+        self.gallery.start_watch().install_signal()
+        self.writer.start()
+        for ch in self.channels:
+            ch.grabber.start()
+        self._threads = [threading.Thread(target=self._work, daemon=True) for _ in range(self.n_workers)]
+        for t in self._threads:
+            t.start()
+        t0 = time.perf_counter()
+        next_stats = t0 + STATS_EVERY_S
+        try:
+            while not (duration and time.perf_counter() - t0 >= duration):
+                time.sleep(0.2)
+                for label, ma_nv, action, rec, _ in self.writer.poll():
+                    print(f"  [{action}] {ma_nv} {label}")
+                if time.perf_counter() >= next_stats:
+                    next_stats += STATS_EVERY_S
+                    for ch in self.channels:
+                        print(ch.format_stats())
+                    print(self.writer.format_stats())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def stop(self):
+        self._stop.set()
+        self.gallery.stop()
+        for t in self._threads:
+            t.join(timeout=2.0)
+        for ch in self.channels:
+            ch.grabber.stop()
+            ch.grabber.join(timeout=1.0)
+            ch.cap.release()
+        self.writer.stop()
+        for ch in self.channels:
+            print(ch.format_stats())
+        print(self.writer.format_stats())
+
+def main():
+    ap = argparse.ArgumentParser(description="Dịch vụ chấm công nhiều camera")
+    ap.add_argument("sources", nargs="+", help="chỉ số camera (0, 1...), URL rtsp/http hoặc file video")
+    ap.add_argument("--workers", type=int, default=0, help="số worker nhận diện dùng chung (0 = CPU/2)")
+    ap.add_argument("--duration", type=float, default=0.0, help="dừng sau N giây (0 = chạy tới Ctrl+C)")
+    ap.add_argument("--dry-run", action="store_true", help="không ghi DB, chỉ in sự kiện")
+    args = ap.parse_args()
+    MultiCamServer(args.sources, workers=args.workers or None, dry_run=args.dry_run).run(args.duration)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+# app/offline_attendance.py
+# Chấm công không cần màn hình / webcam: đọc video, luồng RTSP/HTTP hoặc thư mục ảnh,
+# nhận diện, ghi sự kiện chấm công và in thống kê throughput / độ trễ.
+# Dùng để phát lại video cửa ra vào trên máy Linux thường nhằm đo tải.
+# Mặc định KHÔNG ghi DB (chỉ in sự kiện); --commit mới ghi journal -> MySQL.
+# Giờ sự kiện + cooldown tính theo thời gian trong video (frame / fps), không theo giờ máy.
+#
+#   python -m app.offline_attendance door.mp4                 # nhanh nhất có thể, mọi frame
+#   python -m app.offline_attendance frames/ --stride 3       # thư mục ảnh, 1/3 số frame
+#   python -m app.offline_attendance rtsp://cam/stream --realtime --duration 600
+#   ... door.mp4 --commit --start "2025-01-06 07:45:00"      # ghi thật, video quay từ 07:45
+import argparse, queue, time
+from datetime import datetime, timedelta
+from pathlib import Path
+import cv2
+import numpy as np
+
+from app.matcher import FaceMatcher
+from app.tracker import IoUTracker
+from app.motion import MotionGate
+from app.pipeline import FrameGrabber, RecognitionWorker
+from app.attendance_writer import AttendanceWriter
+from app.event_journal import JournalWriter
+from app.attendance_cam import (_recognize, _make_event, _prepare_frame,
+                                DOWNSCALE, COOLDOWN_S, REVERIFY_S, KEEPALIVE_S)
+
+IMG_EXTS = {".jpg", ".jpeg", ".png", ".bmp"}
+LIVE_PREFIXES = ("rtsp://", "rtmp://", "http://", "https://")
+
+class FrameSource:
+    """
+    Nguồn frame có giao diện giống cv2.VideoCapture (read / isOpened / release).
+    - thư mục: đọc ảnh theo thứ tự tên file (fps giả định = `dir_fps`)
+    - còn lại (file video, rtsp://, http://...): cv2.VideoCapture
+    realtime=True: giãn nhịp đọc theo fps nguồn (mô phỏng camera thật); False: đọc nhanh nhất.
+    """
+    def __init__(self, src, realtime=False, dir_fps=25.0):
+        self.realtime = realtime
+        self.files = None
+        self.cap = None
+        p = Path(src)
+        if p.is_dir():
+            self.files = sorted(f for f in p.iterdir() if f.suffix.lower() in IMG_EXTS)
+            self.fps = dir_fps
+        else:
+            self.cap = cv2.VideoCapture(str(src))
+            fps = self.cap.get(cv2.CAP_PROP_FPS) if self.cap.isOpened() else 0
+            self.fps = fps if fps and fps > 0 else 25.0
+        self.pos = 0
+        self.ended = False
+        self._t0 = None
+
+    def isOpened(self):
+        return bool(self.files) if self.files is not None else self.cap.isOpened()
+
+    def read(self):
+        if self.realtime:
+            if self._t0 is None:
+                self._t0 = time.perf_counter()
+            wait = self._t0 + self.pos / self.fps - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+        if self.files is not None:
+            if self.pos >= len(self.files):
+                self.ended = True
+                return False, None
+            frame = cv2.imread(str(self.files[self.pos]))
+        else:
+            ret, frame = self.cap.read()
+            if not ret:
+                self.ended = True
+                return False, None
+        self.pos += 1
+        return frame is not None, frame
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+
+def _dry_run_event(label, ma_nv, event=None):
+    _, _, ngay, hms, _ = event or _make_event(label, ma_nv)
+    print(f"  [event] {ngay} {hms} {ma_nv} {label}")
+    return label, ma_nv, "dry-run", {"ma_nv": ma_nv}, None
+
+def _pct(xs, p):
+    return float(np.percentile(xs, p)) if xs else 0.0
+
+def run_offline(src, realtime=False, stride=1, commit=False, start=None, duration=0.0, workers=1,
+                use_gate=False):
+    """
+    commit=False: chỉ in sự kiện (không đụng chamcong). commit=True: ghi journal -> MySQL.
+    start: datetime lúc bắt đầu quay — giờ sự kiện = start + vị trí frame. Nguồn trực tiếp (rtsp/http)
+    dùng giờ máy; file / thư mục ảnh mà ghi thật thì bắt buộc có `start`.
+    """
+    live = str(src).lower().startswith(LIVE_PREFIXES)
+    if commit and start is None and not live:
+        print("❌ Ghi thật từ video đã quay cần --start (thời điểm bắt đầu quay).")
+        return None
+    matcher = FaceMatcher.from_store()
+    if len(matcher) == 0:
+        print("❌ Không có dữ liệu encodings.")
+        return None
+    source = FrameSource(src, realtime=realtime)
+    if not source.isOpened():
+        print(f"❌ Không mở được nguồn: {src}")
+        return None
+
+    tracker = IoUTracker(reverify_s=REVERIFY_S)
+    gate = MotionGate(keepalive_s=KEEPALIVE_S) if use_gate else None
+    writer = JournalWriter(_make_event) if commit else AttendanceWriter(_dry_run_event)
+    writer.start()
+    cooldown, latencies = {}, []
+    frames = processed = events = 0
+
+    def _handle(res, fid):
+        """fid: số thứ tự frame (từ 1) -> thời điểm trong video, dùng cho cooldown và giờ sự kiện."""
+        nonlocal events
+        ts = (fid - 1) / source.fps
+        for label, ma_nv, _ in res or []:
+            if ma_nv and ts - cooldown.get(ma_nv, -COOLDOWN_S) >= COOLDOWN_S:
+                cooldown[ma_nv] = ts
+                when = start + timedelta(seconds=ts) if start is not None else datetime.now()
+                events += writer.submit(label, ma_nv, _make_event(label, ma_nv, when))
+
+    t0 = time.perf_counter()
+    try:
+        if not realtime:
+            # tuần tự, xử lý mọi frame thứ `stride` -> kết quả lặp lại được
+            while True:
+                ret, frame = source.read()
+                if not ret:
+                    if source.ended:
+                        break
+                    continue
+                frames += 1
+                if (frames - 1) % stride:
+                    continue
+                t1 = time.perf_counter()
+                res = _recognize(_prepare_frame(frame), matcher, tracker, DOWNSCALE, gate)
+                if res is not None:
+                    latencies.append((time.perf_counter() - t1) * 1000.0)
+                processed += 1
+                _handle(res, source.pos)
+                if duration and time.perf_counter() - t0 >= duration:
+                    break
+        else:
+            # nhịp thật: như camera — luồng đọc giữ frame mới nhất, worker xử lý khi rảnh
+            results = queue.Queue(maxsize=64)
+            grabber = FrameGrabber(source, prepare=_prepare_frame)
+            ws = [RecognitionWorker(grabber, lambda f: _recognize(f, matcher, tracker, DOWNSCALE, gate), results)
+                  for _ in range(max(1, workers))]
+            grabber.start()
+            for w in ws:
+                w.start()
+            while not source.ended and not (duration and time.perf_counter() - t0 >= duration):
+                try:
+                    fid, res, lat = results.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                processed += 1
+                if res is not None:
+                    latencies.append(lat * 1000.0)
+                _handle(res, fid)
+            for w in ws:
+                w.stop()
+            grabber.stop()
+            for w in ws:                 # chờ worker xong frame đang xử lý trước khi dừng writer / in thống kê
+                w.join(timeout=2.0)
+            grabber.join(timeout=1.0)
+            frames = source.pos
+    finally:
+        writer.stop()
+        source.release()
+
+    elapsed = max(time.perf_counter() - t0, 1e-9)
+    stats = {"frames": frames, "processed": processed, "events": events, "elapsed_s": elapsed,
+             "fps_in": frames / elapsed, "fps_processed": processed / elapsed,
+             "lat_p50_ms": _pct(latencies, 50), "lat_p95_ms": _pct(latencies, 95),
+             "lat_max_ms": max(latencies) if latencies else 0.0}
+    print(f"⏱ {frames} frame trong {elapsed:.1f}s — đọc {stats['fps_in']:.1f} fps, "
+          f"xử lý {processed} ({stats['fps_processed']:.1f}/s), sự kiện {events}")
+    print(f"   nhận diện p50={stats['lat_p50_ms']:.1f}ms p95={stats['lat_p95_ms']:.1f}ms "
+          f"max={stats['lat_max_ms']:.1f}ms")
+    st = tracker.stats()
+    print(f"   tracker: encoded={st['encoded']} skipped={st['skipped']}")
+    print("   " + writer.format_stats())
+    return stats
+
+def main():
+    ap = argparse.ArgumentParser(description="Chấm công offline / headless từ video, RTSP hoặc thư mục ảnh")
+    ap.add_argument("source", help="file video, URL rtsp/http, hoặc thư mục ảnh")
+    ap.add_argument("--realtime", action="store_true", help="đọc theo nhịp fps của nguồn (như camera thật)")
+    ap.add_argument("--stride", type=int, default=1, help="chế độ nhanh: xử lý 1 trong N frame")
+    ap.add_argument("--workers", type=int, default=1, help="chế độ realtime: số luồng nhận diện")
+    ap.add_argument("--duration", type=float, default=0.0, help="dừng sau N giây (0 = tới hết nguồn)")
+    ap.add_argument("--motion-gate", action="store_true", help="bật MotionGate như kiosk")
+    ap.add_argument("--commit", action="store_true", help="ghi sự kiện vào journal -> MySQL (mặc định chỉ in)")
+    ap.add_argument("--start", default=None, help="thời điểm bắt đầu quay 'YYYY-MM-DD HH:MM:SS' (giờ sự kiện)")
+    args = ap.parse_args()
+    start = datetime.strptime(args.start, "%Y-%m-%d %H:%M:%S") if args.start else None
+    run_offline(args.source, realtime=args.realtime, stride=max(1, args.stride), commit=args.commit,
+                start=start, duration=args.duration, workers=args.workers, use_gate=args.motion_gate)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# app/pipeline.py
+# Pipeline nhiều luồng cho màn chấm công:
+#   FrameGrabber (đọc camera, chỉ giữ frame mới nhất)
+#     -> RecognitionWorker (1 hoặc vài luồng, nhận diện nhanh nhất CPU cho phép)
+#     -> hàng đợi kết quả có giới hạn -> vòng hiển thị ở luồng chính (chạy theo FPS camera)
+import threading, queue, time
+
+class FrameGrabber(threading.Thread):
+    """
+    Đọc camera liên tục, chỉ giữ frame MỚI NHẤT (frame cũ bị bỏ, không dồn hàng).
+    `prepare(frame)` (tuỳ chọn) chạy ngay trong luồng đọc, ví dụ resize về kích thước chuẩn.
+    """
+    def __init__(self, cap, prepare=None):
+        super().__init__(daemon=True)
+        self.cap = cap
+        self.prepare = prepare
+        self._cond = threading.Condition()
+        self._frame = None
+        self._frame_id = 0
+        self._claimed = 0          # frame mới nhất đã có worker nhận (tránh 2 worker xử lý trùng)
+        self._stop_evt = threading.Event()
+        self.fps = 0.0
+
+    def run(self):
+        t_last, n = time.perf_counter(), 0
+        while not self._stop_evt.is_set():
+            ret, frame = self.cap.read()
+            if not ret or frame is None:
+                time.sleep(0.005)
+                continue
+            if self.prepare:
+                frame = self.prepare(frame)
+            with self._cond:
+                self._frame_id += 1
+                self._frame = frame
+                self._cond.notify_all()
+            n += 1
+            now = time.perf_counter()
+            if now - t_last >= 1.0:
+                self.fps = n / (now - t_last)
+                t_last, n = now, 0
+
+    def wait_newer(self, last_id, timeout=0.5, claim=False):
+        """
+        Chờ tới khi có frame mới hơn `last_id`. Trả về (frame_id, frame) hoặc (last_id, None).
+        claim=True (dùng cho worker): frame đã được worker khác nhận thì không trả lại nữa.
+        """
+        def _floor():
+            return max(last_id, self._claimed) if claim else last_id
+
+        with self._cond:
+            self._cond.wait_for(lambda: self._frame_id > _floor() or self._stop_evt.is_set(), timeout)
+            if self._frame_id <= _floor():
+                return last_id, None
+            if claim:
+                self._claimed = self._frame_id
+            return self._frame_id, self._frame
+
+    def stop(self):
+        self._stop_evt.set()
+        with self._cond:
+            self._cond.notify_all()
+
+def put_latest(q: queue.Queue, item):
+    """Đưa vào hàng đợi có giới hạn; đầy thì bỏ phần tử cũ nhất (ưu tiên dữ liệu mới)."""
+    while True:
+        try:
+            q.put_nowait(item)
+            return
+        except queue.Full:
+            try:
+                q.get_nowait()
+            except queue.Empty:
+                pass
+
+class RecognitionWorker(threading.Thread):
+    """
+    Lấy frame mới nhất từ grabber, gọi `process(frame)` và đẩy (frame_id, result, latency_s)
+    vào `out_q`. Nhiều worker cùng chạy thì mỗi worker tự lấy frame mới nhất khi rảnh.
+    `controller` (tuỳ chọn, có thuộc tính .stride): bỏ qua stride-1 frame giữa 2 lần xử lý.
+    """
+    def __init__(self, grabber: FrameGrabber, process, out_q: queue.Queue, controller=None):
+        super().__init__(daemon=True)
+        self.grabber = grabber
+        self.controller = controller
+        self.process = process
+        self.out_q = out_q
+        self._stop_evt = threading.Event()
+        self.last_latency = 0.0
+
+    def run(self):
+        last_id = 0
+        while not self._stop_evt.is_set():
+            gap = max(1, self.controller.stride) if self.controller else 1
+            fid, frame = self.grabber.wait_newer(last_id + gap - 1, claim=True)
+            if frame is None:
+                continue
+            last_id = fid
+            t0 = time.perf_counter()
+            try:
+                result = self.process(frame)
+            except Exception as e:
+                print(f"⚠️ Lỗi nhận diện: {e}")
+                continue
+            self.last_latency = time.perf_counter() - t0
+            put_latest(self.out_q, (fid, result, self.last_latency))
+
+    def stop(self):
+        self._stop_evt.set()
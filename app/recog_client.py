@@ -0,0 +1,91 @@
+# app/recog_client.py
+# Client mỏng cho app.recog_service: UI / kiosk gọi detect / encode / identify qua HTTP localhost
+# thay vì tự nạp model dlib (khởi động nhanh, chỉ 1 bản model trong RAM).
+import base64, json, threading, urllib.request
+import cv2
+import numpy as np
+
+from app.config import RECOG_SERVICE_URL
+
+def _jpeg_b64(rgb, quality=90) -> str:
+    ok, buf = cv2.imencode(".jpg", cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR), [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("Không nén được ảnh JPEG")
+    return base64.b64encode(buf.tobytes()).decode("ascii")
+
+def _num(x):
+    return float("inf") if x is None else float(x)   # service gửi inf dưới dạng null
+
+class RecognitionClient:
+    """
+    Cùng giao diện với phần cần dùng của detector / FaceMatcher:
+      detect(rgb, upsample) -> [(t, r, b, l)]
+      encode(rgb, boxes)    -> [np.ndarray(128)]
+      identify(encs, tolerance, margin) -> [(label|None, dist, second_dist)]
+      recognize(rgb, ...)   -> [((t, r, b, l), label|None, dist)]  (detect+encode+identify 1 lượt)
+      batch_identify([rgb, ...], ...) -> kết quả recognize cho từng ảnh
+    """
+    def __init__(self, url=RECOG_SERVICE_URL, timeout=10.0):
+        self.url = (url or "").rstrip("/")
+        self.timeout = timeout
+
+    def _call(self, path, payload=None):
+        data = None if payload is None else json.dumps(payload).encode("utf-8")
+        req = urllib.request.Request(self.url + path, data=data,
+                                     headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+            out = json.loads(resp.read().decode("utf-8"))
+        if "error" in out:
+            raise RuntimeError(f"recog_service: {out['error']}")
+        return out
+
+    def health(self) -> dict:
+        return self._call("/health")
+
+    def __len__(self):
+        return int(self.health().get("gallery", 0))
+
+    def detect(self, rgb, upsample=0):
+        out = self._call("/detect", {"image": _jpeg_b64(rgb), "upsample": upsample})
+        return [tuple(b) for b in out["boxes"]]
+
+    def encode(self, rgb, boxes):
+        out = self._call("/encode", {"image": _jpeg_b64(rgb), "boxes": [list(b) for b in boxes]})
+        return [np.asarray(e, dtype=np.float32) for e in out["encodings"]]
+
+    def identify(self, encs, tolerance, margin=0.0):
+        encs = np.asarray(encs, dtype=np.float32).reshape(-1, 128)
+        out = self._call("/identify", {"encodings": encs.tolist(), "tolerance": tolerance, "margin": margin})
+        return [(r["label"], _num(r["dist"]), _num(r["second"])) for r in out["results"]]
+
+    def recognize(self, rgb, tolerance, margin=0.0, upsample=0):
+        return self.batch_identify([rgb], tolerance, margin, upsample)[0]
+
+    def batch_identify(self, images, tolerance, margin=0.0, upsample=0):
+        out = self._call("/batch_identify", {"images": [_jpeg_b64(im) for im in images],
+                                             "tolerance": tolerance, "margin": margin, "upsample": upsample})
+        return [[(tuple(f["box"]), f["label"], _num(f["dist"])) for f in faces] for faces in out["results"]]
+
+class RemoteDetector:
+    """Detector gọi service (được detectors.get_detector() chọn khi có RECOG_SERVICE_URL)."""
+    name = "remote"
+
+    def __init__(self, client: RecognitionClient):
+        self.client = client
+
+    def detect(self, rgb, upsample=0):
+        return self.client.detect(rgb, upsample)
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """Client dùng chung nếu cấu hình RECOG_SERVICE_URL, ngược lại None (xử lý tại chỗ)."""
+    global _client
+    if not RECOG_SERVICE_URL:
+        return None
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = RecognitionClient(RECOG_SERVICE_URL)
+    return _client
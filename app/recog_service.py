@@ -0,0 +1,189 @@
+# app/recog_service.py
+# Dịch vụ nhận diện chạy nền trên localhost: nạp model dlib + gallery 1 lần, phục vụ
+# UI Tk và các kiosk qua HTTP/JSON (ảnh gửi dạng JPEG base64).
+#
+#   python -m app.recog_service [--host 127.0.0.1] [--port 8765] [--parallel 2]
+#
+#   GET  /health          -> {"ok": true, "gallery": N, "detector": "..."}
+#   POST /detect          {"image", "upsample"}                  -> {"boxes": [[t,r,b,l], ...]}
+#   POST /encode          {"image", "boxes"}                     -> {"encodings": [[128 số], ...]}
+#   POST /identify        {"encodings", "tolerance", "margin"}   -> {"results": [{label, dist, second}]}
+#   POST /batch_identify  {"images", "tolerance", "margin"}      -> {"results": [[{box, label, dist}], ...]}
+#
+# Các yêu cầu identify đến gần nhau (trong BATCH_WINDOW_S) được gom thành 1 phép nhân ma trận.
+import argparse, base64, json, queue, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import cv2
+import numpy as np
+import face_recognition
+
+from app.config import FACE_DETECTOR
+from app.detectors import make_detector
+from app.gallery import GalleryHolder
+
+DEFAULT_PORT   = 8765
+BATCH_WINDOW_S = 0.005
+BATCH_MAX      = 256
+
+def _decode_rgb(b64: str):
+    buf = np.frombuffer(base64.b64decode(b64), dtype=np.uint8)
+    bgr = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+    if bgr is None:
+        raise ValueError("Ảnh không hợp lệ")
+    return cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+
+def _inf_to_none(x):
+    return None if not np.isfinite(x) else float(x)
+
+class IdentifyBatcher(threading.Thread):
+    """Gom các yêu cầu identify từ nhiều luồng HTTP thành 1 lần FaceMatcher.identify."""
+    def __init__(self, gallery: GalleryHolder):
+        super().__init__(daemon=True)
+        self.gallery = gallery
+        self.q = queue.Queue()
+        self.batches = 0
+        self.queries = 0
+
+    def identify(self, encs, tolerance, margin):
+        slot = {"encs": np.asarray(encs, dtype=np.float32).reshape(-1, 128),
+                "key": (float(tolerance), float(margin)), "done": threading.Event()}
+        self.q.put(slot)
+        slot["done"].wait()
+        if "error" in slot:
+            raise slot["error"]
+        return slot["result"]
+
+    def run(self):
+        while True:
+            items = [self.q.get()]
+            deadline = time.perf_counter() + BATCH_WINDOW_S
+            n = len(items[0]["encs"])
+            while n < BATCH_MAX:
+                try:
+                    it = self.q.get(timeout=max(0.0, deadline - time.perf_counter()))
+                except queue.Empty:
+                    break
+                items.append(it)
+                n += len(it["encs"])
+            groups = {}
+            for it in items:
+                groups.setdefault(it["key"], []).append(it)
+            matcher = self.gallery.matcher
+            for (tol, margin), its in groups.items():
+                try:
+                    allq = np.vstack([it["encs"] for it in its])
+                    res = matcher.identify(allq, tol, margin) if len(allq) else []
+                    pos = 0
+                    for it in its:
+                        it["result"] = res[pos:pos + len(it["encs"])]
+                        pos += len(it["encs"])
+                except Exception as e:
+                    for it in its:
+                        it["error"] = e
+                for it in its:
+                    it["done"].set()
+            self.batches += 1
+            self.queries += n
+
+class RecognitionService:
+    def __init__(self, parallel=2):
+        self.detector = make_detector(FACE_DETECTOR)   # luôn chạy tại chỗ (không phải remote)
+        self.gallery = GalleryHolder().start_watch()
+        self.batcher = IdentifyBatcher(self.gallery)
+        self.batcher.start()
+        self._dlib = threading.Semaphore(max(1, parallel))   # giới hạn số lượt dlib chạy song song
+
+    def detect(self, rgb, upsample=0):
+        with self._dlib:
+            return [list(map(int, b)) for b in self.detector.detect(rgb, upsample)]
+
+    def encode(self, rgb, boxes):
+        if not boxes:
+            return []
+        with self._dlib:
+            encs = face_recognition.face_encodings(rgb, [tuple(b) for b in boxes], num_jitters=1)
+        return [np.asarray(e, dtype=np.float32) for e in encs]
+
+    def identify(self, encs, tolerance, margin=0.0):
+        res = self.batcher.identify(encs, tolerance, margin)
+        return [{"label": l, "dist": _inf_to_none(d), "second": _inf_to_none(s)} for l, d, s in res]
+
+    def batch_identify(self, images, tolerance, margin=0.0, upsample=0):
+        per_img, all_encs = [], []
+        for rgb in images:
+            boxes = self.detect(rgb, upsample)
+            encs = self.encode(rgb, boxes)
+            per_img.append(boxes[:len(encs)])
+            all_encs.extend(encs)
+        res = self.identify(all_encs, tolerance, margin) if all_encs else []
+        out, pos = [], 0
+        for boxes in per_img:
+            out.append([dict(box=b, **res[pos + i]) for i, b in enumerate(boxes)])
+            pos += len(boxes)
+        return out
+
+def make_handler(svc: RecognitionService):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, code, obj):
+            body = json.dumps(obj).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, fmt, *args):   # không in mỗi request
+            pass
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send(200, {"ok": True, "gallery": len(svc.gallery), "detector": svc.detector.name,
+                                 "batches": svc.batcher.batches, "queries": svc.batcher.queries})
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            try:
+                n = int(self.headers.get("Content-Length") or 0)
+                req = json.loads(self.rfile.read(n).decode("utf-8") or "{}")
+                tol = float(req.get("tolerance", 0.5))
+                margin = float(req.get("margin", 0.0))
+                up = int(req.get("upsample", 0))
+                if self.path == "/detect":
+                    out = {"boxes": svc.detect(_decode_rgb(req["image"]), up)}
+                elif self.path == "/encode":
+                    encs = svc.encode(_decode_rgb(req["image"]), req.get("boxes") or [])
+                    out = {"encodings": [e.tolist() for e in encs]}
+                elif self.path == "/identify":
+                    out = {"results": svc.identify(req.get("encodings") or [], tol, margin)}
+                elif self.path == "/batch_identify":
+                    imgs = [_decode_rgb(b) for b in req.get("images") or []]
+                    out = {"results": svc.batch_identify(imgs, tol, margin, up)}
+                else:
+                    self._send(404, {"error": "not found"})
+                    return
+                self._send(200, out)
+            except Exception as e:
+                self._send(400, {"error": str(e)})
+    return Handler
+
+def main():
+    ap = argparse.ArgumentParser(description="Dịch vụ nhận diện khuôn mặt (localhost HTTP)")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=DEFAULT_PORT)
+    ap.add_argument("--parallel", type=int, default=2, help="số lượt detect/encode dlib chạy song song")
+    args = ap.parse_args()
+    svc = RecognitionService(parallel=args.parallel)
+    srv = ThreadingHTTPServer((args.host, args.port), make_handler(svc))
+    print(f"➡ recog_service: http://{args.host}:{args.port} — detector={svc.detector.name}, "
+          f"gallery {len(svc.gallery)} mặt")
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        srv.server_close()
+        svc.gallery.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# app/reports.py
+# Lớp tổng hợp chấm công: mọi phép đếm / cộng giờ / đếm đi muộn chạy trong MySQL.
+# - theo ngày & phòng ban: đọc bảng chamcong_tonghop (trigger cập nhật dần, migrations/0003)
+# - theo nhân viên: GROUP BY trên chamcong trong khoảng ngày (dùng index (ngay, ...))
+#
+#   python -m app.reports 2025-01-01 2025-01-31     # in tổng hợp theo phòng ban + nhân viên
+#   python -m app.reports --rebuild                  # dựng lại chamcong_tonghop từ chamcong
+import argparse
+
+from app.db import DB
+
+# giây -> 'HH:MM' ngay trong SQL (không đổi từng dòng bằng Python).
+# LPAD cắt chuỗi dài hơn độ dài đích -> phần giờ đệm tới GREATEST(2, số chữ số) để 176h không thành "17".
+def sql_hhmm(expr: str) -> str:
+    secs = f"COALESCE({expr}, 0)"
+    hours = f"FLOOR({secs} / 3600)"
+    return (f"CONCAT(LPAD({hours}, GREATEST(2, CHAR_LENGTH({hours})), '0'), ':', "
+            f"LPAD(FLOOR(MOD({secs}, 3600) / 60), 2, '0'))")
+
+LATE_SQL = "COALESCE(c.note LIKE 'Muộn%', 0)"   # cùng quy ước với attendance_cam._compute_checkin_note
+
+def rebuild_summary(cur=None, d1=None, d2=None):
+    """Tính lại chamcong_tonghop từ chamcong (toàn bộ hoặc trong [d1, d2]), theo chamcong.phongban như trigger."""
+    where, params = ("WHERE c.ngay BETWEEN %s AND %s", (d1, d2)) if d1 and d2 else ("", ())
+    sql_del = "DELETE FROM chamcong_tonghop" + (" WHERE ngay BETWEEN %s AND %s" if params else "")
+    sql_ins = ("INSERT INTO chamcong_tonghop (ngay, phongban, so_check_in, so_check_out, so_muon, tong_giay) "
+               "SELECT c.ngay, COALESCE(c.phongban, ''), SUM(c.check_in IS NOT NULL), SUM(c.check_out IS NOT NULL), "
+               f"SUM({LATE_SQL}), SUM(COALESCE(c.total_seconds, 0)) "
+               f"FROM chamcong c {where} "
+               "GROUP BY c.ngay, COALESCE(c.phongban, '')")
+    if cur is not None:
+        cur.execute(sql_del, params)
+        cur.execute(sql_ins, params)
+        return
+    db = DB()
+    with db.transaction(), db.cur() as c:
+        c.execute(sql_del, params)
+        c.execute(sql_ins, params)
+
+def today_stats() -> dict:
+    """Số liệu trang chủ trong 1 câu: tổng NV, đã chấm / chưa chấm / đi muộn / đã về hôm nay."""
+    row = DB().q(
+        "SELECT (SELECT COUNT(*) FROM nhanvien) AS total, "
+        "       COALESCE(SUM(so_check_in), 0) AS checked, COALESCE(SUM(so_muon), 0) AS late, "
+        "       COALESCE(SUM(so_check_out), 0) AS left_ "
+        "FROM chamcong_tonghop WHERE ngay = CURDATE()")[0]
+    total, checked = int(row["total"]), int(row["checked"])
+    return {"total": total, "checked": checked, "not_checked": max(0, total - checked),
+            "late": int(row["late"]), "checked_out": int(row["left_"])}
+
+def daily_summary(d1, d2, by_department=False):
+    """Mỗi ngày (hoặc ngày × phòng ban): số NV chấm, đi muộn, đã về, tổng giờ."""
+    dept = ", phongban" if by_department else ""
+    return DB().q(
+        f"SELECT ngay{dept}, SUM(so_check_in) AS so_check_in, SUM(so_muon) AS so_muon, "
+        f"       SUM(so_check_out) AS so_check_out, SUM(tong_giay) AS tong_giay, "
+        f"       {sql_hhmm('SUM(tong_giay)')} AS tong_gio "
+        f"FROM chamcong_tonghop WHERE ngay BETWEEN %s AND %s "
+        f"GROUP BY ngay{dept} ORDER BY ngay{dept}", (d1, d2))
+
+def department_summary(d1, d2):
+    """Mỗi phòng ban trong khoảng ngày: lượt chấm, đi muộn, tổng giờ, giờ trung bình / lượt."""
+    return DB().q(
+        "SELECT phongban, SUM(so_check_in) AS so_check_in, SUM(so_muon) AS so_muon, "
+        "       SUM(so_check_out) AS so_check_out, SUM(tong_giay) AS tong_giay, "
+        f"      {sql_hhmm('SUM(tong_giay)')} AS tong_gio, "
+        f"      {sql_hhmm('SUM(tong_giay) / NULLIF(SUM(so_check_out), 0)')} AS tb_gio "
+        "FROM chamcong_tonghop WHERE ngay BETWEEN %s AND %s "
+        "GROUP BY phongban ORDER BY phongban", (d1, d2))
+
+def employee_summary(d1, d2):
+    """
+    Mỗi nhân viên × phòng ban (theo chamcong.phongban lưu trên từng dòng, như department_summary)
+    trong khoảng ngày: số ngày công, ngày đi muộn, ngày thiếu check-out, tổng giờ.
+    Nhân viên chuyển phòng trong kỳ -> 1 dòng cho mỗi phòng.
+    """
+    return DB().q(
+        "SELECT c.ma_nv, MAX(c.ten_nv) AS ten_nv, COALESCE(c.phongban, '') AS phongban, "
+        "       SUM(c.check_in IS NOT NULL) AS so_ngay, "
+        f"      SUM({LATE_SQL}) AS so_muon, "
+        "       SUM(c.check_in IS NOT NULL AND c.check_out IS NULL) AS thieu_checkout, "
+        "       SUM(COALESCE(c.total_seconds, 0)) AS tong_giay, "
+        f"      {sql_hhmm('SUM(c.total_seconds)')} AS tong_gio "
+        "FROM chamcong c "
+        "WHERE c.ngay BETWEEN %s AND %s "
+        "GROUP BY c.ma_nv, COALESCE(c.phongban, '') ORDER BY c.ma_nv, phongban", (d1, d2))
+
+def main():
+    ap = argparse.ArgumentParser(description="Tổng hợp chấm công (tính trong MySQL)")
+    ap.add_argument("d1", nargs="?", help="từ ngày YYYY-MM-DD")
+    ap.add_argument("d2", nargs="?", help="đến ngày YYYY-MM-DD")
+    ap.add_argument("--rebuild", action="store_true", help="dựng lại bảng chamcong_tonghop (cả bảng hoặc [d1, d2])")
+    args = ap.parse_args()
+    if args.rebuild:
+        rebuild_summary(d1=args.d1, d2=args.d2)
+        print("✅ Đã dựng lại chamcong_tonghop.")
+        return
+    if not (args.d1 and args.d2):
+        print(today_stats())
+        return
+    print("Theo phòng ban:")
+    for r in department_summary(args.d1, args.d2):
+        print(f"  {r['phongban'] or '(trống)'}: {r['so_check_in']} lượt, muộn {r['so_muon']}, "
+              f"tổng {r['tong_gio']}, TB {r['tb_gio']}")
+    print("Theo nhân viên:")
+    for r in employee_summary(args.d1, args.d2):
+        print(f"  {r['ma_nv']} {r['ten_nv']}: {r['so_ngay']} ngày, muộn {r['so_muon']}, tổng {r['tong_gio']}")
+
+if __name__ == "__main__":
+    main()
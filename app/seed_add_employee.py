@@ -18,10 +18,7 @@ def main():
     chucvu = sys.argv[5] if len(sys.argv) >= 6 else "admin"
 
     db = DB()
-    db.exec(
-        "INSERT INTO nhanvien (ma_nv, ten, ngaysinh, phongban, chucvu) VALUES (%s,%s,%s,%s,%s)",
-        (ma_nv, ten, ngaysinh, phongban, chucvu),
-    )
+    db.add_employee(ma_nv, ten, ngaysinh, phongban, chucvu)
     print(f"✅ Đã thêm nhân viên: {ma_nv} - {ten}")
 
 if __name__ == "__main__":
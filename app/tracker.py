@@ -0,0 +1,85 @@
+# app/tracker.py
+# Tracker IoU nhẹ: ghép khuôn mặt giữa các lần detect để không phải encode 128-d lại
+# cho người đang đứng yên trước camera. Chỉ encode khi track mới / hết hạn xác minh.
+import itertools, threading, time
+
+def iou(a, b):
+    """IoU của 2 box (top, right, bottom, left) — cùng định dạng face_recognition."""
+    t = max(a[0], b[0]); r = min(a[1], b[1]); bt = min(a[2], b[2]); l = max(a[3], b[3])
+    inter = max(0, r - l) * max(0, bt - t)
+    if inter == 0:
+        return 0.0
+    area_a = (a[1] - a[3]) * (a[2] - a[0])
+    area_b = (b[1] - b[3]) * (b[2] - b[0])
+    return inter / float(area_a + area_b - inter)
+
+class Track:
+    __slots__ = ("tid", "box", "label", "ma_nv", "verified_at", "last_seen")
+
+    def __init__(self, tid, box, now):
+        self.tid = tid
+        self.box = box
+        self.label = None
+        self.ma_nv = ""
+        self.verified_at = None     # None = chưa encode lần nào
+        self.last_seen = now
+
+class IoUTracker:
+    """
+    update(boxes) -> (tracks, need_encode)
+      tracks[i] là track ứng với boxes[i]; need_encode là chỉ số các box cần encode lại
+      (track mới, đã quá `reverify_s` giây — hoặc `reverify_unknown_s` nếu chưa nhận ra ai).
+    set_identity(track, label, ma_nv) sau khi encode + so khớp.
+    Track không được thấy quá `max_age_s` giây sẽ bị xóa (người rời khung).
+    An toàn khi nhiều RecognitionWorker dùng chung.
+    """
+    def __init__(self, iou_thr=0.3, max_age_s=1.0, reverify_s=3.0, reverify_unknown_s=0.5):
+        self.iou_thr = iou_thr
+        self.max_age_s = max_age_s
+        self.reverify_s = reverify_s
+        self.reverify_unknown_s = reverify_unknown_s
+        self.tracks = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.encoded = 0
+        self.skipped = 0
+
+    def update(self, boxes, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self.tracks = [tr for tr in self.tracks if now - tr.last_seen <= self.max_age_s]
+            pairs = sorted(((iou(tr.box, bx), ti, bi) for ti, tr in enumerate(self.tracks)
+                            for bi, bx in enumerate(boxes)), reverse=True)
+            assigned, used = [None] * len(boxes), set()
+            for score, ti, bi in pairs:
+                if score < self.iou_thr:
+                    break
+                if ti in used or assigned[bi] is not None:
+                    continue
+                used.add(ti)
+                assigned[bi] = self.tracks[ti]
+            need = []
+            for bi, bx in enumerate(boxes):
+                tr = assigned[bi]
+                if tr is None:
+                    tr = Track(next(self._ids), bx, now)
+                    self.tracks.append(tr)
+                    assigned[bi] = tr
+                tr.box = bx
+                tr.last_seen = now
+                ttl = self.reverify_s if tr.label else self.reverify_unknown_s
+                if tr.verified_at is None or now - tr.verified_at >= ttl:
+                    need.append(bi)
+            self.encoded += len(need)
+            self.skipped += len(boxes) - len(need)
+            return assigned, need
+
+    def set_identity(self, track, label, ma_nv, now=None):
+        with self._lock:
+            track.label = label
+            track.ma_nv = ma_nv if label else ""
+            track.verified_at = time.monotonic() if now is None else now
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"tracks": len(self.tracks), "encoded": self.encoded, "skipped": self.skipped}
@@ -0,0 +1,162 @@
+# app/ui_tasks.py
+# Chạy việc nặng (truy vấn DB, chụp ảnh, encode, xuất Excel, camera) ở luồng nền để cửa sổ Tk
+# không bị treo. Tk không an toàn đa luồng -> mọi callback về giao diện được xếp hàng và chạy
+# trên luồng chính qua after().
+import itertools, os, queue, subprocess, sys, threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app.config import ROOT
+
+POLL_MS = 50
+CAMERA_KEY = "camera"    # mọi việc mở camera 0 (phiên chấm công, chụp ảnh tạm) dùng chung key này
+
+class TaskRunner:
+    """
+    submit(fn, *args, done=..., error=..., progress=..., serial=False, thread=False, key=None)
+      - fn chạy ở luồng nền; nếu có `progress` (callback, hoặc True = chỉ hiện ở thanh trạng thái)
+        thì fn nhận thêm tham số progress(text).
+      - done(result) / error(exc) / progress(text) luôn được gọi trên luồng Tk.
+      - serial=True: xếp vào làn tuần tự (encode_sync, chụp ảnh...) — không chạy chồng nhau.
+      - thread=True: chạy trên luồng riêng (việc kéo dài như phiên camera) — không giữ worker của pool.
+      - key: nếu việc cùng key còn đang chạy thì bỏ qua (chống bấm nút 2 lần), trả về False.
+    claim(key) / release(key): giữ key trong 1 phần của việc (vd phần dùng camera của việc quét mặt);
+      trong lúc giữ, submit cùng key bị từ chối như đang chạy.
+    listen(cb): cb([(tên việc, tiến độ), ...]) mỗi khi danh sách việc đang chạy thay đổi (thanh trạng thái).
+    """
+    def __init__(self, root, workers=3):
+        self.root = root
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ui-task")
+        self._serial = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ui-serial")
+        self._ui_q = queue.Queue()
+        self._lock = threading.Lock()
+        self._keys = set()
+        self.active = {}          # id -> (tên việc, dòng tiến độ gần nhất); chỉ dùng trên luồng Tk
+        self._ids = itertools.count()
+        self._listeners = []
+        self._closed = False
+        self.root.after(POLL_MS, self._pump)
+
+    def call_soon(self, fn, *args):
+        """Gọi fn(*args) trên luồng Tk (dùng được từ bất kỳ luồng nào)."""
+        self._ui_q.put((fn, args))
+
+    def ui(self, fn):
+        """Bọc callback để luồng nền gọi an toàn (vd on_success của camera)."""
+        return lambda *args: self.call_soon(fn, *args)
+
+    def listen(self, cb):
+        self._listeners.append(cb)
+
+    def unlisten(self, cb):
+        if cb in self._listeners:
+            self._listeners.remove(cb)
+
+    def submit(self, fn, *args, done=None, error=None, progress=None, serial=False, thread=False, key=None,
+               name=None):
+        with self._lock:
+            if key is not None:
+                if key in self._keys:
+                    return False
+                self._keys.add(key)
+        name = name or key or getattr(fn, "__name__", "task")
+        tid = next(self._ids)
+        self.call_soon(self._set_active, tid, name)
+
+        def report(text):
+            self.call_soon(self._on_progress, tid, progress, str(text))
+
+        def job():
+            try:
+                res = fn(*args, progress=report) if progress is not None else fn(*args)
+            except Exception as e:
+                self.call_soon(self._finish, tid, key, error or _default_error, e)
+            else:
+                self.call_soon(self._finish, tid, key, done, res)
+
+        if thread:
+            threading.Thread(target=job, daemon=True, name=f"ui-{name}").start()
+        else:
+            (self._serial if serial else self._pool).submit(job)
+        return True
+
+    def claim(self, key) -> bool:
+        with self._lock:
+            if key in self._keys:
+                return False
+            self._keys.add(key)
+            return True
+
+    def release(self, key):
+        """Trả key đã claim (gọi được từ luồng nền)."""
+        with self._lock:
+            self._keys.discard(key)
+
+    def busy(self, key) -> bool:
+        with self._lock:
+            return key in self._keys
+
+    # ---- luồng Tk ----
+    def _pump(self):
+        while True:
+            try:
+                fn, args = self._ui_q.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                fn(*args)
+            except Exception as e:   # widget đã đóng... -> không làm chết vòng bơm
+                print(f"⚠️ Lỗi callback giao diện: {e}")
+        if not self._closed:
+            self.root.after(POLL_MS, self._pump)
+
+    def _set_active(self, tid, name):
+        self.active[tid] = (name, "")
+        self._notify()
+
+    def _on_progress(self, tid, cb, text):
+        if tid in self.active:
+            self.active[tid] = (self.active[tid][0], text)
+            self._notify()
+        if callable(cb):
+            cb(text)
+
+    def _finish(self, tid, key, cb, value):
+        with self._lock:
+            self._keys.discard(key)
+        self.active.pop(tid, None)
+        self._notify()
+        if cb is not None:
+            cb(value)
+
+    def _notify(self):
+        for cb in list(self._listeners):
+            try:
+                cb(list(self.active.values()))
+            except Exception:
+                pass
+
+    def shutdown(self):
+        self._closed = True
+        self._pool.shutdown(wait=False)
+        self._serial.shutdown(wait=False)
+
+def _default_error(e):
+    print(f"⚠️ Lỗi tác vụ nền: {e}")
+
+def run_encode_sync(progress=None):
+    """Chạy `python -m app.encode_sync` ở tiến trình con, chuyển từng dòng log thành tiến độ."""
+    env = dict(os.environ, PYTHONIOENCODING="utf-8", PYTHONUNBUFFERED="1")
+    proc = subprocess.Popen([sys.executable, "-m", "app.encode_sync"], cwd=str(ROOT), env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                            text=True, encoding="utf-8", errors="replace")
+    tail = []
+    for line in proc.stdout:
+        line = line.strip()
+        if not line:
+            continue
+        tail = (tail + [line])[-5:]
+        if progress is not None:
+            progress(line)
+    rc = proc.wait()
+    if rc != 0:
+        raise RuntimeError(f"encode_sync thoát mã {rc}: " + " | ".join(tail))
@@ -2,21 +2,98 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, StringVar, filedialog, simpledialog
 from datetime import datetime, date
-import subprocess, sys
 from pathlib import Path
 import shutil
 
 import bcrypt
-import pandas as pd
-import face_recognition
+import cv2
 import numpy as np
 
 # App modules
-from app.db import DB
+from app.db import DB, employees
 from app.capture_faces import FaceCollector
 from app.attendance_cam import run_manual_attendance
 from app.config import ROOT
-from app.encoding_loaded import load_all_encodings
+from app.ui_tasks import CAMERA_KEY, TaskRunner, run_encode_sync
+from app.export_stream import export_attendance, export_report, count_rows
+from app.reports import today_stats
+from app.matcher import FaceMatcher
+from app.detectors import face_locations, face_encodings
+from app.recog_client import get_client
+
+DUP_TOL = 0.43   # ngưỡng coi là trùng mặt khi đăng ký
+CAMERA_BUSY_MSG = "Camera đang được dùng (camera chấm công hoặc chụp ảnh). Đóng camera rồi thử lại."
+
+def _find_duplicate(enc_vec):
+    """Trả về (nhãn trùng | None, có_dữ_liệu_cũ) — dùng chung FaceMatcher với màn chấm công."""
+    client = get_client()
+    if client is not None:   # service đã giữ sẵn gallery, không nạp lại kho trong UI
+        if len(client) == 0:
+            return None, False
+        label, _, _ = client.identify(enc_vec, DUP_TOL, 0.0)[0]
+        return label, True
+    matcher = FaceMatcher.from_store()
+    if len(matcher) == 0:
+        return None, False
+    label, dist = matcher.search(enc_vec, k=1)[0][0]
+    return (label if dist <= DUP_TOL else None), True
+
+def _encode_temp(path):
+    """Ảnh tạm -> (số mặt tìm thấy, danh sách encoding); detect/encode qua service nếu có cấu hình."""
+    bgr = cv2.imread(str(path))
+    if bgr is None:
+        raise ValueError(f"Không đọc được ảnh: {path}")
+    img = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+    boxes = face_locations(img, upsample=0)
+    return len(boxes), (face_encodings(img, boxes) if boxes else [])
+
+# ---- Việc nền (chạy trong TaskRunner, không đụng tới widget Tk) ----
+def _probe_temp_face():
+    """Chụp 1 ảnh tạm, encode và so trùng -> (đường dẫn, số mặt, encode được?, nhãn trùng, có dữ liệu cũ)."""
+    path = FaceCollector().collect_one_temp()
+    n_faces, enc = _encode_temp(path)
+    if not enc:
+        return path, n_faces, False, None, False
+    dup, has_data = _find_duplicate(enc[0])
+    return path, n_faces, True, dup, has_data
+
+def _next_employee_code() -> str:
+    """Sinh mã NV tự tăng (NV001, NV002...)."""
+    row = DB().q("SELECT MAX(ma_nv) AS m FROM nhanvien")
+    max_code = (row[0]["m"] if row and row[0]["m"] else None)
+    n = int(max_code[2:]) + 1 if (max_code and max_code.upper().startswith("NV")) else 1
+    return f"NV{n:03d}"
+
+def _enroll_faces(label, release_camera=None, progress=print):
+    """
+    Thu 30 ảnh cho nhãn rồi encode lại kho; trả về danh sách cảnh báo (rỗng = ổn).
+    release_camera(): trả CAMERA_KEY (đã claim lúc xếp hàng) ngay khi chụp xong, trước phần encode.
+    """
+    warnings = []
+    progress(f"Quét mặt {label}...")
+    try:
+        FaceCollector(max_images=30).collect(label)
+    except Exception as e:
+        warnings.append(f"Lỗi quét mặt: {e}")
+    finally:
+        if release_camera is not None:
+            release_camera()
+    progress("Đang encode...")
+    try:
+        run_encode_sync(progress)
+    except Exception as e:
+        warnings.append(f"Lỗi encode_sync: {e}")
+    return warnings
+
+def _warn_enroll(warnings):
+    if warnings:
+        messagebox.showwarning("Quét mặt / Encode", "\n".join(warnings))
+
+def _alive(widget) -> bool:
+    try:
+        return widget is not None and bool(widget.winfo_exists())
+    except tk.TclError:
+        return False
 
 # -------------------- Colors/Styles --------------------
 PRIMARY = "#3b82f6"
@@ -33,7 +110,9 @@ class LoginWindow(tk.Tk):
         self.geometry("460x400")
         self.configure(bg=BG)
         self.resizable(False, False)
+        self.tasks = TaskRunner(self)
         self._build_ui()
+        self.protocol("WM_DELETE_WINDOW", self._on_close)
 
     def _build_ui(self):
         frm = ttk.Frame(self, padding=18, style="Card.TFrame")
@@ -85,30 +164,35 @@ class LoginWindow(tk.Tk):
             messagebox.showwarning("Quyền", "Chỉ Admin được đăng nhập. Staff dùng nút 'Mở chấm công (Staff)'.")
             return
 
-        try:
+        def check():
             acc = DB().get_admin_by_username(user)
-        except Exception as e:
-            messagebox.showerror("DB", f"Lỗi kết nối DB: {e}")
-            return
-
-        if not acc:
-            messagebox.showerror("Sai", "Tài khoản không tồn tại")
-            return
-
-        ok = False
-        try:
-            ok = bcrypt.checkpw(pwd.encode(), acc["password_hash"].encode())
-        except Exception:
-            pass
+            if not acc:
+                return None
+            try:
+                return bcrypt.checkpw(pwd.encode(), acc["password_hash"].encode())
+            except Exception:
+                return False
+
+        def done(ok):
+            if ok is None:
+                messagebox.showerror("Sai", "Tài khoản không tồn tại")
+            elif ok:
+                Dashboard(self, role="Admin", username=user)
+                self.withdraw()
+            else:
+                messagebox.showerror("Sai", "Mật khẩu không đúng")
 
-        if ok:
-            Dashboard(self, role="Admin", username=user)
-            self.withdraw()
-        else:
-            messagebox.showerror("Sai", "Mật khẩu không đúng")
+        self.tasks.submit(check, done=done, key="login", name="Đăng nhập",
+                          error=lambda e: messagebox.showerror("DB", f"Lỗi kết nối DB: {e}"))
 
     def _open_staff_attendance(self):
-        run_manual_attendance(0)
+        if not self.tasks.submit(run_manual_attendance, 0, key=CAMERA_KEY, thread=True, name="Camera chấm công",
+                                 error=lambda e: messagebox.showerror("Camera", str(e))):
+            messagebox.showinfo("Camera", "Camera chấm công đang mở.")
+
+    def _on_close(self):
+        self.tasks.shutdown()
+        self.destroy()
 
     def _open_register(self):
         RegisterDialog(self)
@@ -121,6 +205,7 @@ class RegisterDialog(tk.Toplevel):
         self.geometry("520x520")
         self.configure(bg=BG)
         self.grab_set()
+        self.tasks = master.tasks
         self.temp_ok = False
         self.temp_path = None
         self._build()
@@ -152,40 +237,31 @@ class RegisterDialog(tk.Toplevel):
                    command=self._do_register).pack(pady=12)
 
     def _capture_temp(self):
-        try:
-            self.temp_path = FaceCollector().collect_one_temp()
-            img = face_recognition.load_image_file(self.temp_path)
-            boxes = face_recognition.face_locations(img, model="hog", number_of_times_to_upsample=0)
-            if not boxes:
-                self.temp_ok = False
-                messagebox.showerror("Ảnh", "Không tìm thấy khuôn mặt trong ảnh tạm.")
-                return
-            enc = face_recognition.face_encodings(img, boxes, num_jitters=1)
-            if not enc:
-                self.temp_ok = False
-                messagebox.showerror("Ảnh", "Không encode được khuôn mặt.")
-                return
+        self.temp_ok = False
+        if not self.tasks.submit(_probe_temp_face, done=self._on_temp_probed, key=CAMERA_KEY,
+                                 name="Chụp ảnh kiểm tra", error=lambda e: messagebox.showerror("Ảnh", str(e))):
+            messagebox.showinfo("Camera", CAMERA_BUSY_MSG)
+
+    def _on_temp_probed(self, res):
+        self.temp_path, n_faces, has_enc, dup, has_data = res
+        if not n_faces:
+            messagebox.showerror("Ảnh", "Không tìm thấy khuôn mặt trong ảnh tạm.")
+            return
+        if not has_enc:
+            messagebox.showerror("Ảnh", "Không encode được khuôn mặt.")
+            return
 
-            known_encs, labels = load_all_encodings()
-            if known_encs is None or len(known_encs) == 0:
-                self.temp_ok = True
-                messagebox.showinfo("OK", "Ảnh hợp lệ. Không thấy dữ liệu cũ để so trùng.")
-                return
+        if not has_data:
+            self.temp_ok = True
+            messagebox.showinfo("OK", "Ảnh hợp lệ. Không thấy dữ liệu cũ để so trùng.")
+            return
 
-            enc_vec = enc[0]
-            dists = np.linalg.norm(known_encs - enc_vec, axis=1)
-            idx = int(np.argmin(dists))
-            DUP_TOL = 0.43
-            if dists[idx] <= DUP_TOL:
-                self.temp_ok = False
-                messagebox.showerror("Trùng mặt",
-                    f"Khuôn mặt này trùng với: {labels[idx]}\nVui lòng dùng tài khoản đã có hoặc chụp người khác.")
-            else:
-                self.temp_ok = True
-                messagebox.showinfo("OK", "Ảnh hợp lệ, không trùng với dữ liệu hiện có.")
-        except Exception as e:
-            self.temp_ok = False
-            messagebox.showerror("Ảnh", str(e))
+        if dup:
+            messagebox.showerror("Trùng mặt",
+                f"Khuôn mặt này trùng với: {dup}\nVui lòng dùng tài khoản đã có hoặc chụp người khác.")
+        else:
+            self.temp_ok = True
+            messagebox.showinfo("OK", "Ảnh hợp lệ, không trùng với dữ liệu hiện có.")
 
     def _do_register(self):
         ten_that = self.entries["Tên thật"].get().strip()
@@ -205,16 +281,6 @@ class RegisterDialog(tk.Toplevel):
             messagebox.showerror("Bắt buộc", "Bạn phải chụp ảnh kiểm tra trùng mặt thành công trước khi tạo tài khoản.")
             return
 
-        # Sinh mã NV tự tăng
-        try:
-            row = DB().q("SELECT MAX(ma_nv) AS m FROM nhanvien")
-            max_code = (row[0]["m"] if row and row[0]["m"] else None)
-            n = int(max_code[2:]) + 1 if (max_code and max_code.upper().startswith("NV")) else 1
-            ma_nv = f"NV{n:03d}"
-        except Exception as e:
-            messagebox.showerror("DB", f"Lỗi sinh mã NV: {e}")
-            return
-
         # Parse ngày sinh
         ngaysinh = None
         if bday_txt:
@@ -224,37 +290,34 @@ class RegisterDialog(tk.Toplevel):
                 messagebox.showwarning("Ngày sinh", "Định dạng ngày sinh không hợp lệ (dd/mm/yyyy).")
                 return
 
-        # Thêm NV (vai trò admin)
-        try:
+        # Sinh mã NV + thêm NV (vai trò admin) + tạo tài khoản — ở luồng nền
+        def create():
+            ma_nv = _next_employee_code()
             DB().add_employee(ma_nv, ten_that, ngaysinh, (phongban or None), "admin")
-        except Exception as e:
-            messagebox.showerror("DB", f"Không thêm được nhân viên: {e}")
-            return
-
-        # Tạo tài khoản admin
-        hashed = bcrypt.hashpw(pw1.encode(), bcrypt.gensalt()).decode()
-        try:
+            hashed = bcrypt.hashpw(pw1.encode(), bcrypt.gensalt()).decode()
             DB().create_admin_account(ten_that, ma_nv, username, hashed)
-        except Exception as e:
+            return ma_nv
+
+        def created(ma_nv):
+            # Thu 30 ảnh + encode lại chạy nền (làn tuần tự); hộp thoại đóng ngay
+            self.tasks.submit(_enroll_faces, f"{ten_that}_{ma_nv}", release_camera, progress=True, serial=True,
+                              name=f"Quét mặt & encode {ma_nv}", done=_warn_enroll)
+            messagebox.showinfo("OK", f"Đã tạo Admin {ten_that} ({ma_nv}).\n"
+                                      "Cửa sổ quét mặt sẽ mở, encode chạy nền.")
+            self.destroy()
+
+        def failed(e):
+            release_camera()
             messagebox.showerror("DB", f"Không tạo được tài khoản admin: {e}")
-            return
 
-        # Thu 30 ảnh cho mã NV
-        try:
-            label = f"{ten_that}_{ma_nv}"
-            FaceCollector(max_images=30).collect(label)
-        except Exception as e:
-            messagebox.showwarning("Capture", f"Lỗi quét mặt: {e}")
-
-        # Encode lại
-        try:
-            encode_script = Path(__file__).resolve().parent / "encode_sync.py"
-            subprocess.run([sys.executable, str(encode_script)], check=True)
-        except Exception as e:
-            messagebox.showwarning("Encode", f"Lỗi encode_sync: {e}")
-
-        messagebox.showinfo("OK", f"Đã tạo Admin {ten_that} ({ma_nv}).")
-        self.destroy()
+        # giữ camera 0 từ lúc xếp hàng tới khi chụp xong 30 ảnh (camera chấm công / chụp ảnh tạm bị từ chối)
+        tasks = self.tasks
+        release_camera = lambda: tasks.release(CAMERA_KEY)
+        if not tasks.claim(CAMERA_KEY):
+            messagebox.showinfo("Camera", CAMERA_BUSY_MSG)
+            return
+        if not tasks.submit(create, done=created, key="register", name="Tạo Admin", error=failed):
+            release_camera()
 
 # -------------------- Dashboard --------------------
 class Dashboard(tk.Toplevel):
@@ -268,9 +331,12 @@ class Dashboard(tk.Toplevel):
 
         self.employee_list_cache = []
         self.tree_emp = None
+        self.att_tree = None
+        self.tasks = master.tasks
 
         self._build_style()
         self._build_ui()
+        self.tasks.listen(self._on_tasks_changed)
         self.show_home()
         self.protocol("WM_DELETE_WINDOW", self._on_close)
 
@@ -308,8 +374,20 @@ class Dashboard(tk.Toplevel):
         for (label, cmd) in items:
             ttk.Button(menu_bar, text=label, command=cmd, style="AccentSmall.TButton").pack(side="left", padx=6)
 
+        # Thanh trạng thái: việc nền đang chạy (encode, xuất Excel, camera...)
+        self.status_var = StringVar(value="Sẵn sàng")
+        ttk.Label(self, textvariable=self.status_var, background=BG, foreground=SUBTEXT,
+                  anchor="w").pack(side="bottom", fill="x", padx=14, pady=(0,6))
+
         self.content = ttk.Frame(self, style="Card.TFrame", padding=12)
-        self.content.pack(fill="both", expand=True, padx=12, pady=(0,12))
+        self.content.pack(fill="both", expand=True, padx=12, pady=(0,6))
+
+    def _on_tasks_changed(self, active):
+        if not active:
+            self.status_var.set("Sẵn sàng")
+            return
+        parts = [f"{name}: {text}" if text else name for name, text in active]
+        self.status_var.set("⏳ " + "  |  ".join(parts))
 
     def clear_content(self):
         for w in self.content.winfo_children():
@@ -325,34 +403,35 @@ class Dashboard(tk.Toplevel):
 
         stats_frame = ttk.Frame(card, style="Card.TFrame")
         stats_frame.pack(fill="x")
-        total_emp, checked_today, not_checked = self._fetch_today_stats()
 
-        for title, val in [
-            ("Tổng số nhân viên", str(total_emp)),
-            ("Đã chấm công hôm nay", str(checked_today)),
-            ("Chưa chấm công hôm nay", str(not_checked)),
-        ]:
+        val_labels = []
+        for title in ("Tổng số nhân viên", "Đã chấm công hôm nay", "Chưa chấm công hôm nay", "Đi muộn hôm nay"):
             box = ttk.Frame(stats_frame, style="Card.TFrame", padding=14)
             box.pack(side="left", padx=8)
             ttk.Label(box, text=title, font=("Segoe UI", 10), background=CARD).pack(anchor="w")
-            ttk.Label(box, text=val, font=("Segoe UI Semibold", 14), background=CARD).pack(anchor="w")
+            lbl = ttk.Label(box, text="…", font=("Segoe UI Semibold", 14), background=CARD)
+            lbl.pack(anchor="w")
+            val_labels.append(lbl)
+
+        def fill(stats):
+            for lbl, val in zip(val_labels, stats):
+                if _alive(lbl):
+                    lbl.config(text=str(val))
+
+        def failed(e):
+            messagebox.showerror("DB", f"Lỗi lấy thống kê: {e}")
+            fill((0, 0, 0, 0))
+
+        self.tasks.submit(self._fetch_today_stats, done=fill, error=failed, name="Thống kê hôm nay")
 
         ttk.Label(card, text="• Vào Nhân viên để thêm người và quét mặt.\n"
                              "• Vào Chấm công để mở camera (tự động IN/OUT, ESC để thoát).",
                   style="Sub.TLabel").pack(anchor="w", pady=(12,0))
 
     def _fetch_today_stats(self):
-        try:
-            db = DB()
-            total_emp = db.q("SELECT COUNT(*) AS c FROM nhanvien")[0]["c"]
-            checked_today = db.q(
-                "SELECT COUNT(DISTINCT ma_nv) AS c FROM chamcong WHERE ngay = CURDATE() AND check_in IS NOT NULL"
-            )[0]["c"]
-            not_checked = max(0, total_emp - checked_today)
-            return total_emp, checked_today, not_checked
-        except Exception as e:
-            messagebox.showerror("DB", f"Lỗi lấy thống kê: {e}")
-            return 0, 0, 0
+        """Chạy ở luồng nền (TaskRunner) — 1 câu đọc bảng tổng hợp chamcong_tonghop (app.reports)."""
+        st = today_stats()
+        return st["total"], st["checked"], st["not_checked"], st["late"]
 
     # ---------- Nhân viên ----------
     def show_employees(self):
@@ -387,13 +466,12 @@ class Dashboard(tk.Toplevel):
         self._reload_employees()
 
     def _reload_employees(self):
-        try:
-            rows = DB().list_employees()
-        except Exception as e:
-            messagebox.showerror("DB", f"Lỗi tải nhân viên: {e}")
-            return
+        self.tasks.submit(lambda: DB().list_employees(), done=self._fill_employees, key="employees",
+                          name="Tải nhân viên", error=lambda e: messagebox.showerror("DB", f"Lỗi tải nhân viên: {e}"))
+
+    def _fill_employees(self, rows):
         self.employee_list_cache = rows
-        if self.tree_emp:
+        if _alive(self.tree_emp):
             self.tree_emp.delete(*self.tree_emp.get_children())
             for r in rows:
                 ns = r["ngaysinh"].strftime("%d/%m/%Y") if r["ngaysinh"] else ""
@@ -406,7 +484,7 @@ class Dashboard(tk.Toplevel):
             self._reload_employees()
             return
         filtered = [r for r in self.employee_list_cache if r["ma_nv"].upper() == code]
-        if self.tree_emp:
+        if _alive(self.tree_emp):
             self.tree_emp.delete(*self.tree_emp.get_children())
             for r in filtered:
                 ns = r["ngaysinh"].strftime("%d/%m/%Y") if r["ngaysinh"] else ""
@@ -428,12 +506,10 @@ class Dashboard(tk.Toplevel):
         if not messagebox.askyesno("Xác nhận", f"Bạn chắc chắn muốn xóa {ten_clean} ({ma_nv})?\nHành động không thể hoàn tác."):
             return
 
-        try:
+        def delete():
             affected = DB().delete_employee(ma_nv, ten_clean)
             if affected == 0:
-                messagebox.showwarning("Không tìm thấy", "Không có nhân viên khớp Mã NV và Họ tên.")
-                return
-
+                return None
             dataset_dir = (ROOT / "dataset")
             removed_any = False
             if dataset_dir.exists():
@@ -444,20 +520,25 @@ class Dashboard(tk.Toplevel):
                             removed_any = True
                         except Exception:
                             pass
+            return removed_any
 
-            try:
-                encode_script = Path(__file__).resolve().parent / "encode_sync.py"
-                subprocess.run([sys.executable, str(encode_script)], check=True)
-            except Exception as e:
-                messagebox.showwarning("Encode", f"Đã xóa ảnh. Lỗi encode lại: {e}")
-
+        def deleted(removed_any):
+            if removed_any is None:
+                messagebox.showwarning("Không tìm thấy", "Không có nhân viên khớp Mã NV và Họ tên.")
+                return
             msg = f"Đã xóa {ten_clean} ({ma_nv})."
-            msg += "\nẢnh dataset đã xóa & encodings đã cập nhật." if removed_any else "\nKhông thấy thư mục ảnh tương ứng."
+            if removed_any:
+                # encode lại chạy nền (làn tuần tự), kiosk tự nạp lại kho khi xong
+                self.tasks.submit(run_encode_sync, progress=True, serial=True, name=f"Encode lại sau khi xóa {ma_nv}",
+                                  error=lambda e: messagebox.showwarning("Encode", f"Đã xóa ảnh. Lỗi encode lại: {e}"))
+                msg += "\nẢnh dataset đã xóa, encodings đang cập nhật nền."
+            else:
+                msg += "\nKhông thấy thư mục ảnh tương ứng."
             messagebox.showinfo("Đã xóa", msg)
             self._reload_employees()
 
-        except Exception as e:
-            messagebox.showerror("DB", f"Lỗi xóa nhân viên: {e}")
+        self.tasks.submit(delete, done=deleted, name=f"Xóa {ma_nv}",
+                          error=lambda e: messagebox.showerror("DB", f"Lỗi xóa nhân viên: {e}"))
 
     def add_employee(self):
         AddEmployeeDialog(self, on_done=self._reload_employees)
@@ -485,8 +566,7 @@ class Dashboard(tk.Toplevel):
                    ).pack(side="left")
 
         ttk.Button(topbar, text="Mở camera (Auto IN/OUT)", style="AccentSmall.TButton",
-                   command=lambda: run_manual_attendance(0, on_success=self._on_scan_success)
-                   ).pack(side="right", padx=6)
+                   command=self._open_camera).pack(side="right", padx=6)
 
         # Panel thông tin nhân viên vừa chấm
         info = ttk.LabelFrame(card, text="Thông tin nhân viên vừa chấm", padding=10)
@@ -513,21 +593,30 @@ class Dashboard(tk.Toplevel):
         # tải dữ liệu hôm nay ban đầu
         self._load_today_attendance()
 
+    def _open_camera(self):
+        # cửa sổ OpenCV chạy ở luồng nền; on_success được chuyển về luồng Tk qua TaskRunner
+        if not self.tasks.submit(run_manual_attendance, 0, self.tasks.ui(self._on_scan_success),
+                                 key=CAMERA_KEY, thread=True, name="Camera chấm công",
+                                 error=lambda e: messagebox.showerror("Camera", str(e))):
+            messagebox.showinfo("Camera", "Camera chấm công đang mở.")
+
     def _load_today_attendance(self, code_filter: str = ""):
         """Nạp bảng chấm công hôm nay (có thể lọc theo mã)."""
-        try:
+        def fetch():
             if code_filter:
-                rows = DB().q(
+                return DB().q(
                     "SELECT ma_nv, ten_nv, ngay, check_in, check_out, note "
                     "FROM chamcong WHERE ngay = CURDATE() AND ma_nv = %s ORDER BY ma_nv", (code_filter,))
-            else:
-                rows = DB().q(
-                    "SELECT ma_nv, ten_nv, ngay, check_in, check_out, note "
-                    "FROM chamcong WHERE ngay = CURDATE() ORDER BY ma_nv")
-        except Exception as e:
-            messagebox.showerror("DB", f"Lỗi tải chấm công: {e}")
-            return
+            return DB().q(
+                "SELECT ma_nv, ten_nv, ngay, check_in, check_out, note "
+                "FROM chamcong WHERE ngay = CURDATE() ORDER BY ma_nv")
+
+        self.tasks.submit(fetch, done=self._fill_today_attendance, name="Tải chấm công",
+                          error=lambda e: messagebox.showerror("DB", f"Lỗi tải chấm công: {e}"))
 
+    def _fill_today_attendance(self, rows):
+        if not _alive(self.att_tree):
+            return
         self.att_tree.delete(*self.att_tree.get_children())
         for r in rows:
             d = r["ngay"].strftime("%d/%m/%Y") if r["ngay"] else ""
@@ -541,7 +630,7 @@ class Dashboard(tk.Toplevel):
         """
         try:
             # cập nhật panel thông tin
-            emp = DB().get_employee(rec["ma_nv"]) or {}
+            emp = employees.get(rec["ma_nv"]) or {}
             self.att_lbl_name.config(text=f"Họ tên: {rec.get('ten_nv','')}")
             self.att_lbl_code.config(text=f"Mã NV: {rec.get('ma_nv','')}")
             self.att_lbl_dept.config(text=f"Phòng ban: {emp.get('phongban','') or ''}")
@@ -558,10 +647,15 @@ class Dashboard(tk.Toplevel):
         code = (self.att_code_var.get() or "").strip().upper()
         if not code:
             return
-        rec = DB().get_employee(code)
+        self.tasks.submit(lambda: DB().get_employee(code), done=self._show_att_employee, name="Tìm nhân viên",
+                          error=lambda e: messagebox.showerror("DB", str(e)))
+
+    def _show_att_employee(self, rec):
         if not rec:
             messagebox.showinfo("Tìm kiếm", "Không tìm thấy nhân viên.")
             return
+        if not _alive(self.att_lbl_name):
+            return
         self.att_lbl_name.config(text=f"Họ tên: {rec.get('ten','')}")
         self.att_lbl_code.config(text=f"Mã NV: {rec.get('ma_nv','')}")
         self.att_lbl_dept.config(text=f"Phòng ban: {rec.get('phongban','') or ''}")
@@ -579,35 +673,11 @@ class Dashboard(tk.Toplevel):
         ttk.Label(one_day, text="Ngày (YYYY-MM-DD):", background=CARD).grid(row=0, column=0, sticky="w", padx=(0,8))
         e_day = ttk.Entry(one_day, width=20); e_day.grid(row=0, column=1, sticky="w")
 
-        def _sec_to_hhmm(sec: int) -> str:
-            m, _ = divmod(int(sec), 60); h, m = divmod(m, 60); return f"{h:02d}:{m:02d}"
-
         def do_export_one_day():
             d = e_day.get().strip()
             if not d:
                 messagebox.showwarning("Thiếu", "Nhập ngày cần xuất (YYYY-MM-DD)"); return
-            try:
-                df = pd.DataFrame(DB().q(
-                    "SELECT ma_nv, ten_nv, ngay, check_in, check_out, total_seconds, note "
-                    "FROM chamcong WHERE ngay = %s ORDER BY ma_nv", (d,)
-                ))
-                if df.empty:
-                    messagebox.showinfo("Trống", f"Không có bản ghi trong ngày {d}."); return
-                if "ngay" in df.columns:
-                    df["ngay"] = pd.to_datetime(df["ngay"]).dt.strftime("%d/%m/%Y")
-                if "total_seconds" in df.columns:
-                    df["total_hhmm"] = df["total_seconds"].fillna(0).astype(int).apply(_sec_to_hhmm)
-
-                save_path = filedialog.asksaveasfilename(
-                    defaultextension=".xlsx",
-                    initialfile=f"chamcong_{d}.xlsx",
-                    filetypes=[("Excel", "*.xlsx")]
-                )
-                if not save_path: return
-                df.to_excel(save_path, index=False)
-                messagebox.showinfo("OK", f"Đã xuất: {save_path}")
-            except Exception as e:
-                messagebox.showerror("Export", str(e))
+            self._export(d, d, f"chamcong_{d}.xlsx", f"Không có bản ghi trong ngày {d}.")
 
         ttk.Button(one_day, text="Xuất 1 ngày", style="AccentSmall.TButton",
                    command=do_export_one_day).grid(row=0, column=2, padx=12)
@@ -625,35 +695,51 @@ class Dashboard(tk.Toplevel):
             d2 = e_to.get().strip()
             if not d1 or not d2:
                 messagebox.showwarning("Thiếu", "Nhập đủ khoảng thời gian (YYYY-MM-DD)"); return
-            try:
-                df = pd.DataFrame(DB().q(
-                    "SELECT ma_nv, ten_nv, ngay, check_in, check_out, total_seconds, note "
-                    "FROM chamcong WHERE ngay BETWEEN %s AND %s ORDER BY ngay, ma_nv",
-                    (d1, d2)
-                ))
-                if df.empty:
-                    messagebox.showinfo("Trống", "Không có bản ghi trong khoảng ngày đã chọn.")
-                    return
-                if "ngay" in df.columns:
-                    df["ngay"] = pd.to_datetime(df["ngay"]).dt.strftime("%d/%m/%Y")
-                if "total_seconds" in df.columns:
-                    df["total_hhmm"] = df["total_seconds"].fillna(0).astype(int).apply(_sec_to_hhmm)
-
-                save_path = filedialog.asksaveasfilename(
-                    defaultextension=".xlsx",
-                    initialfile=f"chamcong_{d1}_to_{d2}.xlsx",
-                    filetypes=[("Excel", "*.xlsx")]
-                )
-                if not save_path: return
-                df.to_excel(save_path, index=False)
-                messagebox.showinfo("OK", f"Đã xuất: {save_path}")
-            except Exception as e:
-                messagebox.showerror("Export", str(e))
+            self._export(d1, d2, f"chamcong_{d1}_to_{d2}.xlsx", "Không có bản ghi trong khoảng ngày đã chọn.")
 
         ttk.Button(rng, text="Xuất khoảng ngày", style="AccentSmall.TButton",
                    command=do_export_range).grid(row=0, column=2, rowspan=2, padx=12)
 
+        def do_export_report():
+            d1 = e_from.get().strip()
+            d2 = e_to.get().strip()
+            if not d1 or not d2:
+                messagebox.showwarning("Thiếu", "Nhập đủ khoảng thời gian (YYYY-MM-DD)"); return
+            save_path = filedialog.asksaveasfilename(
+                defaultextension=".xlsx",
+                initialfile=f"baocao_{d1}_to_{d2}.xlsx",
+                filetypes=[("Excel", "*.xlsx"), ("CSV (theo nhân viên)", "*.csv")]
+            )
+            if not save_path: return
+            self.tasks.submit(export_report, save_path, d1, d2, progress=True, key="export_report",
+                              name=f"Báo cáo {Path(save_path).name}",
+                              done=lambda n: messagebox.showinfo("OK", f"Đã xuất báo cáo ({n} dòng): {save_path}"),
+                              error=lambda e: messagebox.showerror("Báo cáo", str(e)))
+
+        ttk.Button(rng, text="Báo cáo tổng hợp", style="AccentSmall.TButton",
+                   command=do_export_report).grid(row=0, column=3, rowspan=2, padx=(0,12))
+
+    def _export(self, d1, d2, initialfile, empty_msg):
+        """Đếm dòng ở luồng nền, hỏi nơi lưu trên luồng Tk, rồi xuất dạng dòng chảy (export_stream) ở nền."""
+        def counted(total):
+            if not total:
+                messagebox.showinfo("Trống", empty_msg); return
+            save_path = filedialog.asksaveasfilename(
+                defaultextension=".xlsx",
+                initialfile=initialfile,
+                filetypes=[("Excel", "*.xlsx"), ("CSV", "*.csv")]
+            )
+            if not save_path: return
+            self.tasks.submit(export_attendance, save_path, d1, d2, progress=True, key="export_write",
+                              name=f"Xuất {Path(save_path).name}",
+                              done=lambda n: messagebox.showinfo("OK", f"Đã xuất {n} dòng: {save_path}"),
+                              error=lambda e: messagebox.showerror("Export", str(e)))
+
+        self.tasks.submit(count_rows, d1, d2, done=counted, key="export", name="Xuất Excel",
+                          error=lambda e: messagebox.showerror("Export", str(e)))
+
     def _on_close(self):
+        self.tasks.unlisten(self._on_tasks_changed)
         self.master.deiconify()
         self.destroy()
 
@@ -665,6 +751,7 @@ class AddEmployeeDialog(tk.Toplevel):
         self.geometry("520x560")
         self.configure(bg=BG)
         self.grab_set()
+        self.tasks = master.tasks
         self.on_done = on_done
         self.temp_ok = False
         self.temp_path = None
@@ -696,40 +783,31 @@ class AddEmployeeDialog(tk.Toplevel):
                    command=self._submit).pack(pady=12)
 
     def _capture_temp(self):
-        try:
-            self.temp_path = FaceCollector().collect_one_temp()
-            img = face_recognition.load_image_file(self.temp_path)
-            boxes = face_recognition.face_locations(img, model="hog", number_of_times_to_upsample=0)
-            if not boxes:
-                self.temp_ok = False
-                messagebox.showerror("Ảnh", "Không tìm thấy khuôn mặt trong ảnh tạm.")
-                return
-            enc = face_recognition.face_encodings(img, boxes, num_jitters=1)
-            if not enc:
-                self.temp_ok = False
-                messagebox.showerror("Ảnh", "Không encode được khuôn mặt.")
-                return
+        self.temp_ok = False
+        if not self.tasks.submit(_probe_temp_face, done=self._on_temp_probed, key=CAMERA_KEY,
+                                 name="Chụp ảnh kiểm tra", error=lambda e: messagebox.showerror("Ảnh", str(e))):
+            messagebox.showinfo("Camera", CAMERA_BUSY_MSG)
+
+    def _on_temp_probed(self, res):
+        self.temp_path, n_faces, has_enc, dup, has_data = res
+        if not n_faces:
+            messagebox.showerror("Ảnh", "Không tìm thấy khuôn mặt trong ảnh tạm.")
+            return
+        if not has_enc:
+            messagebox.showerror("Ảnh", "Không encode được khuôn mặt.")
+            return
 
-            known_encs, labels = load_all_encodings()
-            if known_encs is None or len(known_encs) == 0:
-                self.temp_ok = True
-                messagebox.showinfo("OK", "Ảnh hợp lệ. Không có dữ liệu cũ để so trùng.")
-                return
+        if not has_data:
+            self.temp_ok = True
+            messagebox.showinfo("OK", "Ảnh hợp lệ. Không có dữ liệu cũ để so trùng.")
+            return
 
-            enc_vec = enc[0]
-            dists = np.linalg.norm(known_encs - enc_vec, axis=1)
-            idx = int(np.argmin(dists))
-            DUP_TOL = 0.43
-            if dists[idx] <= DUP_TOL:
-                self.temp_ok = False
-                messagebox.showerror("Trùng mặt",
-                                     f"Khuôn mặt này trùng với: {labels[idx]}\nVui lòng kiểm tra lại.")
-            else:
-                self.temp_ok = True
-                messagebox.showinfo("OK", "Ảnh hợp lệ, không trùng với dữ liệu hiện có.")
-        except Exception as e:
-            self.temp_ok = False
-            messagebox.showerror("Ảnh", str(e))
+        if dup:
+            messagebox.showerror("Trùng mặt",
+                                 f"Khuôn mặt này trùng với: {dup}\nVui lòng kiểm tra lại.")
+        else:
+            self.temp_ok = True
+            messagebox.showinfo("OK", "Ảnh hợp lệ, không trùng với dữ liệu hiện có.")
 
     def _submit(self):
         if not self.temp_ok:
@@ -741,16 +819,6 @@ class AddEmployeeDialog(tk.Toplevel):
         dept = self.edept.get().strip() or "Khác"
         role = self.erole.get().strip().lower()
 
-        # Sinh mã NV tự tăng
-        try:
-            row = DB().q("SELECT MAX(ma_nv) AS m FROM nhanvien")
-            max_code = (row[0]["m"] if row and row[0]["m"] else None)
-            n = int(max_code[2:]) + 1 if (max_code and max_code.upper().startswith("NV")) else 1
-            ma = f"NV{n:03d}"
-        except Exception as e:
-            messagebox.showerror("DB", f"Lỗi sinh mã NV: {e}")
-            return
-
         ngaysinh = None
         if bday:
             try:
@@ -759,31 +827,33 @@ class AddEmployeeDialog(tk.Toplevel):
                 messagebox.showwarning("Ngày sinh", "Định dạng ngày sinh không hợp lệ (dd/mm/yyyy).")
                 return
 
-        # Lưu DB
-        try:
+        # Sinh mã NV + lưu DB ở luồng nền
+        def create():
+            ma = _next_employee_code()
             DB().add_employee(ma, ten, ngaysinh, dept, role)
-        except Exception as e:
+            return ma
+
+        def created(ma):
+            # Thu 30 ảnh + encode chạy nền (làn tuần tự) -> hộp thoại trả về ngay
+            self.tasks.submit(_enroll_faces, f"{ten}_{ma}", release_camera, progress=True, serial=True,
+                              name=f"Quét mặt & encode {ma}", done=_warn_enroll)
+            messagebox.showinfo("OK", f"Đã thêm {ten} ({ma}).\nCửa sổ quét mặt sẽ mở, encode chạy nền.")
+            if callable(self.on_done):
+                self.on_done()
+            self.destroy()
+
+        def failed(e):
+            release_camera()
             messagebox.showerror("DB", f"Không thêm được nhân viên: {e}")
-            return
-
-        # Thu 30 ảnh
-        try:
-            label = f"{ten}_{ma}"
-            FaceCollector(max_images=30).collect(label)
-        except Exception as e:
-            messagebox.showwarning("Capture", f"Lỗi quét mặt: {e}")
 
-        # Encode sync
-        try:
-            encode_script = Path(__file__).resolve().parent / "encode_sync.py"
-            subprocess.run([sys.executable, str(encode_script)], check=True)
-        except Exception as e:
-            messagebox.showwarning("Encode", f"Lỗi encode_sync: {e}")
-
-        messagebox.showinfo("OK", f"Đã thêm {ten} ({ma}).")
-        if callable(self.on_done):
-            self.on_done()
-        self.destroy()
+        # giữ camera 0 từ lúc xếp hàng tới khi chụp xong 30 ảnh (camera chấm công / chụp ảnh tạm bị từ chối)
+        tasks = self.tasks
+        release_camera = lambda: tasks.release(CAMERA_KEY)
+        if not tasks.claim(CAMERA_KEY):
+            messagebox.showinfo("Camera", CAMERA_BUSY_MSG)
+            return
+        if not tasks.submit(create, done=created, key="add_employee", name="Thêm nhân viên", error=failed):
+            release_camera()
 
 # -------------------- Run --------------------
 if __name__ == "__main__":
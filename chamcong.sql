@@ -1,10 +1,18 @@
-CREATE TABLE chamcong (
-  id INT AUTO_INCREMENT PRIMARY KEY,
-  ma_nv VARCHAR(20),
-  ngay DATE,
-  checkin_time DATETIME,
-  checkout_time DATETIME,
-  ghi_chu VARCHAR(255),
-  FOREIGN KEY (ma_nv) REFERENCES nhanvien(ma_nv)
-);
-
+-- Schema bảng chamcong (bản gốc nằm trong migrations/0001_base_schema.sql).
+-- Nên tạo / nâng cấp DB bằng: python -m app.migrate
+-- 1 dòng / (nhân viên, ngày):
+--   uq_chamcong_nv_ngay     : tra cứu khi chấm công + khóa cho INSERT ... ON DUPLICATE KEY UPDATE
+--   idx_chamcong_ngay_nv_in : quét theo ngày (thống kê hôm nay, bảng hôm nay, xuất theo khoảng ngày)
+--                             đã có sẵn ma_nv, check_in trong index -> COUNT(DISTINCT ma_nv) không đọc bảng
+CREATE TABLE IF NOT EXISTS chamcong (
+  id             INT AUTO_INCREMENT PRIMARY KEY,
+  ma_nv          VARCHAR(20)  NOT NULL,
+  ten_nv         VARCHAR(100) NULL,
+  ngay           DATE         NOT NULL,
+  check_in       TIME         NULL,
+  check_out      TIME         NULL,
+  total_seconds  INT          NULL,
+  note           VARCHAR(255) NULL,
+  UNIQUE KEY uq_chamcong_nv_ngay (ma_nv, ngay),
+  KEY idx_chamcong_ngay_nv_in (ngay, ma_nv, check_in)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
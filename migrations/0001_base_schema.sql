@@ -0,0 +1,40 @@
+-- 0001: schema thật mà code đang dùng (app/db.py, attendance_cam, ui_update).
+-- Không đặt FOREIGN KEY từ chamcong/taikhoan sang nhanvien: xóa nhân viên vẫn giữ lịch sử chấm công.
+
+CREATE TABLE IF NOT EXISTS nhanvien (
+  ma_nv     VARCHAR(20)  NOT NULL PRIMARY KEY,
+  ten       VARCHAR(100) NOT NULL,
+  ngaysinh  DATE         NULL,
+  phongban  VARCHAR(100) NULL,
+  chucvu    VARCHAR(100) NULL,
+  email     VARCHAR(100) NULL,
+  sdt       VARCHAR(15)  NULL,
+  KEY idx_nhanvien_phongban (phongban)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS taikhoan (
+  id             INT AUTO_INCREMENT PRIMARY KEY,
+  ten_that       VARCHAR(100) NULL,
+  ma_nv          VARCHAR(20)  NULL,
+  username       VARCHAR(50)  NOT NULL,
+  password_hash  VARCHAR(100) NOT NULL,
+  UNIQUE KEY uq_taikhoan_username (username),
+  KEY idx_taikhoan_ma_nv (ma_nv)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- 1 dòng / (nhân viên, ngày):
+--   uq_chamcong_nv_ngay     : tra cứu khi chấm công + khóa cho INSERT ... ON DUPLICATE KEY UPDATE
+--   idx_chamcong_ngay_nv_in : quét theo ngày (thống kê hôm nay, bảng hôm nay, xuất theo khoảng ngày)
+--                             đã có sẵn ma_nv, check_in trong index -> COUNT(DISTINCT ma_nv) không đọc bảng
+CREATE TABLE IF NOT EXISTS chamcong (
+  id             INT AUTO_INCREMENT PRIMARY KEY,
+  ma_nv          VARCHAR(20)  NOT NULL,
+  ten_nv         VARCHAR(100) NULL,
+  ngay           DATE         NOT NULL,
+  check_in       TIME         NULL,
+  check_out      TIME         NULL,
+  total_seconds  INT          NULL,
+  note           VARCHAR(255) NULL,
+  UNIQUE KEY uq_chamcong_nv_ngay (ma_nv, ngay),
+  KEY idx_chamcong_ngay_nv_in (ngay, ma_nv, check_in)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
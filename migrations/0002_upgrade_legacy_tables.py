@@ -0,0 +1,68 @@
+# 0002: nâng cấp DB tạo từ các file *.sql cũ (chamcong có checkin_time/checkout_time/ghi_chu,
+# nhanvien thiếu ngaysinh, taikhoan dùng password thay vì password_hash). 0001 dùng
+# CREATE TABLE IF NOT EXISTS nên bỏ qua các bảng cũ này. DB mới tạo từ 0001 thì bước này không làm gì.
+from app.migrate import add_column, add_index, has_column, has_index
+
+def _drop_fks_to_nhanvien(cur, table):
+    cur.execute("SELECT CONSTRAINT_NAME FROM information_schema.KEY_COLUMN_USAGE "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND REFERENCED_TABLE_NAME = 'nhanvien'",
+                (table,))
+    for (name,) in cur.fetchall():
+        cur.execute(f"ALTER TABLE {table} DROP FOREIGN KEY {name}")
+
+def _count(cur, sql):
+    cur.execute(sql)
+    return cur.fetchone()[0]
+
+def up(cur):
+    # ---- nhanvien ----
+    add_column(cur, "nhanvien", "ngaysinh", "DATE NULL AFTER ten")
+    add_index(cur, "nhanvien", "idx_nhanvien_phongban", "KEY idx_nhanvien_phongban (phongban)")
+
+    # ---- taikhoan ----
+    add_column(cur, "taikhoan", "ten_that", "VARCHAR(100) NULL")
+    add_column(cur, "taikhoan", "password_hash", "VARCHAR(100) NULL")
+    if has_column(cur, "taikhoan", "password"):
+        cur.execute("ALTER TABLE taikhoan MODIFY password VARCHAR(100) NULL")   # code không ghi cột này
+    add_index(cur, "taikhoan", "idx_taikhoan_ma_nv", "KEY idx_taikhoan_ma_nv (ma_nv)")
+    _drop_fks_to_nhanvien(cur, "taikhoan")
+
+    # ---- chamcong: cột code đang dùng ----
+    _drop_fks_to_nhanvien(cur, "chamcong")
+    add_column(cur, "chamcong", "ten_nv", "VARCHAR(100) NULL AFTER ma_nv")
+    add_column(cur, "chamcong", "check_in", "TIME NULL")
+    add_column(cur, "chamcong", "check_out", "TIME NULL")
+    add_column(cur, "chamcong", "total_seconds", "INT NULL")
+    add_column(cur, "chamcong", "note", "VARCHAR(255) NULL")
+
+    if has_column(cur, "chamcong", "checkin_time"):
+        cur.execute("UPDATE chamcong SET ngay = DATE(checkin_time) WHERE ngay IS NULL AND checkin_time IS NOT NULL")
+        cur.execute("UPDATE chamcong SET check_in = TIME(checkin_time) "
+                    "WHERE check_in IS NULL AND checkin_time IS NOT NULL")
+        cur.execute("UPDATE chamcong SET check_out = TIME(checkout_time) "
+                    "WHERE check_out IS NULL AND checkout_time IS NOT NULL")
+        cur.execute("UPDATE chamcong SET total_seconds = GREATEST(0, TIMESTAMPDIFF(SECOND, checkin_time, checkout_time)) "
+                    "WHERE total_seconds IS NULL AND checkin_time IS NOT NULL AND checkout_time IS NOT NULL")
+    if has_column(cur, "chamcong", "ghi_chu"):
+        cur.execute("UPDATE chamcong SET note = ghi_chu WHERE note IS NULL AND ghi_chu IS NOT NULL")
+    cur.execute("UPDATE chamcong c JOIN nhanvien n ON n.ma_nv = c.ma_nv SET c.ten_nv = n.ten WHERE c.ten_nv IS NULL")
+
+    # ---- chamcong: gộp dòng trùng (ma_nv, ngay) trước khi thêm UNIQUE ----
+    if not has_index(cur, "chamcong", "uq_chamcong_nv_ngay"):
+        dup = ("SELECT ma_nv, ngay, MIN(id) AS keep_id, MIN(check_in) AS ci, MAX(check_out) AS co "
+               "FROM chamcong WHERE ma_nv IS NOT NULL AND ngay IS NOT NULL "
+               "GROUP BY ma_nv, ngay HAVING COUNT(*) > 1")
+        cur.execute(f"UPDATE chamcong c JOIN ({dup}) d ON c.id = d.keep_id "
+                    "SET c.check_in = d.ci, c.check_out = d.co, "
+                    "    c.total_seconds = IF(d.ci IS NULL OR d.co IS NULL, c.total_seconds, "
+                    "                         GREATEST(0, TIME_TO_SEC(d.co) - TIME_TO_SEC(d.ci)))")
+        cur.execute(f"DELETE c FROM chamcong c JOIN ({dup}) d "
+                    "ON c.ma_nv = d.ma_nv AND c.ngay = d.ngay AND c.id <> d.keep_id")
+        cur.execute("ALTER TABLE chamcong ADD UNIQUE KEY uq_chamcong_nv_ngay (ma_nv, ngay)")
+    add_index(cur, "chamcong", "idx_chamcong_ngay_nv_in", "KEY idx_chamcong_ngay_nv_in (ngay, ma_nv, check_in)")
+
+    # NOT NULL như 0001 nếu dữ liệu cũ cho phép (dòng thiếu mã/ngày thì giữ nguyên để người quản trị xem)
+    if _count(cur, "SELECT COUNT(*) FROM chamcong WHERE ma_nv IS NULL OR ngay IS NULL") == 0:
+        cur.execute("ALTER TABLE chamcong MODIFY ma_nv VARCHAR(20) NOT NULL, MODIFY ngay DATE NOT NULL")
+    else:
+        print("⚠️ chamcong còn dòng thiếu ma_nv/ngay — giữ cột cho phép NULL.")
@@ -0,0 +1,50 @@
+# 0003: bảng tổng hợp theo (ngày, phòng ban) do trigger trên chamcong cập nhật dần.
+# Dashboard / báo cáo tháng đọc vài dòng tổng hợp thay vì quét lại chamcong.
+# Đi muộn = note bắt đầu bằng "Muộn" (attendance_cam._compute_checkin_note ghi lúc check-in).
+# Phòng ban được chép vào chamcong.phongban lúc tạo dòng (trigger BEFORE INSERT) và trigger tổng hợp
+# dùng OLD/NEW.phongban -> đổi phòng sau đó (kể cả giữa check-in và check-out) không làm lệch số liệu.
+# Số liệu lệch (sửa tay dữ liệu khi tắt trigger...) -> python -m app.reports --rebuild
+from app.migrate import add_column
+
+_ROW = ("{r}.ngay, COALESCE({r}.phongban, ''), "
+        "{sign} * ({r}.check_in IS NOT NULL), {sign} * ({r}.check_out IS NOT NULL), "
+        "{sign} * COALESCE({r}.note LIKE 'Muộn%', 0), {sign} * COALESCE({r}.total_seconds, 0)")
+
+def _apply(r, sign):
+    return ("INSERT INTO chamcong_tonghop (ngay, phongban, so_check_in, so_check_out, so_muon, tong_giay) "
+            f"VALUES ({_ROW.format(r=r, sign=sign)}) "
+            "ON DUPLICATE KEY UPDATE so_check_in = so_check_in + VALUES(so_check_in), "
+            "  so_check_out = so_check_out + VALUES(so_check_out), so_muon = so_muon + VALUES(so_muon), "
+            "  tong_giay = tong_giay + VALUES(tong_giay)")
+
+def up(cur):
+    add_column(cur, "chamcong", "phongban", "VARCHAR(100) NULL AFTER ten_nv")
+    # dòng cũ: phòng ban hiện tại là thông tin tốt nhất còn lại
+    cur.execute("UPDATE chamcong c JOIN nhanvien n ON n.ma_nv = c.ma_nv "
+                "SET c.phongban = n.phongban WHERE c.phongban IS NULL")
+
+    cur.execute(
+        "CREATE TABLE IF NOT EXISTS chamcong_tonghop ("
+        "  ngay          DATE         NOT NULL,"
+        "  phongban      VARCHAR(100) NOT NULL DEFAULT '',"
+        "  so_check_in   INT          NOT NULL DEFAULT 0,"
+        "  so_check_out  INT          NOT NULL DEFAULT 0,"
+        "  so_muon       INT          NOT NULL DEFAULT 0,"
+        "  tong_giay     BIGINT       NOT NULL DEFAULT 0,"
+        "  PRIMARY KEY (ngay, phongban)"
+        ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4")
+
+    for name in ("trg_chamcong_bi", "trg_chamcong_ai", "trg_chamcong_au", "trg_chamcong_ad"):
+        cur.execute(f"DROP TRIGGER IF EXISTS {name}")
+    cur.execute("CREATE TRIGGER trg_chamcong_bi BEFORE INSERT ON chamcong FOR EACH ROW "
+                "SET NEW.phongban = COALESCE(NEW.phongban, (SELECT phongban FROM nhanvien WHERE ma_nv = NEW.ma_nv))")
+    cur.execute(f"CREATE TRIGGER trg_chamcong_ai AFTER INSERT ON chamcong FOR EACH ROW {_apply('NEW', 1)}")
+    # ON DUPLICATE KEY UPDATE của record_attendance chạy trigger UPDATE: trừ phần cũ, cộng phần mới
+    # (OLD.phongban = NEW.phongban vì ODKU không cập nhật cột phongban)
+    cur.execute("CREATE TRIGGER trg_chamcong_au AFTER UPDATE ON chamcong FOR EACH ROW BEGIN "
+                f"{_apply('OLD', -1)}; {_apply('NEW', 1)}; END")
+    cur.execute(f"CREATE TRIGGER trg_chamcong_ad AFTER DELETE ON chamcong FOR EACH ROW {_apply('OLD', -1)}")
+
+    # dựng lại toàn bộ từ dữ liệu hiện có
+    from app.reports import rebuild_summary
+    rebuild_summary(cur)
@@ -1,8 +1,12 @@
-CREATE TABLE nhanvien (
-  ma_nv VARCHAR(20) PRIMARY KEY,
-  ten VARCHAR(100) NOT NULL,
-  phongban VARCHAR(100),
-  chucvu VARCHAR(100),
-  email VARCHAR(100),
-  sdt VARCHAR(15)
-);
+-- Schema bảng nhanvien (bản gốc nằm trong migrations/0001_base_schema.sql).
+-- Nên tạo / nâng cấp DB bằng: python -m app.migrate
+CREATE TABLE IF NOT EXISTS nhanvien (
+  ma_nv     VARCHAR(20)  NOT NULL PRIMARY KEY,
+  ten       VARCHAR(100) NOT NULL,
+  ngaysinh  DATE         NULL,
+  phongban  VARCHAR(100) NULL,
+  chucvu    VARCHAR(100) NULL,
+  email     VARCHAR(100) NULL,
+  sdt       VARCHAR(15)  NULL,
+  KEY idx_nhanvien_phongban (phongban)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
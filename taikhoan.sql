@@ -1,8 +1,11 @@
-CREATE TABLE taikhoan (
-  id INT AUTO_INCREMENT PRIMARY KEY,
-  ma_nv VARCHAR(20),
-  username VARCHAR(50) UNIQUE NOT NULL,
-  password VARCHAR(100) NOT NULL,
-  role ENUM('admin', 'user') DEFAULT 'user',
-  FOREIGN KEY (ma_nv) REFERENCES nhanvien(ma_nv)
-);
+-- Schema bảng taikhoan (bản gốc nằm trong migrations/0001_base_schema.sql).
+-- Nên tạo / nâng cấp DB bằng: python -m app.migrate
+CREATE TABLE IF NOT EXISTS taikhoan (
+  id             INT AUTO_INCREMENT PRIMARY KEY,
+  ten_that       VARCHAR(100) NULL,
+  ma_nv          VARCHAR(20)  NULL,
+  username       VARCHAR(50)  NOT NULL,
+  password_hash  VARCHAR(100) NOT NULL,
+  UNIQUE KEY uq_taikhoan_username (username),
+  KEY idx_taikhoan_ma_nv (ma_nv)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;